@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for SimpleReceiptOCR.extract_products.
+
+Compares the single-pass compiled matcher (skip-keyword regex + one alternation
+of all product patterns + dispatch table) with the previous implementation,
+which ran a 27-substring scan and then up to 20 regexes and an if/elif chain
+per line. Both must return identical products for every receipt in the corpus.
+
+The corpus is built from sample receipt lines covering every pattern, OCR-noise
+variants of them and non-product lines; pass --text-dir to use real OCR output
+(.txt files) instead.
+
+Usage:
+    python bench_ocr_matcher.py --receipts 500
+    python bench_ocr_matcher.py --text-dir /path/to/ocr_texts
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import random
+import argparse
+import statistics
+
+from ocr import SimpleReceiptOCR, Product
+
+SAMPLE_LINES = [
+    "WALMART", "Save money. Live better.", "( 555 ) 123 - 4567", "ST# 05483 OP# 009044 TE# 44 TR# 01234",
+    "E 673919 FF BS BREAST 23.99 E", "404609 ECO HALF PAN 6.49 A", "RUFFLES 002840020942 F", "E RUFFLES 002840020942 E",
+    "BAGELS 001", "GV SLIDERS", "SEA SALT POT CHP $1.29 \u00a7", "BRAIDED BRIOCHE $6.99 F", "CHEF PLATE MEAL $10 :",
+    "CHEF PLATE MEAL $10.5", "2 @ $10.00 ea $20.00 F", "Su HRO FGHTR 06305094073 6.94 T", "2 Ham Cheese 74, 000",
+    "2 MILK 3.98", "1 Woman 0", "3 EGGS ,", "MILK $1.99", "BANANAS 2.5 lb @ 0.99 2.48", "Fr3sh B@gel 1.25",
+    "MILK 2 @ $1.99 $3.98", "BREAD 2 @ $2.49 T$4.98", "Club 2 @ 1.99 3.98", "SODA 6 @ 0.50 ea now 3.00",
+    "MILK $1.99 x 2 = $3.98", "Club $1.99 x 2 = $3.98", "BREAD 2 for $2.49 $4.98", "] Coffee Latte 4,500",
+    "] Tea 12", "] Cake 1234567", "38 4.29", "SUBTOTAL 45.67", "TAX 1 7.000 % 3.20", "TOTAL 48.87",
+    "CASH TEND 50.00", "CHANGE DUE 1.13", "EFT DEBIT PAY FROM PRIMARY", "ACCOUNT # **** 1234", "REF # 123456",
+    "NETWORK ID. 0069 APPR CODE 123456", "TERMINAL # SC010175", "# ITEMS SOLD 12", "TC# 1234 5678 9012 3456",
+    "THANK YOU FOR SHOPPING", "07/14/24 14:32:05", "total 5.00", "amount", "Shop top pop 2.00", "",
+]
+
+
+def legacy_extract_products(ocr, text):
+    """SimpleReceiptOCR.extract_products before the compiled matcher (reference for equivalence)"""
+    products = []
+    lines = text.split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Skip lines that are likely not products
+        if any(skip in line.upper() for skip in ['TOTAL', 'TAX', 'SUBTOTAL', 'BALANCE', 'THANK', 'RECEIPT', 'DATE', 'TIME', 'CHANGE', 'CHECK', 'MEMBER', 'PRNTD', 'NUMBER', 'SOLD', 'WHSE', 'TRM', 'TRN', 'OP', 'NET SALES', 'TAK', 'CASH TEND', 'EFT DEBIT', 'ACCOUNT', 'REF', 'NETWORK', 'TERMINAL', 'ITEMS SOLD', 'TCR']):
+            continue
+
+        # Skip lines that are just numbers (like "38 4.29")
+        if re.match(r'^\s*\d+\s+\d+\.\d{2}\s*$', line):
+            continue
+
+        # Try each regex pattern
+        for pattern in ocr.regex_patterns:
+            match = pattern.match(line)
+            if match:
+                groups = match.groups()
+
+
+                # Pattern 1: Store product format (e.g., "E 673919 FF BS BREAST 23.99 E")
+                if len(groups) == 2 and line.startswith('E ') and line.endswith(' E'):
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 2: Product with barcode and price (e.g., "404609 ECO HALF PAN 6.49 A")
+                elif len(groups) == 2 and line[0].isdigit() and line.endswith(' A'):
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 3: Product name with barcode (e.g., "RUFFLES 002840020942 F")
+                elif len(groups) == 2 and len(groups[1]) >= 12 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    # For barcode items without price, skip
+                    continue
+
+                # Pattern 4: Product name with short code (e.g., "BAGELS 001", "GV SLIDERS")
+                elif len(groups) == 2 and len(groups[1]) <= 6 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    # For items without price, skip
+                    continue
+
+                # Pattern 5: Product name with price and suffix (e.g., "SEA SALT POT CHP $1.29 §")
+                elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 6: Product name with price and letter suffix (e.g., "BRAIDED BRIOCHE $6.99 F")
+                elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 7: Product name with price and colon (e.g., "CHEF PLATE MEAL $10 :")
+                elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 8: Quantity @ Unit Price ea Total (e.g., "2 @ $10.00 ea $20.00 F")
+                elif len(groups) == 3 and groups[0].isdigit() and '@' in line and 'ea' in line:
+                    quantity = int(groups[0])
+                    unit_price = float(groups[1])
+                    total_price = float(groups[2])
+                    product_name = f"Item {len(products) + 1}"  # Generic name
+
+                # Pattern 9: Product with barcode and price (e.g., "Su HRO FGHTR 06305094073 6.94 T")
+                elif len(groups) == 3 and len(groups[1]) >= 11 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[2])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 10/11/11b/11c: Quantity + Product Name + Price (e.g., "2 MILK 3.98", "1 Woman 0", "2 Ham Cheese 74, 000")
+                elif len(groups) == 3 and groups[0].isdigit():
+                    quantity = int(groups[0])
+                    product_name = groups[1].strip()
+                    try:
+                        total_price = float(groups[2].replace(',', '').replace(' ', ''))
+                    except ValueError:
+                        continue
+                    unit_price = total_price / quantity if quantity > 0 else total_price
+
+                # Pattern 12: Product Name + Price
+                elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 13: Product Name + Weight + @ + Unit Price + Total
+                elif len(groups) == 4 and 'lb' in line:
+                    product_name = groups[0].strip()
+                    weight = float(groups[1])
+                    unit_price = float(groups[2])
+                    total_price = float(groups[3])
+                    quantity = 1  # Treat weight as quantity for pricing
+
+                # Pattern 14: Product Name + Price (fallback)
+                elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
+                    product_name = groups[0].strip()
+                    price = float(groups[1])
+                    quantity = 1
+                    unit_price = price
+                    total_price = price
+
+                # Pattern 15: Product Name + Quantity @ Unit Price + Total
+                elif len(groups) == 4 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    quantity = int(groups[1])
+                    unit_price = float(groups[2])
+                    total_price = float(groups[3])
+
+                # Pattern 16: Product Name + Quantity @ Unit Price + Char + Total
+                elif len(groups) == 4 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    quantity = int(groups[1])
+                    unit_price = float(groups[2])
+                    total_price = float(groups[3])
+
+                # Pattern 17: Product Name + Quantity @ Unit Price + ... + Total (flexible)
+                elif len(groups) == 4 and groups[1].isdigit():
+                    product_name = groups[0].strip()
+                    quantity = int(groups[1])
+                    unit_price = float(groups[2])
+                    total_price = float(groups[3])
+
+                # Pattern 18: Product Name + Unit Price x Quantity = Total
+                elif len(groups) == 4 and 'x' in line and '=' in line:
+                    product_name = groups[0].strip()
+                    unit_price = float(groups[1])
+                    quantity = int(groups[2])
+                    total_price = float(groups[3])
+
+                # Pattern 19: Product Name + Quantity for Unit Price Total
+                elif len(groups) == 4 and 'for' in line:
+                    product_name = groups[0].strip()
+                    quantity = int(groups[1])
+                    unit_price = float(groups[2])
+                    total_price = float(groups[3])
+
+                # Pattern 20: Handle lines starting with "]" (OCR error) - treat as quantity 1
+                elif len(groups) == 2 and line.strip().startswith(']'):
+                    quantity = 1
+                    product_name = groups[0].strip()
+                    # Remove commas and spaces from price
+                    price_str = groups[1].replace(',', '').replace(' ', '')
+                    total_price = float(price_str)
+                    unit_price = total_price
+
+                else:
+                    continue
+
+                # Validate product name
+                if product_name.lower() not in ['total', 'tax', 'subtotal', 'amount'] and len(product_name.strip()) > 0:
+                    products.append(Product(
+                        name=product_name,
+                        quantity=quantity,
+                        unit_price=round(unit_price, 2),
+                        total_price=round(total_price, 2),
+                        category='Other'
+                    ))
+                break
+
+    return products
+
+
+def noisy(line, rng):
+    """An OCR-noise variant of a line: stray spaces, case changes, dropped characters"""
+    choice = rng.random()
+    if choice < 0.25:
+        return ' ' + line + ' '
+    if choice < 0.4:
+        return line.lower()
+    if choice < 0.5 and len(line) > 3:
+        i = rng.randrange(len(line))
+        return line[:i] + line[i + 1:]
+    return line
+
+
+def build_corpus(receipts, seed=0):
+    rng = random.Random(seed)
+    return ['\n'.join(noisy(rng.choice(SAMPLE_LINES), rng) for _ in range(rng.randint(15, 60)))
+            for _ in range(receipts)]
+
+
+def load_text_files(text_dir):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(text_dir, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+def time_it(extract, texts, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            extract(text)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='extract_products matcher micro-benchmark')
+    parser.add_argument('--receipts', type=int, default=500, help='Synthetic receipts to generate')
+    parser.add_argument('--text-dir', help='Directory of OCR text files to use instead of the synthetic corpus')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts = load_text_files(args.text_dir) if args.text_dir else build_corpus(args.receipts)
+    if not texts:
+        print("No receipt text to benchmark")
+        sys.exit(1)
+
+    ocr = SimpleReceiptOCR(preprocess=False)
+    mismatches = sum(ocr.extract_products(text) != legacy_extract_products(ocr, text) for text in texts)
+    lines = sum(len(text.split('\n')) for text in texts)
+    products = sum(len(ocr.extract_products(text)) for text in texts)
+
+    legacy = time_it(lambda text: legacy_extract_products(ocr, text), texts, args.repeat)
+    compiled = time_it(ocr.extract_products, texts, args.repeat)
+    print(f"{len(texts)} receipts, {lines} lines, {products} products")
+    print(f"{'matcher':<10}{'total ms':>10}{'us/line':>9}")
+    print(f"{'legacy':<10}{legacy * 1000:>10.1f}{legacy * 1e6 / lines:>9.2f}")
+    print(f"{'compiled':<10}{compiled * 1000:>10.1f}{compiled * 1e6 / lines:>9.2f}")
+    print(f"Speed-up: {legacy / compiled:.2f}x; mismatching receipts: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
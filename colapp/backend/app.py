@@ -6,41 +6,40 @@ import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="torchvision")
 warnings.filterwarnings("ignore", category=UserWarning, module="easyocr")
 
-# Import sklearn warning type
-try:
-    from sklearn.exceptions import InconsistentVersionWarning
-    warnings.filterwarnings("ignore", category=InconsistentVersionWarning, module="sklearn")
-except ImportError:
-    pass
+# sklearn's InconsistentVersionWarning, matched by message so sklearn is not imported here
+warnings.filterwarnings("ignore", message="Trying to unpickle estimator", module="sklearn")
 
 import uuid
+import base64
+import threading
+from importlib.util import find_spec
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
 from passlib.hash import pbkdf2_sha256
 from werkzeug.utils import secure_filename
-import pytesseract
-from PIL import Image
 import re
 from models import db, User, Receipt, ReceiptItem, Category
+import rollups
+from identity import identity_cache, current_user_id, user_claims
+from uploads import save_upload, format_size, UploadRejected, MAX_UPLOAD_SIZE
+from duplicates import compute_dhash, find_identical_upload, find_similar_upload
+from image_derivatives import ORIGINAL, SIZES as UPLOAD_SIZES, resolve_upload, remove_upload
+from storage import get_storage, UPLOAD_FOLDER
+from sqlalchemy import and_, or_, func, extract
+from sqlalchemy.orm import selectinload
 import json
 import io
-from redis import Redis
-from rq import Queue
-from tasks import process_receipt
 from itsdangerous import URLSafeTimedSerializer
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-# Import offline parsing components
-try:
-    from enhanced_receipt_parser import EnhancedReceiptParser
-    OFFLINE_PARSING_AVAILABLE = True
-except ImportError:
-    OFFLINE_PARSING_AVAILABLE = False
+# Offline parsing components (imported on first use: they pull in ollama, pydantic and the OCR stack)
+OFFLINE_PARSING_AVAILABLE = find_spec('enhanced_receipt_parser') is not None
+if not OFFLINE_PARSING_AVAILABLE:
     print("Warning: Offline parsing components not available")
 
 # Import BLS categories
@@ -163,9 +162,15 @@ def add_security_headers(response):
     return response
 
 # === Configure File Upload ===
-UPLOAD_FOLDER = os.path.normpath('uploads')
+# Receipt images go through get_storage() (STORAGE_BACKEND); UPLOAD_FOLDER holds the local backend's
+# files and the temporary files of the synchronous parsing endpoints
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'pdf'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Reject oversized request bodies before they are parsed (extra room for the other form fields)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + 64 * 1024
+
+# Uploaded files are immutable; let clients cache them for a year
+UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', str(365 * 24 * 3600)))
 
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -194,26 +199,120 @@ RESET_TOKEN_EXPIRY = 3600  # 1 hour
 # In-memory set to track used password reset tokens (single-process only)
 used_reset_tokens = set()
 
-# Redis connection (use Docker Compose service name)
-redis_host = os.environ.get('REDIS_HOST', 'redis')
-redis_port = int(os.environ.get('REDIS_PORT', 6379))
-redis_conn = Redis(host=redis_host, port=redis_port)
-q = Queue(connection=redis_conn)
+# === Offline Receipt Parser ===
+# Only the synchronous parsing endpoints need a parser (uploads are parsed by the workers), so it is
+# built on first use. Set OFFLINE_PARSER_PRELOAD=true to build it at startup instead.
+OFFLINE_PARSER_PRELOAD = os.environ.get('OFFLINE_PARSER_PRELOAD', 'false').lower() == 'true'
+_offline_parser_lock = threading.Lock()
+_offline_parser_initialized = False
 
-# Initialize Offline Receipt Parser
-if OFFLINE_PARSING_AVAILABLE:
-    try:
-        offline_parser = EnhancedReceiptParser()
-        print("✅ Offline receipt parser initialized")
-    except Exception as e:
-        print(f"⚠️  Failed to initialize offline parser: {e}")
-        offline_parser = None
-else:
-    offline_parser = None
+def get_offline_parser():
+    """Return the shared EnhancedReceiptParser, or None if it is unavailable"""
+    global _offline_parser_initialized
+    if not OFFLINE_PARSING_AVAILABLE:
+        return None
+    with _offline_parser_lock:
+        try:
+            from tasks import get_parser
+            parser = get_parser()
+            if not _offline_parser_initialized:
+                print("✅ Offline receipt parser initialized")
+                _offline_parser_initialized = True
+            return parser
+        except Exception as e:
+            print(f"⚠️  Failed to initialize offline parser: {e}")
+            return None
+
+if OFFLINE_PARSER_PRELOAD:
+    get_offline_parser()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_request
+def reject_oversized_body():
+    # Refuse before reading any of the body; bodies without Content-Length hit MAX_CONTENT_LENGTH while parsing
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return request_too_large(None)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": f"File too large (limit {format_size(MAX_UPLOAD_SIZE)})"}), 413
+
+# === Receipt Listing Pagination ===
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(receipt):
+    """Opaque cursor pointing just past a receipt in (created_at desc, id desc) order"""
+    raw = json.dumps([receipt.created_at.isoformat(), receipt.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, receipt_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(receipt_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def list_receipts(query, serialize):
+    """
+    Serialize a receipt query using the listing arguments of the request
+
+    Query args:
+        limit: Page size (max MAX_PAGE_SIZE). Without limit or cursor the full list is returned
+        cursor: next_cursor from the previous page
+        include_items: 'false' to leave out items
+        fields: Comma-separated receipt fields to return (id is always included)
+
+    Returns:
+        Flask JSON response with 'receipts', plus 'next_cursor' when paginating
+    """
+    include_items = request.args.get('include_items', 'true').lower() != 'false'
+    fields = request.args.get('fields')
+    fields = {field.strip() for field in fields.split(',') if field.strip()} | {'id'} if fields else None
+    if fields is not None and 'items' not in fields:
+        include_items = False
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    paginate = limit is not None or cursor is not None
+    try:
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE) if limit is not None else DEFAULT_PAGE_SIZE
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                Receipt.created_at < cursor_created_at,
+                and_(Receipt.created_at == cursor_created_at, Receipt.id < cursor_id)
+            ))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameters: {str(e)}"}), 400
+
+    query = query.order_by(Receipt.created_at.desc(), Receipt.id.desc())
+    if include_items:
+        # Load all items in one extra query instead of one query per receipt
+        query = query.options(selectinload(Receipt.items))
+    if paginate:
+        # Fetch one extra row to learn whether another page exists
+        receipts = query.limit(limit + 1).all()
+        has_more = len(receipts) > limit
+        receipts = receipts[:limit]
+    else:
+        receipts = query.all()
+
+    receipt_list = []
+    for receipt in receipts:
+        receipt_data = serialize(receipt, include_items)
+        if fields is not None:
+            receipt_data = {key: value for key, value in receipt_data.items() if key in fields}
+        receipt_list.append(receipt_data)
+
+    response = {"receipts": receipt_list}
+    if paginate:
+        response["next_cursor"] = encode_cursor(receipts[-1]) if has_more else None
+    return jsonify(response)
+
 def generate_reset_token(email):
     s = URLSafeTimedSerializer(SECRET_KEY)
     return s.dumps(email, salt='password-reset-salt')
@@ -330,17 +429,12 @@ def parse_receipt_text(text):
 def parse_receipt_with_method(image_path, method='auto'):
     """
     Parse receipt using the specified method.
-    method: 'llm', 'ocr_only', 'auto', or 'heuristic'
+    method: 'auto' (heuristic → regex → LLM), 'llm', 'regex', 'heuristic' or 'ocr_only'
     """
+    offline_parser = get_offline_parser()
     if offline_parser is None:
         return {"success": False, "error": "Offline parser not available."}
-    if method == 'llm' or method == 'auto':
-        return offline_parser.parse_receipt(image_path, method='llm')
-    elif method == 'ocr_only':
-        return offline_parser.parse_receipt(image_path, method='ocr_only')
-    else:
-        # Default to OCR-only as fallback
-        return offline_parser.parse_receipt(image_path, method='ocr_only')
+    return offline_parser.parse_receipt(image_path, method=method)
 
 # === Authentication Routes ===
 @app.route('/register', methods=['POST'])
@@ -369,7 +463,7 @@ def login():
     data = request.get_json()
     user = User.query.filter_by(email=data['email']).first()
     if user and pbkdf2_sha256.verify(data['password'], user.password_hash):
-        access_token = create_access_token(identity=user.email)
+        access_token = create_access_token(identity=user.email, additional_claims=user_claims(user))
         return jsonify(access_token=access_token)
     return jsonify({"error": "Invalid email or password"}), 401
 
@@ -486,6 +580,7 @@ def reset_password():
     # Hash new password
     hashed_password = pbkdf2_sha256.hash(new_password)
     user.password_hash = hashed_password
+    identity_cache.invalidate(user.email)
     
     # Mark token as used
     used_reset_tokens.add(token)
@@ -502,9 +597,8 @@ def reset_password():
 @jwt_required()
 def upload_receipt():
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        if not user:
+        user_id = current_user_id()
+        if user_id is None:
             return jsonify({"error": "User not found"}), 404
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
@@ -513,67 +607,93 @@ def upload_receipt():
             return jsonify({"error": "No image file selected"}), 400
         if file and allowed_file(file.filename):
             filename = f"{uuid.uuid4()}_{secure_filename(file.filename or 'receipt.jpg')}"
-            filepath = os.path.normpath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            file.save(filepath)
-            # Convert to POSIX path for Docker
-            posix_filepath = filepath.replace("\\", "/")
+            storage = get_storage()
+            filepath = storage.staging_path(filename)
+            try:
+                upload = save_upload(file, filepath)
+            except UploadRejected as e:
+                return jsonify({"error": str(e)}), e.status_code
+            # Same file already uploaded: link to it instead of re-running OCR+LLM. A photo that only looks
+            # alike (close dHash) is kept and flagged; parsing confirms or clears the flag.
+            image_dhash = compute_dhash(filepath)
+            similar = None
+            if request.form.get('allow_duplicate', 'false').lower() != 'true':
+                existing = find_identical_upload(user_id, upload.sha256)
+                if existing is not None:
+                    os.remove(filepath)
+                    return jsonify({
+                        "success": True,
+                        "receipt_id": existing.id,
+                        "duplicate": True
+                    })
+                similar = find_similar_upload(user_id, image_dhash)
+            # Workers on any node fetch the image from storage by its key (the filename)
+            storage.save(filename, filepath)
             # Create receipt record with minimal info
             receipt = Receipt(
-                user_id=user.id,
+                user_id=user_id,
                 store_name="Processing...",
                 receipt_date=datetime.now().date(),
                 total_amount=0.0,
                 image_path=filename,
                 ocr_processed=False,
-                reviewed=False
+                reviewed=False,
+                image_sha256=upload.sha256,
+                image_dhash=image_dhash
             )
+            receipt.duplicate_of_id = similar.id if similar is not None else None
             db.session.add(receipt)
+            rollups.apply_change(user_id, {}, rollups.snapshot(receipt, []))
             db.session.commit()
-            # Enqueue background job
+            # Start the background pipeline (preprocess -> ocr -> llm -> persist)
+            from tasks import start_pipeline
             parsing_method = request.form.get('parsing_method', 'auto')
-            q.enqueue(process_receipt, receipt.id, posix_filepath, parsing_method)
+            start_pipeline(receipt.id, filename, parsing_method, image_sha256=upload.sha256)
             return jsonify({
                 "success": True,
-                "receipt_id": receipt.id
+                "receipt_id": receipt.id,
+                "duplicate": False,
+                "duplicate_of_id": receipt.duplicate_of_id,
+                "status_url": f"/receipt/{receipt.id}/status",
+                "events_url": f"/receipt/{receipt.id}/events"
             })
         return jsonify({"error": "Invalid file type"}), 400
     except Exception as e:
         return jsonify({"error": f"Failed to upload receipt: {str(e)}"}), 500
 
+def serialize_receipt(receipt, include_items=True):
+    receipt_data = {
+        "id": receipt.id,
+        "store_name": receipt.store_name,
+        "receipt_date": receipt.receipt_date.strftime('%Y-%m-%d'),
+        "total_amount": float(receipt.total_amount),
+        "image_path": receipt.image_path,
+        "ocr_processed": receipt.ocr_processed,
+        "created_at": receipt.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        "duplicate_of_id": receipt.duplicate_of_id,
+        "parse_tier": receipt.parse_tier,
+    }
+    if include_items:
+        receipt_data["items"] = [
+            {
+                "id": item.id,
+                "product_name": item.product_name,
+                "price": float(item.price),
+                "category": item.category
+            } for item in receipt.items
+        ]
+    return receipt_data
+
 @app.route('/receipts', methods=['GET'])
 @jwt_required()
 def get_receipts():
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        user_id = current_user_id()
         
-        if not user:
+        if user_id is None:
             return jsonify({"error": "User not found"}), 404
         
-        receipts = Receipt.query.filter_by(user_id=user.id).order_by(Receipt.created_at.desc()).all()
-        
-        receipt_list = []
-        for receipt in receipts:
-            receipt_data = {
-                "id": receipt.id,
-                "store_name": receipt.store_name,
-                "receipt_date": receipt.receipt_date.strftime('%Y-%m-%d'),
-                "total_amount": float(receipt.total_amount),
-                "image_path": receipt.image_path,
-                "ocr_processed": receipt.ocr_processed,
-                "created_at": receipt.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                "items": [
-                    {
-                        "id": item.id,
-                        "product_name": item.product_name,
-                        "price": float(item.price),
-                        "category": item.category
-                    } for item in receipt.items
-                ]
-            }
-            receipt_list.append(receipt_data)
-        
-        return jsonify({"receipts": receipt_list})
+        return list_receipts(Receipt.query.filter_by(user_id=user_id), serialize_receipt)
         
     except Exception as e:
         return jsonify({"error": f"Failed to fetch receipts: {str(e)}"}), 500
@@ -582,81 +702,131 @@ def get_receipts():
 @jwt_required()
 def get_receipt(receipt_id):
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        user_id = current_user_id()
         
-        if not user:
+        if user_id is None:
             return jsonify({"error": "User not found"}), 404
         
-        receipt = Receipt.query.filter_by(id=receipt_id, user_id=user.id).first()
+        receipt = Receipt.query.options(selectinload(Receipt.items)).filter_by(id=receipt_id, user_id=user_id).first()
         if not receipt:
             return jsonify({"error": "Receipt not found"}), 404
         
-        receipt_data = {
-            "id": receipt.id,
-            "store_name": receipt.store_name,
-            "receipt_date": receipt.receipt_date.strftime('%Y-%m-%d'),
-            "total_amount": float(receipt.total_amount),
-            "image_path": receipt.image_path,
-            "ocr_processed": receipt.ocr_processed,
-            "created_at": receipt.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            "items": [
-                {
-                    "id": item.id,
-                    "product_name": item.product_name,
-                    "price": float(item.price),
-                    "category": item.category
-                } for item in receipt.items
-            ]
-        }
-        
-        return jsonify(receipt_data)
+        return jsonify(serialize_receipt(receipt))
         
     except Exception as e:
         return jsonify({"error": f"Failed to fetch receipt: {str(e)}"}), 500
 
 # --- Unreviewed Receipts Endpoint ---
+def serialize_unreviewed_receipt(receipt, include_items=True):
+    receipt_data = {
+        "id": receipt.id,
+        "store_name": receipt.store_name,
+        "receipt_date": receipt.receipt_date.strftime('%Y-%m-%d'),
+        "total_amount": float(receipt.total_amount),
+        "image_path": receipt.image_path,
+        "raw_text": "",  # Fill if you store OCR text
+        "duplicate_of_id": receipt.duplicate_of_id,
+        "parse_tier": receipt.parse_tier,
+    }
+    if include_items:
+        receipt_data["items"] = [
+            {
+                "product_name": item.product_name,
+                "price": float(item.price),
+                "category": item.category,
+                "quantity": item.quantity,
+            } for item in receipt.items
+        ]
+    return receipt_data
+
+def _fallback_status(receipt):
+    """Status from the database once the pipeline state has expired (or for receipts never queued)"""
+    return {
+        "receipt_id": receipt.id,
+        "stage": "saved" if receipt.ocr_processed else None,
+        "updated_at": receipt.updated_at.isoformat() + 'Z' if receipt.updated_at else None
+    }
+
+@app.route('/receipt/<int:receipt_id>/status', methods=['GET'])
+@jwt_required()
+def get_receipt_status(receipt_id):
+    """
+    Processing status of an uploaded receipt: queued, preprocess, ocr, llm, saved or failed
+
+    With ?wait=<seconds> (long-poll, at most STATUS_MAX_WAIT) the request is held until the stage
+    differs from ?since=<stage> (default: the stage at the time of the request).
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"error": "User not found"}), 404
+    receipt = Receipt.query.filter_by(id=receipt_id, user_id=user_id).first()
+    if not receipt:
+        return jsonify({"error": "Receipt not found"}), 404
+    fallback = _fallback_status(receipt)
+    # Do not hold a database connection while waiting
+    db.session.close()
+
+    import pipeline_status
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), pipeline_status.STATUS_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Invalid wait"}), 400
+    if wait:
+        since = request.args.get('since')
+        if since is None:
+            current = pipeline_status.get_status(receipt_id)
+            since = current['stage'] if current else None
+        status = pipeline_status.wait_for_change(receipt_id, since, wait)
+    else:
+        status = pipeline_status.get_status(receipt_id)
+    status = status or fallback
+    status["done"] = status["stage"] in pipeline_status.FINAL_STAGES
+    return jsonify(status)
+
+@app.route('/receipt/<int:receipt_id>/events', methods=['GET'])
+@jwt_required()
+def receipt_status_events(receipt_id):
+    """
+    Server-Sent Events stream of a receipt's stage transitions
+
+    Ends once the receipt is saved or failed, or after STATUS_STREAM_TIMEOUT seconds (the client
+    reconnects after the retry hint), so a watcher holds a server thread only briefly.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"error": "User not found"}), 404
+    receipt = Receipt.query.filter_by(id=receipt_id, user_id=user_id).first()
+    if not receipt:
+        return jsonify({"error": "Receipt not found"}), 404
+    fallback = _fallback_status(receipt)
+    db.session.close()
+
+    import pipeline_status
+    events = pipeline_status.stream_events(receipt_id, fallback)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Tell proxies (nginx) not to buffer the stream
+    })
+
 @app.route('/receipts/unreviewed', methods=['GET'])
 @jwt_required()
 def get_unreviewed_receipts():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
-    if not user:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({"error": "User not found"}), 404
-    receipts = Receipt.query.filter_by(user_id=user.id, reviewed=False).order_by(Receipt.created_at.desc()).all()
-    receipt_list = []
-    for receipt in receipts:
-        receipt_data = {
-            "id": receipt.id,
-            "store_name": receipt.store_name,
-            "receipt_date": receipt.receipt_date.strftime('%Y-%m-%d'),
-            "total_amount": float(receipt.total_amount),
-            "image_path": receipt.image_path,
-            "items": [
-                {
-                    "product_name": item.product_name,
-                    "price": float(item.price),
-                    "category": item.category,
-                    "quantity": item.quantity,
-                } for item in receipt.items
-            ],
-            "raw_text": "",  # Fill if you store OCR text
-        }
-        receipt_list.append(receipt_data)
-    return jsonify({"receipts": receipt_list})
+    return list_receipts(Receipt.query.filter_by(user_id=user_id, reviewed=False), serialize_unreviewed_receipt)
 
 # --- Manual Expense Entry Endpoint ---
 @app.route('/expense/manual', methods=['POST'])
 @jwt_required()
 def add_manual_expense():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
-    if not user:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({"error": "User not found"}), 404
     data = request.get_json()
     try:
         receipt = Receipt(
-            user_id=user.id,
+            user_id=user_id,
             store_name=data.get('store_name', 'Manual Entry'),
             receipt_date=datetime.now().date(),
             total_amount=data.get('total_amount', 0.0),
@@ -667,6 +837,7 @@ def add_manual_expense():
         db.session.add(receipt)
         db.session.flush()  # Get receipt.id
         items = data.get('items', [])
+        new_items = []
         for item in items:
             receipt_item = ReceiptItem(
                 receipt_id=receipt.id,
@@ -676,6 +847,8 @@ def add_manual_expense():
                 quantity=item.get('quantity', 1),
             )
             db.session.add(receipt_item)
+            new_items.append(receipt_item)
+        rollups.apply_change(user_id, {}, rollups.snapshot(receipt, new_items))
         db.session.commit()
         return jsonify({"success": True, "expense_id": receipt.id})
     except Exception as e:
@@ -686,15 +859,15 @@ def add_manual_expense():
 @app.route('/receipt/<int:receipt_id>', methods=['PUT'])
 @jwt_required()
 def update_receipt(receipt_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
-    if not user:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({"error": "User not found"}), 404
     data = request.get_json()
     try:
-        receipt = Receipt.query.filter_by(id=receipt_id, user_id=user.id).first()
+        receipt = Receipt.query.filter_by(id=receipt_id, user_id=user_id).first()
         if not receipt:
             return jsonify({"error": "Receipt not found"}), 404
+        before = rollups.snapshot(receipt)
         # Update receipt details
         receipt.store_name = data.get('store_name', receipt.store_name)
         receipt.total_amount = data.get('total_amount', receipt.total_amount)
@@ -704,6 +877,7 @@ def update_receipt(receipt_id):
         ReceiptItem.query.filter_by(receipt_id=receipt.id).delete()
         # Add new items
         items = data.get('items', [])
+        new_items = []
         for item in items:
             receipt_item = ReceiptItem(
                 receipt_id=receipt.id,
@@ -713,6 +887,8 @@ def update_receipt(receipt_id):
                 quantity=item.get('quantity', 1),
             )
             db.session.add(receipt_item)
+            new_items.append(receipt_item)
+        rollups.apply_change(user_id, before, rollups.snapshot(receipt, new_items))
         db.session.commit()
         return jsonify({"success": True, "message": "Receipt updated successfully"})
     except Exception as e:
@@ -723,24 +899,23 @@ def update_receipt(receipt_id):
 @jwt_required()
 def delete_receipt(receipt_id):
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        user_id = current_user_id()
         
-        if not user:
+        if user_id is None:
             return jsonify({"error": "User not found"}), 404
         
-        receipt = Receipt.query.filter_by(id=receipt_id, user_id=user.id).first()
+        receipt = Receipt.query.filter_by(id=receipt_id, user_id=user_id).first()
         if not receipt:
             return jsonify({"error": "Receipt not found"}), 404
         
-        # Delete image file
+        # Delete image file and its derivatives
         if receipt.image_path:
-            try:
-                os.remove(os.path.normpath(os.path.join(app.config['UPLOAD_FOLDER'], receipt.image_path)))
-            except:
-                pass  # File might not exist
+            remove_upload(get_storage(), receipt.image_path)
         
         # Delete receipt (items will be deleted due to cascade)
+        rollups.apply_change(user_id, rollups.snapshot(receipt), {})
+        Receipt.query.filter_by(user_id=user_id, duplicate_of_id=receipt.id).update(
+            {Receipt.duplicate_of_id: None}, synchronize_session=False)
         db.session.delete(receipt)
         db.session.commit()
         
@@ -752,58 +927,69 @@ def delete_receipt(receipt_id):
 @app.route('/uploads/<filename>')
 @jwt_required()
 def uploaded_file(filename):
-    return send_from_directory(os.path.normpath(app.config['UPLOAD_FOLDER']), filename)
+    """Serve an upload; ?size=thumb|preview|archive|original (default) picks the derivative"""
+    size = request.args.get('size', ORIGINAL)
+    if size not in UPLOAD_SIZES:
+        return jsonify({"error": f"Invalid size, expected one of: {', '.join(UPLOAD_SIZES)}"}), 400
+    # Storage keys are generated with secure_filename, so anything else cannot exist
+    if secure_filename(filename) != filename:
+        return jsonify({"error": "File not found"}), 404
+    storage = get_storage()
+    served = resolve_upload(storage, filename, size)
+    if served is None:
+        return jsonify({"error": "File not found"}), 404
+    # Upload names are unique and their content never changes, so clients may cache them for good
+    response = storage.send(served, UPLOAD_CACHE_MAX_AGE)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.cache_control.immutable = True
+    return response
 
 # === Dashboard Analytics Routes ===
+def compute_dashboard_stats(user_id):
+    """Aggregate a user's spending in the database (one GROUP BY query per breakdown)"""
+    receipt_count, total_spent = db.session.query(
+        func.count(Receipt.id), func.sum(Receipt.total_amount)
+    ).filter(Receipt.user_id == user_id).one()
+
+    # Category breakdown
+    category_rows = db.session.query(
+        ReceiptItem.category, func.sum(ReceiptItem.price)
+    ).join(Receipt, ReceiptItem.receipt_id == Receipt.id).filter(
+        Receipt.user_id == user_id
+    ).group_by(ReceiptItem.category).all()
+
+    # Monthly spending
+    year = extract('year', Receipt.receipt_date)
+    month = extract('month', Receipt.receipt_date)
+    monthly_rows = db.session.query(
+        year, month, func.sum(Receipt.total_amount)
+    ).filter(Receipt.user_id == user_id).group_by(year, month).all()
+
+    # Store breakdown
+    store_rows = db.session.query(
+        Receipt.store_name, func.sum(Receipt.total_amount)
+    ).filter(Receipt.user_id == user_id).group_by(Receipt.store_name).all()
+
+    return {
+        "total_receipts": receipt_count,
+        "total_spent": float(total_spent or 0),
+        "category_breakdown": {category: float(total) for category, total in category_rows},
+        "monthly_spending": {f"{int(y):04d}-{int(m):02d}": float(total) for y, m, total in monthly_rows},
+        "store_breakdown": {store: float(total) for store, total in store_rows}
+    }
+
 @app.route('/dashboard-stats', methods=['GET'])
 @jwt_required()
 def get_dashboard_stats():
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        user_id = current_user_id()
         
-        if not user:
+        if user_id is None:
             return jsonify({"error": "User not found"}), 404
         
-        # Get all receipts for the user
-        receipts = Receipt.query.filter_by(user_id=user.id).all()
-        
-        # Calculate statistics
-        total_receipts = len(receipts)
-        total_spent = sum(float(receipt.total_amount) for receipt in receipts)
-        
-        # Category breakdown
-        category_totals = {}
-        for receipt in receipts:
-            for item in receipt.items:
-                category = item.category
-                if category not in category_totals:
-                    category_totals[category] = 0
-                category_totals[category] += float(item.price)
-        
-        # Monthly spending
-        monthly_spending = {}
-        for receipt in receipts:
-            month_key = receipt.receipt_date.strftime('%Y-%m')
-            if month_key not in monthly_spending:
-                monthly_spending[month_key] = 0
-            monthly_spending[month_key] += float(receipt.total_amount)
-        
-        # Store breakdown
-        store_totals = {}
-        for receipt in receipts:
-            store = receipt.store_name
-            if store not in store_totals:
-                store_totals[store] = 0
-            store_totals[store] += float(receipt.total_amount)
-        
-        return jsonify({
-            "total_receipts": total_receipts,
-            "total_spent": total_spent,
-            "category_breakdown": category_totals,
-            "monthly_spending": monthly_spending,
-            "store_breakdown": store_totals
-        })
+        # Read the incrementally maintained rollups instead of scanning every receipt
+        return jsonify(rollups.dashboard_stats(user_id))
         
     except Exception as e:
         return jsonify({"error": f"Failed to fetch dashboard stats: {str(e)}"}), 500
@@ -816,27 +1002,22 @@ def ocr_receipt():
             return jsonify({'error': 'No image file provided'}), 400
         
         file = request.files['image']
-        print('Image received:', file.filename, 'size:', len(file.read()) if file else 0)
-        file.seek(0)  # Reset file pointer after reading
         
         # Save the uploaded file temporarily
         filename = f"{uuid.uuid4()}_{secure_filename(file.filename or 'receipt.jpg')}"
         filepath = os.path.normpath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        file.save(filepath)
-        
-        # Verify file was saved correctly
-        if os.path.exists(filepath):
-            file_size = os.path.getsize(filepath)
-            print(f'File saved successfully: {filepath}, size: {file_size} bytes')
-        else:
-            print(f'Failed to save file: {filepath}')
-            return jsonify({'error': 'Failed to save uploaded file'}), 500
+        try:
+            upload = save_upload(file, filepath)
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status_code
+        print(f'File saved successfully: {filepath}, size: {upload.size} bytes, type: {upload.kind}')
         
         try:
             # Always use the local LLM (offline_parser) for parsing
-            if OFFLINE_PARSING_AVAILABLE and offline_parser is not None:
+            offline_parser = get_offline_parser()
+            if offline_parser is not None:
                 print(f'Using offline parser with method: llm')
-                result = offline_parser.parse_receipt(filepath, method='llm')
+                result = offline_parser.parse_receipt(filepath, method='llm', image_digest=upload.sha256)
                 print(f'LLM result: {result.get("success", False)}')
                 return jsonify(result)
             else:
@@ -871,7 +1052,8 @@ def parse_receipt_offline():
             return jsonify({'error': 'Invalid file type'}), 400
         
         # Check if offline parsing is available
-        if not OFFLINE_PARSING_AVAILABLE or offline_parser is None:
+        offline_parser = get_offline_parser()
+        if offline_parser is None:
             return jsonify({
                 'error': 'Offline parsing not available. Please install required dependencies.'
             }), 503
@@ -879,27 +1061,32 @@ def parse_receipt_offline():
         # Save uploaded file
         filename = secure_filename(file.filename or 'receipt.jpg')
         filepath = os.path.normpath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        file.save(filepath)
+        try:
+            upload = save_upload(file, filepath)
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status_code
         
         try:
             # Parse receipt using offline parser
-            result = offline_parser.parse_receipt(filepath, method=method)
+            result = offline_parser.parse_receipt(filepath, method=method, image_digest=upload.sha256)
             
             if result['success']:
                 # Save to database
                 receipt_data = result['data']
                 receipt = Receipt(
-                    user_id=get_jwt_identity(),
+                    user_id=current_user_id(),
                     store_name=receipt_data['store_name'],
                     receipt_date=receipt_data.get('date'),
                     total_amount=receipt_data['total'],
                     image_path=filename,
-                    ocr_processed=True
+                    ocr_processed=True,
+                    image_sha256=upload.sha256
                 )
                 db.session.add(receipt)
                 db.session.commit()
                 
                 # Add items
+                new_items = []
                 for item_data in receipt_data.get('items', []):
                     item = ReceiptItem(
                         receipt_id=receipt.id,
@@ -909,7 +1096,9 @@ def parse_receipt_offline():
                         quantity=item_data.get('quantity', 1.0)
                     )
                     db.session.add(item)
+                    new_items.append(item)
                 
+                rollups.apply_change(receipt.user_id, {}, rollups.snapshot(receipt, new_items))
                 db.session.commit()
                 
                 return jsonify({
@@ -950,6 +1139,7 @@ def get_offline_parser_status():
                 'error': 'Offline parsing components not installed'
             })
         
+        offline_parser = get_offline_parser()
         if offline_parser is None:
             return jsonify({
                 'available': False,
@@ -964,6 +1154,7 @@ def get_offline_parser_status():
             'available': True,
             'methods': methods,
             'services': services,
+            'result_cache': offline_parser.get_cache_stats(),
             'recommended_method': 'llm' if methods.get('llm', {}).get('available', False) else 'ocr_only'
         })
         
@@ -1028,4 +1219,5 @@ def health_check():
     return add_cors_headers(response)
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; production runs gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true', host='0.0.0.0', port=5000)
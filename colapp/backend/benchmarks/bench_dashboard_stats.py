@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark /dashboard-stats aggregation against a large synthetic user.
+
+Seeds one user with increasing numbers of receipts (5 items each) and times
+the rollup read used by the endpoint (rollups.dashboard_stats), the SQL
+GROUP BY scan (compute_dashboard_stats) and the original approach of loading
+every receipt and item into Python. All results are compared to make sure the
+breakdowns match.
+
+Uses an in-memory SQLite database unless BENCH_DATABASE_URI points elsewhere,
+e.g. a scratch PostgreSQL database (its tables are dropped and recreated).
+
+Usage:
+    python benchmarks/bench_dashboard_stats.py --sizes 1000 5000 20000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Must be set before app is imported
+os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('RESULT_CACHE_BACKEND', 'off')
+
+import rollups
+from app import app, db, compute_dashboard_stats
+from models import User, Receipt, ReceiptItem
+
+ITEMS_PER_RECEIPT = 5
+STORES = ['Walmart', 'Target', 'Kroger', 'Costco', 'Aldi', 'Safeway', 'CVS', 'Walgreens']
+CATEGORIES = ['Dairy', 'Bakery', 'Produce', 'Meat', 'Frozen Foods', 'Beverages', 'Snacks', 'Household']
+
+
+def seed(receipt_count):
+    """Create one user with receipt_count receipts using bulk inserts"""
+    db.drop_all()
+    db.create_all()
+    user = User(email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    receipts = [{
+        'id': i + 1, 'user_id': user.id, 'store_name': rng.choice(STORES),
+        'receipt_date': date(2020 + i % 5, 1 + i % 12, 1 + i % 28),
+        'total_amount': round(rng.uniform(5, 200), 2), 'image_path': f'uploads/{i}.jpg',
+        'ocr_processed': True, 'reviewed': True, 'created_at': now, 'updated_at': now
+    } for i in range(receipt_count)]
+    db.session.execute(Receipt.__table__.insert(), receipts)
+    items = [{
+        'receipt_id': receipt['id'], 'product_name': f'Item {j}', 'price': round(rng.uniform(0.5, 40), 2),
+        'category': rng.choice(CATEGORIES), 'quantity': 1, 'created_at': now
+    } for receipt in receipts for j in range(ITEMS_PER_RECEIPT)]
+    db.session.execute(ReceiptItem.__table__.insert(), items)
+    db.session.commit()
+    rollups.rebuild(user.id)
+    return user.id
+
+
+def python_dashboard_stats(user_id):
+    """The previous implementation: load everything, then four passes in Python"""
+    receipts = Receipt.query.filter_by(user_id=user_id).all()
+    category_totals, monthly_spending, store_totals = {}, {}, {}
+    for receipt in receipts:
+        for item in receipt.items:
+            category_totals[item.category] = category_totals.get(item.category, 0) + float(item.price)
+        month_key = receipt.receipt_date.strftime('%Y-%m')
+        monthly_spending[month_key] = monthly_spending.get(month_key, 0) + float(receipt.total_amount)
+        store_totals[receipt.store_name] = store_totals.get(receipt.store_name, 0) + float(receipt.total_amount)
+    return {
+        "total_receipts": len(receipts),
+        "total_spent": sum(float(receipt.total_amount) for receipt in receipts),
+        "category_breakdown": category_totals,
+        "monthly_spending": monthly_spending,
+        "store_breakdown": store_totals
+    }
+
+
+def same_stats(a, b):
+    if a['total_receipts'] != b['total_receipts'] or abs(a['total_spent'] - b['total_spent']) > 0.01:
+        return False
+    for key in ('category_breakdown', 'monthly_spending', 'store_breakdown'):
+        if set(a[key]) != set(b[key]) or any(abs(a[key][k] - b[key][k]) > 0.01 for k in a[key]):
+            return False
+    return True
+
+
+def timed(func, user_id, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        result = func(user_id)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard stats aggregation benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000], help='Receipts per run')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'receipts':>8} {'items':>8} {'python ms':>10} {'sql ms':>8} {'rollup ms':>10} {'match':>6}")
+    with app.app_context():
+        for size in args.sizes:
+            user_id = seed(size)
+            python_ms, python_result = timed(python_dashboard_stats, user_id, args.repeat)
+            sql_ms, sql_result = timed(compute_dashboard_stats, user_id, args.repeat)
+            rollup_ms, rollup_result = timed(rollups.dashboard_stats, user_id, args.repeat)
+            match = same_stats(python_result, sql_result) and same_stats(python_result, rollup_result)
+            print(f"{size:>8} {size * ITEMS_PER_RECEIPT:>8} {python_ms:>10.1f} {sql_ms:>8.1f} {rollup_ms:>10.1f} {str(match):>6}")
+            if not match:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the API process: time and memory to `import app`.
+
+Each run is a fresh interpreter started with `python -X importtime`. Two modes
+are compared:
+
+    lazy   - the default: parser, OCR stack, RQ tasks and boto3 load on first use
+    eager  - what the API used to do at import: also import tasks, pytesseract,
+             enhanced_receipt_parser and boto3, and build the offline parser
+             (OFFLINE_PARSER_PRELOAD=true, which includes the Ollama model check)
+
+Reports the median wall time of the import, peak RSS, and the slowest
+top-level imports of the last lazy run.
+
+Usage:
+    python benchmarks/bench_import_time.py --runs 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = r"""
+import time, resource, json, sys
+started = time.perf_counter()
+if sys.argv[1] == 'eager':
+    import tasks, pytesseract, enhanced_receipt_parser, boto3
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def run_once(mode):
+    env = dict(os.environ)
+    env.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    env.setdefault('RESULT_CACHE_BACKEND', 'off')
+    env['OFFLINE_PARSER_PRELOAD'] = 'true' if mode == 'eager' else 'false'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, mode], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    return stats, result.stderr
+
+
+def slowest_imports(importtime_log, count):
+    """Top-level (directly imported by app) modules by cumulative import time"""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('   ') and not name.startswith('    '):  # children of app
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API cold-start import time and RSS, lazy vs eager imports')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    args = parser.parse_args()
+
+    results = {}
+    last_log = ''
+    for mode in ('eager', 'lazy'):
+        samples = []
+        for _ in range(args.runs):
+            stats, last_log = run_once(mode)
+            samples.append(stats)
+        results[mode] = samples
+
+    print(f"import app, {args.runs} fresh interpreters per mode")
+    print(f"{'mode':<8}{'median s':>10}{'min s':>10}{'peak RSS MB':>14}")
+    for mode, samples in results.items():
+        seconds = [s['seconds'] for s in samples]
+        rss = statistics.median(s['rss_kb'] for s in samples) / 1024
+        print(f"{mode:<8}{statistics.median(seconds):>10.3f}{min(seconds):>10.3f}{rss:>14.1f}")
+
+    print(f"\nSlowest imports by app (lazy, microseconds cumulative):")
+    for cumulative, name in slowest_imports(last_log, args.top):
+        print(f"  {cumulative:>9}  {name}")
+
+
+if __name__ == '__main__':
+    main()
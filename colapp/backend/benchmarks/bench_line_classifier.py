@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measure how much of each receipt the line pre-parser reads without the LLM.
+
+For every receipt text (OCR of the sample images in uploads/, or .txt files
+from --text-dir) reports the lines accepted, the lines still sent to the LLM,
+the prompt characters saved, and whether the LLM is skipped altogether.
+Pre-parsing time per receipt is included. Does not need Ollama.
+
+Usage:
+    python benchmarks/bench_line_classifier.py --receipts 16
+    python benchmarks/bench_line_classifier.py --text-dir /path/to/ocr_texts
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from line_classifier import pre_parse
+
+
+def load_text_files(text_dir):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(text_dir, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            texts.append((os.path.basename(path), f.read()))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Line pre-parser coverage benchmark')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--text-dir', help='Directory of OCR text files to use instead of OCR-ing uploads/')
+    parser.add_argument('--receipts', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.text_dir:
+        texts = load_text_files(args.text_dir)[:args.receipts]
+    else:
+        from bench_llm_batching import load_texts
+        texts = [(f"receipt {i + 1}", text) for i, text in enumerate(load_texts(args.uploads, args.receipts))]
+    if not texts:
+        print("No receipt text to classify")
+        sys.exit(1)
+
+    print(f"{'receipt':<24}{'lines':>6}{'items':>6}{'to LLM':>7}{'chars':>7}{'sent':>6}{'skip LLM':>9}{'ms':>7}")
+    skipped = 0
+    full_chars = sent_chars = 0
+    for name, text in texts:
+        start = time.perf_counter()
+        pre = pre_parse(text)
+        elapsed = (time.perf_counter() - start) * 1000
+        complete = pre.complete
+        # The LLM reads the whole receipt when nothing was accepted
+        sent = 0 if complete else len(pre.llm_text() if pre.items else text)
+        skipped += complete
+        full_chars += len(text)
+        sent_chars += sent
+        stats = pre.stats()
+        print(f"{name[:23]:<24}{stats['lines']:>6}{stats['items_accepted']:>6}{stats['lines_for_llm']:>7}"
+              f"{len(text):>7}{sent:>6}{'yes' if complete else 'no':>9}{elapsed:>7.2f}")
+
+    print(f"\nLLM skipped for {skipped}/{len(texts)} receipts; "
+          f"prompt text {sent_chars}/{full_chars} characters ({sent_chars / max(full_chars, 1):.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark LLM receipt parsing throughput against batch size.
+
+OCRs the sample receipts in uploads/ once, then parses the texts with
+OfflineLLMService.parse_receipt_texts in batches of each requested size and
+reports receipts per minute. Requires a running Ollama server; start it with
+OLLAMA_NUM_PARALLEL >= the largest batch size so requests are served concurrently.
+
+Usage:
+    python benchmarks/bench_llm_batching.py --host http://localhost:11434 --sizes 1 2 4 8
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ocr_service import OCRService
+from offline_llm_service import OfflineLLMService
+
+
+def load_texts(upload_dir, limit):
+    """OCR the sample images once so only LLM time is measured"""
+    ocr = OCRService()
+    texts = []
+    for path in sorted(glob.glob(os.path.join(upload_dir, '*.jpg')))[:limit]:
+        result = ocr.extract_text(path)
+        if result.get('success') and result['text'].strip():
+            texts.append(result['text'])
+    return texts
+
+
+def run(service, texts, batch_size):
+    start = time.perf_counter()
+    failures = 0
+    for offset in range(0, len(texts), batch_size):
+        chunk = {i: text for i, text in enumerate(texts[offset:offset + batch_size], start=offset)}
+        results = service.parse_receipt_texts(chunk)
+        # Demultiplexing check: every receipt ID comes back exactly once
+        assert set(results) == set(chunk)
+        failures += sum(1 for r in results.values() if not r.get('success') or r.get('degraded'))
+    elapsed = time.perf_counter() - start
+    return elapsed, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LLM batching throughput benchmark')
+    parser.add_argument('--host', default=os.environ.get('OLLAMA_HOST', 'http://localhost:11434'))
+    parser.add_argument('--model', default='qwen2.5:0.5b')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--receipts', type=int, default=16, help='Number of receipts to parse per batch size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    texts = load_texts(args.uploads, args.receipts)
+    if not texts:
+        print(f"No OCR text extracted from {args.uploads}")
+        sys.exit(1)
+    # Repeat samples to reach the requested receipt count
+    texts = (texts * (args.receipts // len(texts) + 1))[:args.receipts]
+
+    service = OfflineLLMService(model_name=args.model, host=args.host)
+    service.parse_receipt_text(texts[0])  # warm-up: load the model into memory
+
+    print(f"{'batch':>5} {'receipts':>8} {'seconds':>8} {'receipts/min':>12} {'failed':>6}")
+    for size in args.sizes:
+        elapsed, failures = run(service, texts, size)
+        print(f"{size:>5} {len(texts):>8} {elapsed:>8.1f} {len(texts) / elapsed * 60:>12.1f} {failures:>6}")
+
+
+if __name__ == '__main__':
+    main()
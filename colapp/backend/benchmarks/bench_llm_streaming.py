@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark streamed LLM parsing (stop at the end of the JSON object) against
+waiting for the full completion.
+
+OCRs the sample receipts in uploads/ once, then parses each text with
+OfflineLLMService.parse_receipt_text with LLM_STREAM off and on. Reports the
+median and total parse time per mode and how many receipts fell back to the
+regex parser because the stream was malformed. Requires a running Ollama server.
+
+Usage:
+    python benchmarks/bench_llm_streaming.py --host http://localhost:11434 --receipts 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import offline_llm_service
+from offline_llm_service import OfflineLLMService
+from bench_llm_batching import load_texts
+
+
+def run(service, texts, stream):
+    offline_llm_service.LLM_STREAM = stream
+    timings = []
+    fallbacks = 0
+    for text in texts:
+        start = time.perf_counter()
+        result = service.parse_receipt_text(text)
+        timings.append(time.perf_counter() - start)
+        fallbacks += result.get('method') == 'fallback_regex'
+    return timings, fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streamed vs full-completion LLM parsing benchmark')
+    parser.add_argument('--host', default=os.environ.get('OLLAMA_HOST', 'http://localhost:11434'))
+    parser.add_argument('--model', default='qwen2.5:0.5b')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--receipts', type=int, default=8)
+    args = parser.parse_args()
+
+    texts = load_texts(args.uploads, args.receipts)
+    if not texts:
+        print(f"No OCR text extracted from {args.uploads}")
+        sys.exit(1)
+
+    service = OfflineLLMService(model_name=args.model, host=args.host)
+    service.parse_receipt_text(texts[0])  # warm-up: load the model into memory
+
+    print(f"{'mode':<8} {'receipts':>8} {'median s':>9} {'total s':>8} {'fallbacks':>9}")
+    for name, stream in (('full', False), ('stream', True)):
+        timings, fallbacks = run(service, texts, stream)
+        print(f"{name:<8} {len(texts):>8} {statistics.median(timings):>9.2f} {sum(timings):>8.1f} {fallbacks:>9}")
+
+
+if __name__ == '__main__':
+    main()
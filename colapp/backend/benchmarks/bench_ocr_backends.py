@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark OCR throughput of the pytesseract and tesserocr backends.
+
+pytesseract starts a tesseract process (and writes temp files) for every image;
+the tesserocr backend reuses a pool of warm engines fed from memory. Both are
+driven with the same number of concurrent threads over the preprocessed sample
+receipts in uploads/, and images per second are reported.
+
+Usage:
+    python benchmarks/bench_ocr_backends.py --receipts 32 --threads 4
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image
+from image_preprocessing import ImagePreprocessor
+from ocr_service import OCRService
+from tesseract_pool import TESSEROCR_AVAILABLE
+
+
+def load_images(upload_dir, limit):
+    """Preprocess the sample images once so only OCR time is measured"""
+    preprocessor = ImagePreprocessor()
+    images = []
+    for path in sorted(glob.glob(os.path.join(upload_dir, '*.jpg'))):
+        image, _ = preprocessor.process(Image.open(path))
+        image.load()
+        images.append(image)
+    # Repeat samples to reach the requested image count
+    return (images * (limit // max(len(images), 1) + 1))[:limit]
+
+
+def run(service, images, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        chars = sum(len(text) for text in executor.map(service.image_to_string, images))
+    return time.perf_counter() - start, chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR backend throughput benchmark')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--receipts', type=int, default=32, help='Number of images to OCR per backend')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--tesseract-config', default=os.environ.get('TESSERACT_CONFIG', ''))
+    args = parser.parse_args()
+
+    images = load_images(args.uploads, args.receipts)
+    if not images:
+        print(f"No sample images found in {args.uploads}")
+        sys.exit(1)
+
+    backends = ['pytesseract'] + (['tesserocr'] if TESSEROCR_AVAILABLE else [])
+    if not TESSEROCR_AVAILABLE:
+        print("tesserocr is not installed; only the pytesseract backend is measured")
+
+    print(f"{len(images)} images, {args.threads} threads")
+    print(f"{'backend':<12} {'seconds':>8} {'images/s':>9} {'chars':>8}")
+    for backend in backends:
+        service = OCRService(tesseract_config=args.tesseract_config, backend=backend)
+        service.image_to_string(images[0])  # warm-up: first engine load is not steady state
+        elapsed, chars = run(service, images, args.threads)
+        print(f"{backend:<12} {elapsed:>8.1f} {len(images) / elapsed:>9.2f} {chars:>8}")
+
+
+if __name__ == '__main__':
+    main()
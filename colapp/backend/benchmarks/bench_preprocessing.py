@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark image preprocessing before Tesseract.
+
+Runs OCR over the sample receipts in uploads/ with preprocessing disabled, with
+all stages enabled, and with all stages except one (to show what each stage is
+worth). Reports mean per-stage and Tesseract latency, plus two text-quality
+proxies: mean Tesseract word confidence and the number of price tokens found.
+
+Usage:
+    python benchmarks/bench_preprocessing.py --uploads uploads --receipts 16
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pytesseract
+from PIL import Image
+from image_preprocessing import ALL_STAGES, ImagePreprocessor
+
+PRICE_PATTERN = re.compile(r'\$?\d+\.\d{2}\b')
+
+
+def configurations():
+    configs = [('none', ()), ('all', ALL_STAGES)]
+    for stage in ALL_STAGES:
+        configs.append((f"all-{stage}", tuple(s for s in ALL_STAGES if s != stage)))
+    return configs
+
+
+def run(paths, stages, tesseract_config):
+    preprocessor = ImagePreprocessor(stages=stages)
+    timings = defaultdict(float)
+    confidences = []
+    prices = 0
+    for path in paths:
+        image, stage_timings = preprocessor.process(Image.open(path))
+        for stage, ms in stage_timings.items():
+            timings[stage] += ms
+
+        start = time.perf_counter()
+        data = pytesseract.image_to_data(image, config=tesseract_config, output_type=pytesseract.Output.DICT)
+        timings['tesseract'] += (time.perf_counter() - start) * 1000
+
+        # conf is -1 for layout boxes that hold no word
+        recognized = [(w, float(c)) for w, c in zip(data['text'], data['conf']) if w.strip() and float(c) >= 0]
+        confidences.extend(c for _, c in recognized)
+        prices += len(PRICE_PATTERN.findall(' '.join(w for w, _ in recognized)))
+
+    count = float(len(paths))
+    mean_timings = {stage: ms / count for stage, ms in timings.items()}
+    mean_conf = sum(confidences) / len(confidences) if confidences else 0.0
+    return mean_timings, mean_conf, prices / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR preprocessing latency/quality benchmark')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--receipts', type=int, default=16, help='Number of sample images to use')
+    parser.add_argument('--tesseract-config', default=os.environ.get('TESSERACT_CONFIG', ''))
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.uploads, '*.jpg')))[:args.receipts]
+    if not paths:
+        print(f"No sample images found in {args.uploads}")
+        sys.exit(1)
+
+    print(f"{len(paths)} images, mean per image")
+    header = f"{'config':<16} {'prep ms':>8} {'ocr ms':>8} {'total ms':>9} {'conf':>6} {'prices':>7}"
+    print(header)
+    stage_rows = []
+    for name, stages in configurations():
+        timings, conf, prices = run(paths, stages, args.tesseract_config)
+        prep_ms = sum(ms for stage, ms in timings.items() if stage != 'tesseract')
+        print(f"{name:<16} {prep_ms:>8.0f} {timings['tesseract']:>8.0f} "
+              f"{prep_ms + timings['tesseract']:>9.0f} {conf:>6.1f} {prices:>7.1f}")
+        if name == 'all':
+            stage_rows = [(stage, timings.get(stage, 0.0)) for stage in ALL_STAGES]
+
+    print("\nPer-stage latency with all stages enabled:")
+    for stage, ms in stage_rows:
+        print(f"  {stage:<10} {ms:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the LLM prompt layout: prompt-eval tokens and time to first token.
+
+Compares the old layout (instructions and receipt concatenated into one user
+message) with the current one (stable system message + receipt-only user
+message, short category codes, pinned keep_alive). Ollama reuses the KV cache
+of a prompt prefix it has already evaluated, so with the stable system message
+only the receipt tokens are evaluated after the first request.
+
+Each receipt is sent once per layout with a small num_predict. Ollama's
+prompt_eval_count / prompt_eval_duration come from the final stream chunk.
+Requires a running Ollama server.
+
+Usage:
+    python benchmarks/bench_prompt_cache.py --host http://localhost:11434 --receipts 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from offline_llm_service import OfflineLLMService, LLM_NUM_PREDICT
+from bench_llm_batching import load_texts
+
+# The system prompt before the layout change (sent inside the user message)
+LEGACY_SYSTEM_PROMPT = """You are a receipt parsing assistant. Extract products and information from receipts.
+
+IMPORTANT: You MUST respond with valid JSON. Do not include any other text.
+
+RULES:
+1. Find ONLY real product names from receipt (skip totals, taxes, discounts)
+2. Use 0.0 for missing prices, 1.0 for missing quantities
+3. Convert prices to numbers (remove $)
+4. Extract store name from first line
+5. Look for lines with prices at the end (like "PRODUCT 12.99")
+6. Skip lines that are clearly not products (TOTAL, TAX, CHANGE, etc.)
+7. Use these BLS categories:
+   - Food and Beverages > Food at home > Cereals and bakery products
+   - Food and Beverages > Food at home > Meats poultry fish and eggs
+   - Food and Beverages > Food at home > Dairy and related products
+   - Food and Beverages > Food at home > Fruits and vegetables
+   - Food and Beverages > Food at home > Nonalcoholic beverages and beverage materials
+   - Food and Beverages > Food at home > Other food at home
+   - Food and Beverages > Food away from home > Full service meals and snacks
+   - Food and Beverages > Food away from home > Limited service meals and snacks
+   - Housing > Household furnishings and operations > Housekeeping supplies
+   - Apparel > Mens and boys apparel
+   - Apparel > Womens and girls apparel
+   - Apparel > Footwear
+   - Transportation > Private transportation > Motor fuel
+   - Medical Care > Medical care commodities > Medicinal drugs
+   - Recreation > Pets pet products and services
+   - Other Goods and Services > Personal care > Personal care services
+
+RESPOND WITH THIS JSON FORMAT:
+{
+  "store_name": "store name",
+  "items": [
+    {
+      "name": "product name",
+      "quantity": 1.0,
+      "unit_price": price,
+      "total_price": price,
+      "category": "BLS category path"
+    }
+  ],
+  "total": total_amount
+}"""
+
+
+def legacy_messages(service, cleaned_text):
+    prompt = f"""Parse this receipt and extract all products:
+
+{cleaned_text}
+
+You must respond with valid JSON containing the store name, all products found, and total amount."""
+    return [{"role": "user", "content": f"{LEGACY_SYSTEM_PROMPT}\n\n{prompt}"}]
+
+
+def measure(service, messages, num_predict, legacy):
+    """Stream one request; returns (time to first token in s, prompt_eval_count, prompt_eval ms)"""
+    options = {"temperature": 0.0, "top_p": 0.9, "num_predict": num_predict, "num_ctx": 4096, "repeat_penalty": 1.0}
+    kwargs = {} if legacy else service._format_kwargs()
+    start = time.perf_counter()
+    first_token = None
+    final = None
+    for chunk in service.client.chat(model=service.model_name, messages=messages, options=options, stream=True, **kwargs):
+        if first_token is None and chunk['message']['content']:
+            first_token = time.perf_counter() - start
+        if chunk['done']:
+            final = chunk
+    return (first_token or (time.perf_counter() - start), final.get('prompt_eval_count') or 0,
+            (final.get('prompt_eval_duration') or 0) / 1e6)
+
+
+def run(service, texts, num_predict, legacy):
+    rows = []
+    for text in texts:
+        cleaned = service._preprocess_text(text)
+        messages = legacy_messages(service, cleaned) if legacy else service._build_messages(cleaned)
+        rows.append(measure(service, messages, num_predict, legacy))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt layout benchmark: prompt-eval tokens and time to first token')
+    parser.add_argument('--host', default=os.environ.get('OLLAMA_HOST', 'http://localhost:11434'))
+    parser.add_argument('--model', default='qwen2.5:0.5b')
+    parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads'))
+    parser.add_argument('--receipts', type=int, default=8)
+    parser.add_argument('--num-predict', type=int, default=8, help='Output tokens per request (only the prompt is measured)')
+    args = parser.parse_args()
+
+    texts = load_texts(args.uploads, args.receipts)
+    if not texts:
+        print(f"No OCR text extracted from {args.uploads}")
+        sys.exit(1)
+
+    service = OfflineLLMService(model_name=args.model, host=args.host)
+    print(f"{args.model}, {len(texts)} receipts per layout (num_predict {args.num_predict}; parsing uses {LLM_NUM_PREDICT})")
+    print(f"{'layout':<8} {'prompt tokens':>13} {'(first)':>8} {'prompt ms':>10} {'TTFT ms':>8}")
+    for name, legacy in (('before', True), ('after', False)):
+        rows = run(service, texts, args.num_predict, legacy)
+        ttft = statistics.median(r[0] for r in rows) * 1000
+        tokens = statistics.median(r[1] for r in rows)
+        eval_ms = statistics.median(r[2] for r in rows)
+        print(f"{name:<8} {tokens:>13.0f} {rows[0][1]:>8} {eval_ms:>10.1f} {ttft:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
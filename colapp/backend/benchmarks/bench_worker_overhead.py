@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Measure the fixed per-job overhead of the pipeline stages: building the parser
+for every job (as the stages used to) versus reusing the worker's preloaded one.
+
+A cold job constructs EnhancedReceiptParser() (OCR service, Ollama client plus
+a model-list request, result cache) and, for the OCR stage, another
+OCRService(). A warm job calls tasks.get_parser() / tasks.get_ocr_service()
+after worker.warm_up() has run. Set OLLAMA's host reachable to include the
+model-list round trip; without Ollama the LLM setup fails fast and the gap is
+smaller than in production.
+
+Usage:
+    python benchmarks/bench_worker_overhead.py --jobs 50
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('RESULT_CACHE_BACKEND', 'off')
+logging.disable(logging.WARNING)
+
+from enhanced_receipt_parser import EnhancedReceiptParser
+from ocr_service import OCRService
+import tasks
+import worker
+
+
+def cold_job():
+    parser = EnhancedReceiptParser()
+    return parser, OCRService()
+
+
+def warm_job():
+    return tasks.get_parser(), tasks.get_ocr_service()
+
+
+def measure(job, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        job()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-job parser setup overhead: per-job construction vs preloaded worker')
+    parser.add_argument('--jobs', type=int, default=50)
+    args = parser.parse_args()
+
+    cold = measure(cold_job, args.jobs)
+    warm_up_timings = worker.warm_up(['preprocess', 'ocr', 'llm'])
+    warm = measure(warm_job, args.jobs)
+
+    print(f"Per-job setup over {args.jobs} jobs (ms):")
+    print(f"{'':<22}{'mean':>10}{'median':>10}{'max':>10}")
+    for name, samples in (('per-job construction', cold), ('preloaded worker', warm)):
+        print(f"{name:<22}{statistics.mean(samples):>10.3f}{statistics.median(samples):>10.3f}{max(samples):>10.3f}")
+    print(f"One-off warm-up: {sum(warm_up_timings.values()):.1f}ms ({warm_up_timings})")
+    saved = statistics.mean(cold) - statistics.mean(warm)
+    print(f"Saved per job: {saved:.3f}ms; warm-up pays for itself after "
+          f"{sum(warm_up_timings.values()) / saved if saved > 0 else float('inf'):.1f} jobs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN-based check that the hot receipt queries use their indexes.
+
+Builds the schema through migrate.upgrade(), seeds several users with
+receipts and items, then EXPLAINs the queries behind /receipts (first and
+next page), /receipts/unreviewed and the item eager load. Exits non-zero if a
+query does not use its expected index.
+
+Uses an in-memory SQLite database unless BENCH_DATABASE_URI points elsewhere,
+e.g. a scratch PostgreSQL database (its tables are dropped and recreated). On
+PostgreSQL sequential scans are disabled for the check, since the planner may
+prefer them on a small dataset even when the index is usable.
+
+Usage:
+    python benchmarks/check_index_usage.py
+"""
+
+import os
+import sys
+import json
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Must be set before app is imported
+os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('RESULT_CACHE_BACKEND', 'off')
+
+from sqlalchemy import and_, or_
+from app import app, db
+from models import User, Receipt, ReceiptItem
+import migrate
+
+USERS = 20
+RECEIPTS_PER_USER = 500
+ITEMS_PER_RECEIPT = 3
+
+
+def seed():
+    db.drop_all()
+    migrate.schema_migrations.drop(bind=db.engine, checkfirst=True)
+    migrate.upgrade()
+    now = datetime.utcnow()
+    users = [{'id': u + 1, 'email': f'user{u}@example.com', 'password_hash': 'x'} for u in range(USERS)]
+    db.session.execute(User.__table__.insert(), users)
+    receipts = [{
+        'id': u * RECEIPTS_PER_USER + i + 1, 'user_id': u + 1, 'store_name': f'Store {i % 9}',
+        'receipt_date': date(2024, 1 + i % 12, 1), 'total_amount': 10 + i % 50, 'image_path': f'{u}_{i}.jpg',
+        'ocr_processed': True, 'reviewed': i % 10 != 0,
+        'created_at': now - timedelta(minutes=i), 'updated_at': now
+    } for u in range(USERS) for i in range(RECEIPTS_PER_USER)]
+    db.session.execute(Receipt.__table__.insert(), receipts)
+    items = [{
+        'receipt_id': receipt['id'], 'product_name': f'Item {j}', 'price': 1 + j, 'category': 'Other',
+        'quantity': 1, 'created_at': now
+    } for receipt in receipts for j in range(ITEMS_PER_RECEIPT)]
+    db.session.execute(ReceiptItem.__table__.insert(), items)
+    db.session.commit()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+
+def explain(query):
+    """Return the query plan as text"""
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    with db.engine.connect() as conn:
+        if db.engine.dialect.name == 'postgresql':
+            conn.exec_driver_sql('SET enable_seqscan = off')
+            rows = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), params).fetchall()
+            return json.dumps(rows[0][0])
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+        return '\n'.join(str(row[-1]) for row in rows)
+
+
+def main():
+    with app.app_context():
+        seed()
+        user_id = 7
+        newest = Receipt.query.filter_by(user_id=user_id).order_by(Receipt.created_at.desc(), Receipt.id.desc()).first()
+        receipt_ids = [r.id for r in Receipt.query.filter_by(user_id=user_id).limit(20)]
+
+        checks = [
+            ('/receipts first page', 'ix_receipts_user_id_created_at',
+             Receipt.query.filter_by(user_id=user_id)
+             .order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(21)),
+            ('/receipts next page', 'ix_receipts_user_id_created_at',
+             Receipt.query.filter_by(user_id=user_id).filter(or_(
+                 Receipt.created_at < newest.created_at,
+                 and_(Receipt.created_at == newest.created_at, Receipt.id < newest.id)
+             )).order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(21)),
+            ('/receipts/unreviewed', 'ix_receipts_user_id_reviewed_created_at',
+             Receipt.query.filter_by(user_id=user_id, reviewed=False)
+             .order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(21)),
+            ('items eager load', 'ix_receipt_items_receipt_id',
+             ReceiptItem.query.filter(ReceiptItem.receipt_id.in_(receipt_ids))),
+        ]
+
+        failed = False
+        for name, index, query in checks:
+            plan = explain(query)
+            ok = index in plan
+            failed = failed or not ok
+            print(f"{'OK' if ok else 'FAIL':<5} {name:<22} expects {index}")
+            if not ok:
+                print('      plan: ' + plan.replace('\n', '\n            '))
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Query-count regression check for the receipt listing endpoints.
+
+Seeds an in-memory SQLite database with a user owning a few receipts, counts
+the SQL statements each endpoint issues, then repeats with many more receipts.
+Exits non-zero if any endpoint's statement count grows with the number of
+receipts (an N+1 query).
+
+Usage:
+    python benchmarks/check_query_counts.py
+"""
+
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Must be set before app is imported
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ.setdefault('RESULT_CACHE_BACKEND', 'off')
+
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import app, db
+from models import User, Receipt, ReceiptItem
+from identity import user_claims
+
+ENDPOINTS = ['/receipts', '/receipts/unreviewed', '/receipt/{first_id}']
+ITEMS_PER_RECEIPT = 3
+
+
+def seed(receipt_count):
+    db.drop_all()
+    db.create_all()
+    user = User(email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    for i in range(receipt_count):
+        receipt = Receipt(user_id=user.id, store_name=f'Store {i % 7}', receipt_date=date(2024, 1 + i % 12, 1),
+                          total_amount=10 + i, image_path=f'uploads/{i}.jpg')
+        db.session.add(receipt)
+        db.session.flush()
+        for j in range(ITEMS_PER_RECEIPT):
+            db.session.add(ReceiptItem(receipt_id=receipt.id, product_name=f'Item {j}', price=1 + j))
+    db.session.commit()
+    email, claims = user.email, user_claims(user)
+    first_id = Receipt.query.order_by(Receipt.id).first().id
+    db.session.remove()
+    return email, claims, first_id
+
+
+def count_queries(receipt_count):
+    """Return {endpoint: statement count} for a user with receipt_count receipts"""
+    with app.app_context():
+        email, claims, first_id = seed(receipt_count)
+        # Same token as /login issues
+        token = create_access_token(identity=email, additional_claims=claims)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        counts = {}
+        try:
+            client = app.test_client()
+            for endpoint in ENDPOINTS:
+                url = endpoint.format(first_id=first_id)
+                statements.clear()
+                response = client.get(url, headers={'Authorization': f'Bearer {token}'})
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)}")
+                counts[endpoint] = len(statements)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return counts
+
+
+def main():
+    small = count_queries(5)
+    large = count_queries(200)
+    failed = False
+    print(f"{'endpoint':<24} {'5 receipts':>10} {'200 receipts':>12}")
+    for endpoint in ENDPOINTS:
+        print(f"{endpoint:<24} {small[endpoint]:>10} {large[endpoint]:>12}")
+        if large[endpoint] > small[endpoint]:
+            failed = True
+    if failed:
+        print("FAIL: statement count grows with the number of receipts")
+        sys.exit(1)
+    print("OK: statement counts are constant")
+
+
+if __name__ == '__main__':
+    main()
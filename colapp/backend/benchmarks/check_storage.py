@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Round-trip check for the configured receipt image storage backend.
+
+Stores a generated receipt image under a scratch key, checks that it exists,
+fetches it back (as a worker on another node would) and compares the bytes,
+serves it through the backend's Flask response, then deletes it. Exits
+non-zero on the first mismatch. Timings are printed for each operation.
+
+Point it at a local MinIO (or any S3-compatible server) with e.g.:
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://localhost:9000 \
+    S3_ACCESS_KEY_ID=minioadmin S3_SECRET_ACCESS_KEY=minioadmin \
+    python benchmarks/check_storage.py
+
+Usage:
+    python benchmarks/check_storage.py
+"""
+
+import os
+import sys
+import time
+import uuid
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from PIL import Image, ImageDraw
+from storage import get_storage, STORAGE_BACKEND
+
+
+def make_image(path):
+    image = Image.new('RGB', (800, 1400), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(40):
+        draw.text((40, 30 * line + 20), f"ITEM {line:02d} ........ {line * 1.25:6.2f}", fill='black')
+    image.save(path, 'JPEG', quality=90)
+
+
+def digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def step(name, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"  {name:<8} {(time.perf_counter() - started) * 1000:8.1f} ms")
+    return result
+
+
+def fail(message):
+    print(f"FAIL: {message}")
+    sys.exit(1)
+
+
+def main():
+    storage = get_storage()
+    print(f"Backend: {STORAGE_BACKEND} ({type(storage).__name__})")
+    key = f"storage-check-{uuid.uuid4()}.jpg"
+
+    source = os.path.join(tempfile.mkdtemp(), key)
+    make_image(source)
+    expected = digest(source)
+    staged = storage.staging_path(key)
+    os.replace(source, staged)
+
+    try:
+        step('save', lambda: storage.save(key, staged))
+        if not step('exists', lambda: storage.exists(key)):
+            fail('object missing after save')
+        local_path = step('fetch', lambda: storage.fetch(key))
+        if local_path is None or digest(local_path) != expected:
+            fail('fetched bytes differ from the stored image')
+        storage.evict(local_path)
+
+        app = Flask(__name__)
+        with app.test_request_context():
+            response = step('send', lambda: storage.send(key, 60))
+            response.direct_passthrough = False
+            if response.status_code != 200 or hashlib.sha256(response.get_data()).hexdigest() != expected:
+                fail(f'send returned {response.status_code} or different bytes')
+            response.close()
+
+        step('delete', lambda: storage.delete(key))
+        if storage.exists(key):
+            fail('object still exists after delete')
+        print("OK: storage round trip")
+    finally:
+        # Don't leave the scratch image behind when a check fails
+        if storage.exists(key):
+            storage.delete(key)
+        if os.path.exists(staged):
+            os.remove(staged)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the API's main read endpoints.
+
+Logs in (optionally registering the user and seeding manual expenses first),
+then runs --concurrency client threads for --duration seconds. Each thread
+keeps one keep-alive connection and cycles through the endpoints. Reports
+requests per second and p50/p95/p99 latency per endpoint and overall.
+
+Run against the production server and the development server to compare:
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python benchmarks/load_test.py --url http://localhost:5000 --register --seed 200
+
+Usage:
+    python benchmarks/load_test.py --url http://localhost:5000 --concurrency 16 --duration 30
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+import http.client
+from urllib.parse import urlsplit
+
+DEFAULT_ENDPOINTS = [
+    '/receipts?limit=20',
+    '/receipts',
+    '/receipts/unreviewed?limit=20',
+    '/dashboard-stats',
+    '/receipt/{receipt_id}',
+]
+
+
+class Client:
+    """One keep-alive HTTP connection (reconnects if the server closes it)"""
+
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.token = token
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=30)
+            try:
+                self.connection.request(method, path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def prepare(args):
+    """Register/seed if asked, log in, and return (token, a receipt ID for /receipt/<id>)"""
+    client = Client(args.url)
+    if args.register:
+        client.request('POST', '/register', {'email': args.email, 'password': args.password})
+    status, data = client.request('POST', '/login', {'email': args.email, 'password': args.password})
+    if status != 200:
+        sys.exit(f"Login failed ({status}): {data[:200]!r}")
+    client.token = json.loads(data)['access_token']
+
+    for i in range(args.seed):
+        client.request('POST', '/expense/manual', {
+            'store_name': f'Load Test Store {i % 12}',
+            'total_amount': round(random.uniform(3, 150), 2),
+            'items': [{'product_name': f'Item {j}', 'price': round(random.uniform(1, 30), 2),
+                       'category': random.choice(['Dairy', 'Produce', 'Bakery', 'Other'])} for j in range(4)]
+        })
+
+    status, data = client.request('GET', '/receipts?limit=1')
+    receipts = json.loads(data).get('receipts', []) if status == 200 else []
+    client.close()
+    return client.token, (receipts[0]['id'] if receipts else 0)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(args, token, endpoints):
+    latencies = {endpoint: [] for endpoint in endpoints}
+    errors = {endpoint: 0 for endpoint in endpoints}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(offset):
+        client = Client(args.url, token)
+        local = {endpoint: [] for endpoint in endpoints}
+        local_errors = {endpoint: 0 for endpoint in endpoints}
+        i = offset
+        while time.perf_counter() < deadline:
+            endpoint = endpoints[i % len(endpoints)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status, _ = client.request('GET', endpoint)
+                ok = status < 400
+            except Exception:
+                ok = False
+            local[endpoint].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                local_errors[endpoint] += 1
+        client.close()
+        with lock:
+            for endpoint in endpoints:
+                latencies[endpoint].extend(local[endpoint])
+                errors[endpoint] += local_errors[endpoint]
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(latencies, errors, elapsed):
+    print(f"{'endpoint':<34}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    rows = list(latencies.items()) + [('TOTAL', [v for values in latencies.values() for v in values])]
+    for endpoint, values in rows:
+        values = sorted(values)
+        failed = sum(errors.values()) if endpoint == 'TOTAL' else errors[endpoint]
+        print(f"{endpoint:<34}{len(values):>9}{failed:>8}{len(values) / elapsed:>9.1f}"
+              f"{percentile(values, 0.50):>9.1f}{percentile(values, 0.95):>9.1f}{percentile(values, 0.99):>9.1f}")
+    if latencies and any(latencies.values()):
+        print(f"\nMean latency {statistics.mean(v for values in latencies.values() for v in values):.1f} ms "
+              f"over {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API read endpoints')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--email', default='loadtest@example.com')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--register', action='store_true', help='Register the user first (ignored if it exists)')
+    parser.add_argument('--seed', type=int, default=0, help='Manual expenses to create before the test')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds')
+    parser.add_argument('--endpoint', action='append', dest='endpoints',
+                        help='Endpoint to hit (repeatable); {receipt_id} is filled in')
+    args = parser.parse_args()
+
+    token, receipt_id = prepare(args)
+    endpoints = [endpoint.format(receipt_id=receipt_id) for endpoint in (args.endpoints or DEFAULT_ENDPOINTS)]
+    print(f"{args.url}: {args.concurrency} connections for {args.duration:.0f}s")
+    latencies, errors, elapsed = run(args, token, endpoints)
+    report(latencies, errors, elapsed)
+
+
+if __name__ == '__main__':
+    main()
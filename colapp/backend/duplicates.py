@@ -0,0 +1,107 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from models import db, Receipt
+
+logger = logging.getLogger(__name__)
+
+# A new upload is compared (by dHash bits) with at most DUPLICATE_SCAN_LIMIT of the user's receipts
+# from the last DUPLICATE_LOOKBACK_DAYS days
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('DUPLICATE_MAX_DISTANCE', '3'))  # differing dHash bits (of 64)
+DUPLICATE_LOOKBACK_DAYS = int(os.environ.get('DUPLICATE_LOOKBACK_DAYS', '90'))
+DUPLICATE_SCAN_LIMIT = int(os.environ.get('DUPLICATE_SCAN_LIMIT', '500'))
+
+# Placeholder store names that say nothing about the receipt
+_UNKNOWN_STORES = {'', 'unknown store', 'processing...'}
+
+
+def compute_dhash(image_path: str, hash_size: int = 8) -> Optional[str]:
+    """
+    Difference hash of an image: robust to re-compression, resizing and small lighting changes
+
+    Returns:
+        16 hex characters (64 bits), or None if the file is not a readable image (e.g. a PDF)
+    """
+    from PIL import Image, ImageOps  # Loaded on the first upload, not when the API imports this module
+    try:
+        with Image.open(image_path) as image:
+            image = ImageOps.exif_transpose(image).convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+            pixels = list(image.getdata())
+    except Exception as e:
+        logger.info(f"No perceptual hash for {image_path}: {e}")
+        return None
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def find_identical_upload(user_id: int, image_sha256: Optional[str]) -> Optional[Receipt]:
+    """
+    Find an earlier upload of this exact file (same image_sha256) by this user
+
+    Returns:
+        The original Receipt, or None
+    """
+    if not image_sha256:
+        return None
+    return Receipt.query.filter_by(user_id=user_id, image_sha256=image_sha256).order_by(Receipt.id).first()
+
+
+def find_similar_upload(user_id: int, image_dhash: Optional[str]) -> Optional[Receipt]:
+    """
+    Find a near-duplicate (another photo or re-encode of the same receipt) among the user's
+    recent uploads by comparing dHashes
+
+    An 8x8 dHash can also match a different receipt from the same store, so callers flag the
+    new upload with the match rather than discarding it.
+
+    Returns:
+        The closest Receipt within DUPLICATE_MAX_DISTANCE bits, or None
+    """
+    if not image_dhash:
+        return None
+
+    since = datetime.utcnow() - timedelta(days=DUPLICATE_LOOKBACK_DAYS)
+    candidates = db.session.query(Receipt.id, Receipt.image_dhash).filter(
+        Receipt.user_id == user_id,
+        Receipt.created_at >= since,
+        Receipt.image_dhash.isnot(None),
+        Receipt.duplicate_of_id.is_(None)
+    ).order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(DUPLICATE_SCAN_LIMIT)
+
+    best_id, best_distance = None, DUPLICATE_MAX_DISTANCE + 1
+    for receipt_id, dhash in candidates:
+        distance = hamming_distance(image_dhash, dhash)
+        if distance < best_distance:
+            best_id, best_distance = receipt_id, distance
+    return db.session.get(Receipt, best_id) if best_id is not None else None
+
+
+def find_duplicate_receipt(receipt: Receipt) -> Optional[Receipt]:
+    """
+    Find an earlier receipt of the same user with the same (store, date, total) after parsing
+
+    Returns:
+        The earliest matching Receipt, or None (also when the parse is too vague to compare)
+    """
+    store = (receipt.store_name or '').strip().lower()
+    if store in _UNKNOWN_STORES or not receipt.total_amount or float(receipt.total_amount) <= 0:
+        return None
+    return Receipt.query.filter(
+        Receipt.user_id == receipt.user_id,
+        Receipt.id != receipt.id,
+        Receipt.receipt_date == receipt.receipt_date,
+        Receipt.total_amount == receipt.total_amount,
+        func.lower(Receipt.store_name) == store,
+        Receipt.duplicate_of_id.is_(None)
+    ).order_by(Receipt.id).first()
@@ -1,7 +1,8 @@
 import os
+import re
 import json
 import logging
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Tuple, Union
 from pathlib import Path
 import tempfile
 
@@ -9,21 +10,84 @@ import tempfile
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ROUTER_CONFIDENCE_THRESHOLD = float(os.environ.get('ROUTER_CONFIDENCE_THRESHOLD', '0.8'))  # accept a cheap tier at or above
+ROUTER_SUM_TOLERANCE = float(os.environ.get('ROUTER_SUM_TOLERANCE', '0.02'))  # relative item-sum vs total mismatch
+
+# Parser tiers, cheapest first (recorded in receipts.parse_tier)
+TIER_HEURISTIC = 'heuristic'
+TIER_REGEX = 'regex'
+TIER_LLM = 'llm'
+
+# Tiers tried for each parsing method; a method with a single tier always uses its result
+METHOD_TIERS = {
+    'auto': (TIER_HEURISTIC, TIER_REGEX, TIER_LLM),
+    'llm': (TIER_LLM,),
+    'regex': (TIER_REGEX,),
+    'heuristic': (TIER_HEURISTIC,),
+    'ocr_only': (TIER_HEURISTIC,),
+}
+
+KNOWN_STORES = re.compile(
+    r"WAL\W?\s*MART|TARGET|KROGER|SAFEWAY|COSTCO|ALDI|CVS|WALGREENS|WHOLE\s*FOODS?|TRADER\s*JOE|ALBERTSONS|"
+    r"PUBLIX|MEIJER|SPROUTS|LIDL|SAM'?S\s*CLUB|HOME\s*DEPOT|STARBUCKS|MCDONALD|SUBWAY", re.IGNORECASE)
+
+
+def consistency_score(data: Dict[str, Any]) -> float:
+    """
+    Score how self-consistent parsed receipt data is, from 0 to 1
+    
+    Item prices adding up to the subtotal, total or total less tax is worth 0.5; a plausible
+    item count 0.1; item names with letters and positive prices up to 0.2; the store name
+    up to 0.2 (0.1 for any name, 0.2 for a known chain).
+    """
+    items = data.get('items') or []
+    if not items:
+        return 0.0
+    items_sum = round(sum(float(item.get('total_price') or 0) for item in items), 2)
+    total = float(data.get('total') or 0)
+    tax = float(data.get('tax') or 0)
+    references = [float(value) for value in (data.get('subtotal'), total, total - tax if tax else None) if value]
+    
+    score = 0.0
+    if any(abs(items_sum - reference) <= ROUTER_SUM_TOLERANCE * reference for reference in references if reference > 0):
+        score += 0.5
+    if len(items) <= 60:
+        score += 0.1
+    plausible = sum(1 for item in items
+                    if len(re.findall(r'[A-Za-z]', item.get('name') or '')) >= 3 and float(item.get('total_price') or 0) > 0)
+    score += 0.2 * plausible / len(items)
+    store_name = data.get('store_name') or ''
+    if KNOWN_STORES.search(store_name):
+        score += 0.2
+    elif store_name and store_name != 'Unknown Store':
+        score += 0.1
+    return round(score, 2)
+
+
 class EnhancedReceiptParser:
     """Enhanced receipt parser combining OCR and offline LLM for robust parsing"""
     
-    def __init__(self, use_llm: bool = True):
+    def __init__(self, use_llm: bool = True, result_cache=None):
         """
         Initialize the enhanced receipt parser
         
         Args:
             use_llm: Whether to use offline LLM for parsing
+            result_cache: ReceiptResultCache to use (one is created from the environment if omitted)
         """
         self.llm_service = None
+        self.ocr_service = None
+        self.result_cache = result_cache
         self._initialize_services()
     
     def _initialize_services(self):
         """Initialize all available services"""
+        try:
+            from ocr_service import OCRService
+            self.ocr_service = OCRService()
+        except Exception as e:
+            logger.warning(f"Failed to initialize OCR service: {e}")
+        
         try:
             from offline_llm_service import OfflineLLMService
             self.llm_service = OfflineLLMService()
@@ -32,14 +96,23 @@ class EnhancedReceiptParser:
             logger.warning(f"Failed to initialize LLM service: {e}")
             logger.info("⚠️  Falling back to OCR-only parsing (no LLM)")
             self.llm_service = None # Ensure it's None if initialization fails
+        
+        if self.result_cache is None:
+            try:
+                from result_cache import ReceiptResultCache
+                self.result_cache = ReceiptResultCache()
+                logger.info(f"✓ Result cache initialized ({self.result_cache.backend_name})")
+            except Exception as e:
+                logger.warning(f"Failed to initialize result cache: {e}")
     
-    def parse_receipt(self, file_path: str, method: str = 'auto') -> Dict[str, Any]:
+    def parse_receipt(self, file_path: str, method: str = 'auto', image_digest: Optional[str] = None) -> Dict[str, Any]:
         """
         Parse receipt using the best available method
         
         Args:
             file_path: Path to receipt file (image or PDF)
             method: Parsing method ('auto', 'llm', 'custom_nlp', 'ocr_only')
+            image_digest: SHA-256 of the file if the caller already computed it
             
         Returns:
             Dictionary with parsed receipt data
@@ -54,8 +127,23 @@ class EnhancedReceiptParser:
                     'method': 'none'
                 }
             
-            # Only use LLM method
-            return self._parse_with_llm(norm_path)
+            # Identical image + model + prompt + OCR config: reuse the stored result
+            cache_key = self.cache_key_for(norm_path, image_digest, method)
+            cached = self.get_cached_result(cache_key)
+            if cached is not None:
+                return cached
+            
+            ocr_result = self.extract_text(norm_path)
+            if not ocr_result.get('success'):
+                return {
+                    'success': False,
+                    'error': 'OCR failed to extract text',
+                    'method': 'none'
+                }
+            result = self.route_ocr_text(ocr_result['text'], method)
+            result['ocr_text'] = ocr_result['text']
+            self.store_cached_result(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"Error parsing receipt {file_path}: {e}")
@@ -66,6 +154,39 @@ class EnhancedReceiptParser:
                 'data': self._get_fallback_data()
             }
     
+    def cache_key_for(self, file_path: str, image_digest: Optional[str] = None, method: str = 'auto') -> Optional[str]:
+        """Build the result cache key for a receipt image and parsing method, or None if caching is disabled"""
+        if not self.result_cache or not self.result_cache.enabled:
+            return None
+        from result_cache import hash_file, make_cache_key
+        from offline_llm_service import PROMPT_VERSION
+        model_name = self.llm_service.model_name if self.llm_service else 'ocr_only'
+        ocr_config = self.ocr_service.config_signature() if self.ocr_service else ''
+        prompt_version = PROMPT_VERSION if method == 'auto' else f"{PROMPT_VERSION}/{method}"
+        return make_cache_key(image_digest or hash_file(file_path), model_name, prompt_version, ocr_config)
+    
+    def get_cached_result(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return a previously stored parse result for the cache key, if any"""
+        if not cache_key:
+            return None
+        entry = self.result_cache.get(cache_key)
+        if entry is None:
+            return None
+        result = dict(entry['result'])
+        result['ocr_text'] = entry.get('ocr_text', '')
+        result['cached'] = True
+        logger.info(f"Result cache hit for {cache_key[:12]}")
+        return result
+    
+    def store_cached_result(self, cache_key: Optional[str], result: Dict[str, Any], ocr_text: Optional[str] = None):
+        """Store a successful parse result; degraded fallbacks are not cached"""
+        if not cache_key or not result.get('success') or result.get('degraded'):
+            return
+        if ocr_text is None:
+            ocr_text = result.get('ocr_text', '')
+        stored = {k: v for k, v in result.items() if k not in ('ocr_text', 'cached')}
+        self.result_cache.set(cache_key, ocr_text, stored)
+    
     def _parse_with_llm(self, file_path: str) -> Dict[str, Any]:
         """Parse receipt using offline LLM (image → OCR → LLM) or fallback to OCR-only"""
         norm_path = os.path.normpath(file_path)
@@ -74,18 +195,131 @@ class EnhancedReceiptParser:
                 logger.info("LLM not available, using OCR-only parsing")
                 return self._parse_with_ocr_only(norm_path)
             
-            result = self.llm_service.parse_receipt_image(norm_path)
+            result = self.llm_service.parse_receipt_image(norm_path, ocr_service=self.ocr_service)
             return result
         except Exception as e:
             logger.error(f"LLM parsing failed: {e}")
             logger.info("Falling back to OCR-only parsing")
-            return self._parse_with_ocr_only(norm_path)
+            result = self._parse_with_ocr_only(norm_path)
+            result['degraded'] = True
+            return result
+    
+    def extract_text(self, file_path: str) -> Dict[str, Any]:
+        """Run OCR on a receipt image (first half of the OCR → LLM pipeline)"""
+        from ocr_service import OCRService
+        ocr_service = self.ocr_service or OCRService()
+        return ocr_service.extract_text(os.path.normpath(file_path))
+    
+    def parse_ocr_text(self, text: str, method: str = 'auto') -> Dict[str, Any]:
+        """Parse already extracted OCR text with the cheapest tier that gives a consistent result"""
+        return self.route_ocr_text(text, method)
+    
+    def parse_ocr_texts(self, texts: Dict[Any, str], methods: Optional[Dict[Any, str]] = None) -> Dict[Any, Dict[str, Any]]:
+        """Parse a batch of OCR texts keyed by receipt ID; receipts that need the LLM are sent to it concurrently"""
+        return self.route_ocr_texts(texts, methods)
+    
+    def route_ocr_text(self, text: str, method: str = 'auto') -> Dict[str, Any]:
+        """Route one OCR text through the parser tiers (see route_ocr_texts)"""
+        return self.route_ocr_texts({0: text}, {0: method})[0]
+    
+    def route_ocr_texts(self, texts: Dict[Any, str], methods: Optional[Dict[Any, str]] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        Confidence-gated routing: heuristic → regex → LLM
+        
+        For 'auto', each cheap tier's result is scored with consistency_score and accepted at
+        ROUTER_CONFIDENCE_THRESHOLD or above; receipts no cheap tier handles are escalated to the
+        LLM together. An explicit method ('llm', 'regex', 'heuristic'/'ocr_only') uses that tier only.
+        
+        Args:
+            texts: Mapping of caller-defined keys (e.g. receipt IDs) to OCR text
+            methods: Parsing method per key (default 'auto')
+            
+        Returns:
+            Mapping of the same keys to parse results, each with 'parse_tier' and 'confidence'
+        """
+        methods = methods or {}
+        results = {}
+        best = {}
+        escalated = {}
+        for key, text in texts.items():
+            accepted, best_result = self.route_cheap_tiers(text, methods.get(key) or 'auto')
+            if accepted is not None:
+                results[key] = accepted
+                continue
+            if best_result is not None:
+                best[key] = best_result
+            escalated[key] = text
+        if escalated:
+            logger.info(f"Escalating {len(escalated)} of {len(texts)} receipt(s) to the LLM")
+            results.update(self._parse_llm_tier(escalated, best))
+        return results
+    
+    def route_cheap_tiers(self, text: str, method: str = 'auto') -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Run the heuristic and regex tiers allowed by a parsing method (no LLM call)
+        
+        Args:
+            text: Raw OCR text
+            method: Parsing method ('auto', 'llm', 'regex', 'heuristic' or 'ocr_only')
+            
+        Returns:
+            Tuple of (accepted result, or None if the receipt needs the LLM; best cheap result tried, or None)
+        """
+        if method not in METHOD_TIERS:
+            logger.warning(f"Unknown parsing method {method!r}, using auto")
+            method = 'auto'
+        tiers = METHOD_TIERS[method]
+        best = None
+        for tier in tiers:
+            if tier == TIER_LLM:
+                break
+            result = self._parse_cheap_tier(tier, text)
+            if len(tiers) == 1 or result['confidence'] >= ROUTER_CONFIDENCE_THRESHOLD:
+                return result, result
+            if best is None or result['confidence'] > best['confidence']:
+                best = result
+        return None, best
+    
+    def _parse_cheap_tier(self, tier: str, text: str) -> Dict[str, Any]:
+        """Parse with the heuristic or regex tier and score the result"""
+        if tier == TIER_HEURISTIC:
+            data, method = self._apply_heuristic_parsing(text), 'ocr_only'
+        else:
+            data, method = self._apply_line_parsing(text), 'line_classifier'
+        return {
+            'success': True,
+            'method': method,
+            'data': data,
+            'confidence': consistency_score(data),
+            'parse_tier': tier
+        }
+    
+    def _parse_llm_tier(self, texts: Dict[Any, str], best: Dict[Any, Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """Parse with the LLM; without it, fall back to the best cheap result (degraded if the LLM failed)"""
+        if self.llm_service:
+            try:
+                if len(texts) == 1:
+                    results = {key: self.llm_service.parse_receipt_text(text) for key, text in texts.items()}
+                else:
+                    results = self.llm_service.parse_receipt_texts(texts)
+                for result in results.values():
+                    # The LLM service reads fully regular receipts with its own line pre-parser
+                    result['parse_tier'] = TIER_REGEX if result.get('method') == 'line_classifier' else TIER_LLM
+                return results
+            except Exception as e:
+                logger.error(f"LLM parsing failed: {e}")
+        results = {}
+        for key, text in texts.items():
+            result = best.get(key) or self._parse_cheap_tier(TIER_HEURISTIC, text)
+            result['degraded'] = self.llm_service is not None
+            results[key] = result
+        return results
     
     def _parse_with_ocr_only(self, file_path: str) -> Dict[str, Any]:
         """Parse receipt using OCR-only with heuristic rules"""
         try:
             from ocr_service import OCRService
-            ocr_service = OCRService()
+            ocr_service = self.ocr_service or OCRService()
             
             # Extract text using OCR
             ocr_result = ocr_service.extract_text(file_path)
@@ -103,7 +337,8 @@ class EnhancedReceiptParser:
             return {
                 'success': True,
                 'method': 'ocr_only',
-                'data': result
+                'data': result,
+                'ocr_text': ocr_text
             }
         except Exception as e:
             logger.error(f"OCR-only parsing failed: {e}")
@@ -160,6 +395,24 @@ class EnhancedReceiptParser:
             logger.error(f"Heuristic parsing failed: {e}")
             return self._get_fallback_data()
     
+    def _apply_line_parsing(self, text: str) -> Dict[str, Any]:
+        """Parse receipt text with the compiled line patterns of line_classifier (regex tier)"""
+        from line_classifier import pre_parse
+        lines = text.split('\n')
+        pre = pre_parse(text)
+        date_time = self._extract_date_time_heuristic(lines)
+        return {
+            'store_name': self._extract_store_name_heuristic(lines),
+            'date': date_time.get('date'),
+            'time': date_time.get('time'),
+            'items': [dict(item, category=self._categorize_item_heuristic(item['name'])) for item in pre.items],
+            'total': pre.total if pre.total is not None else 0.0,
+            'subtotal': pre.subtotal,
+            'tax': pre.tax,
+            'change': None,
+            'payment_method': None
+        }
+    
     def _extract_store_name_heuristic(self, lines: List[str]) -> str:
         """Extract store name using heuristic rules"""
         # Look for store name in first few lines
@@ -243,9 +496,10 @@ class EnhancedReceiptParser:
             r'(\d{4})-(\d{1,2})-(\d{1,2})'
         ]
         
+        # "4.48" on its own is a price, not a time: the dotted form needs am/pm
         time_patterns = [
-            r'(\d{1,2}):(\d{2})(?::\d{2})?\s*(am|pm)?',
-            r'(\d{1,2})\.(\d{2})\s*(am|pm)?'
+            r'\b(\d{1,2}):(\d{2})(?::\d{2})?\s*(am|pm)?',
+            r'\b(\d{1,2})\.(\d{2})\s*(am|pm)\b'
         ]
         
         date = None
@@ -280,6 +534,8 @@ class EnhancedReceiptParser:
                         minute = match.group(2)
                         ampm = match.group(3) if len(match.groups()) > 2 else None
                         
+                        if hour > (12 if ampm else 23) or int(minute) > 59:
+                            continue
                         if ampm:
                             if ampm == 'pm' and hour != 12:
                                 hour += 12
@@ -300,30 +556,9 @@ class EnhancedReceiptParser:
         return { 'date': result.get('date', '') or '', 'time': result.get('time', '') or '' }
     
     def _categorize_item_heuristic(self, product_name: str) -> str:
-        """Categorize item using heuristic rules"""
-        product_lower = product_name.lower()
-        
-        # Dairy products
-        if any(word in product_lower for word in ['milk', 'cheese', 'yogurt', 'cream', 'butter']):
-            return 'Dairy'
-        
-        # Produce
-        if any(word in product_lower for word in ['apple', 'banana', 'orange', 'lettuce', 'tomato', 'carrot']):
-            return 'Produce'
-        
-        # Meat
-        if any(word in product_lower for word in ['chicken', 'beef', 'pork', 'fish', 'meat']):
-            return 'Meat'
-        
-        # Bread/Bakery
-        if any(word in product_lower for word in ['bread', 'bun', 'cake', 'cookie', 'pastry']):
-            return 'Bakery'
-        
-        # Beverages
-        if any(word in product_lower for word in ['soda', 'water', 'juice', 'coffee', 'tea']):
-            return 'Beverages'
-        
-        return 'Other'
+        """Categorize item by keywords into the BLS category path used by the LLM and the dashboard"""
+        from bls_categories import find_category_by_keywords
+        return ' > '.join(find_category_by_keywords(product_name))
     
     def _get_fallback_data(self) -> Dict[str, Any]:
         """Get fallback data structure"""
@@ -342,6 +577,18 @@ class EnhancedReceiptParser:
     def get_available_methods(self) -> Dict[str, Any]:
         """Get information about available parsing methods"""
         methods = {
+            'auto': {
+                'available': True,
+                'description': 'Heuristic, then regex, then LLM parsing, stopping at the first consistent result'
+            },
+            'heuristic': {
+                'available': True,
+                'description': 'Keyword heuristics only (fastest)'
+            },
+            'regex': {
+                'available': True,
+                'description': 'Compiled line patterns only'
+            },
             'llm': {
                 'available': self.llm_service is not None,
                 'description': 'Offline LLM parsing (highest accuracy)'
@@ -354,4 +601,10 @@ class EnhancedReceiptParser:
         """Test status of available services (LLM only)"""
         return {
             'llm': self.llm_service is not None
-        } 
\ No newline at end of file
+        }
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the result cache"""
+        if not self.result_cache:
+            return {'backend': 'off'}
+        return self.result_cache.stats() 
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Gunicorn configuration for serving the API in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Graceful reload: `kill -HUP <master pid>` starts fresh workers with the current
+config and lets the old ones finish their requests. With GUNICORN_PRELOAD the
+application code is loaded once in the master, so a HUP does not pick up new
+code; use `kill -USR2` (then `-WINCH`/`-TERM` the old master) or a container
+restart for code changes.
+"""
+
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# Threaded workers: requests mostly wait on PostgreSQL, so threads add concurrency without more processes
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# Import the app once in the master and fork workers from it (faster start, shared memory pages)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Uploads are streamed to storage in the request, so allow for slow mobile clients
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# Keep idle client connections open between requests (set above the load balancer's idle timeout)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers now and then to bound memory growth; jitter avoids restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master; each worker opens its own"""
+    if not preload_app:
+        return
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
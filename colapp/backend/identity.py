@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models import db, User
+
+# Email -> user ID cache. It is per process and invalidate() only reaches the calling process, so a
+# deleted or re-registered account is still accepted by other workers for up to IDENTITY_CACHE_TTL seconds.
+IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', '30'))  # seconds
+IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', '10000'))
+
+# JWT claim carrying the user's database ID (set at login)
+USER_ID_CLAIM = 'uid'
+
+
+class IdentityCache:
+    """Small per-process TTL/LRU cache of email -> user ID"""
+
+    def __init__(self, ttl: int = IDENTITY_CACHE_TTL, max_size: int = IDENTITY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return user_id
+
+    def set(self, email: str, user_id: int):
+        with self._lock:
+            self._entries[email] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+
+identity_cache = IdentityCache()
+
+
+def user_claims(user) -> dict:
+    """Extra JWT claims for a user's access token"""
+    return {USER_ID_CLAIM: user.id}
+
+
+def current_user_id() -> Optional[int]:
+    """
+    Return the authenticated user's ID without a database round trip where possible
+
+    The token's email is resolved through the identity cache, falling back to a single-column
+    lookup by email. A token's uid claim must match that ID, so tokens of a deleted account stop
+    working once the cache entry expires.
+
+    Returns:
+        User ID, or None if the token's user does not exist
+    """
+    email = get_jwt_identity()
+    user_id = identity_cache.get(email)
+    if user_id is None:
+        user_id = db.session.query(User.id).filter_by(email=email).scalar()
+        if user_id is not None:
+            identity_cache.set(email, user_id)
+    token_user_id = get_jwt().get(USER_ID_CLAIM)
+    if token_user_id is not None and token_user_id != user_id:
+        return None
+    return user_id
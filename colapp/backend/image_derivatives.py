@@ -0,0 +1,120 @@
+import os
+import uuid
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of each stored derivative, in pixels; whether the original is kept once the receipt is parsed
+ARCHIVE_MAX_EDGE = int(os.environ.get('ARCHIVE_MAX_EDGE', '2400'))
+PREVIEW_MAX_EDGE = int(os.environ.get('PREVIEW_MAX_EDGE', '1280'))
+THUMB_MAX_EDGE = int(os.environ.get('THUMB_MAX_EDGE', '320'))
+KEEP_ORIGINAL_UPLOADS = os.environ.get('KEEP_ORIGINAL_UPLOADS', 'true').lower() == 'true'
+
+# Size name -> (longest edge in pixels, JPEG quality), largest first so each is resized from the previous
+DERIVATIVE_SIZES = {
+    'archive': (ARCHIVE_MAX_EDGE, 85),
+    'preview': (PREVIEW_MAX_EDGE, 80),
+    'thumb': (THUMB_MAX_EDGE, 70),
+}
+ORIGINAL = 'original'
+SIZES = (ORIGINAL,) + tuple(DERIVATIVE_SIZES)
+
+
+def derivative_filename(filename: str, size: str) -> str:
+    """Name of a derivative next to its upload, e.g. 'abc_receipt.thumb.jpg'"""
+    if size == ORIGINAL:
+        return filename
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}.{size}.jpg"
+
+
+def create_derivatives(original_path: str) -> Dict[str, str]:
+    """
+    Write the recompressed archive copy, preview and thumbnail of an uploaded image
+
+    Derivatives are upright (EXIF orientation applied), RGB, progressive JPEGs that are never
+    larger than the original dimensions.
+
+    Args:
+        original_path: Local copy of the uploaded image; derivatives are written next to it
+
+    Returns:
+        Dictionary of size name -> local path written (empty for PDFs and unreadable files)
+    """
+    from PIL import Image, ImageOps  # Loaded on first use, not when the API imports this module
+    folder, filename = os.path.split(original_path)
+    written = {}
+    try:
+        with Image.open(original_path) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for size, (max_edge, quality) in DERIVATIVE_SIZES.items():
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                path = os.path.join(folder, derivative_filename(filename, size))
+                # Unique per writer: the API (resolve_upload) and a worker may create the same derivative at once
+                partial_path = f"{path}.{uuid.uuid4().hex}.part"
+                try:
+                    image.save(partial_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+                    os.replace(partial_path, path)
+                except Exception:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
+                written[size] = path
+    except Exception as e:
+        logger.warning(f"Could not create derivatives of {original_path}: {e}")
+    return written
+
+
+def store_derivatives(storage, key: str, local_path: str) -> Dict[str, str]:
+    """
+    Create the derivatives of an upload from a local copy and put them in storage
+
+    Returns:
+        Dictionary of size name -> storage key written
+    """
+    stored = {}
+    for size, path in create_derivatives(local_path).items():
+        derivative_key = derivative_filename(key, size)
+        storage.save(derivative_key, path)
+        stored[size] = derivative_key
+    return stored
+
+
+def resolve_upload(storage, key: str, size: str = ORIGINAL) -> Optional[str]:
+    """
+    Pick the stored object to serve for an upload at the requested size
+
+    Missing derivatives (uploads from before derivatives existed) are created on first request.
+    When the original has been discarded, the archive copy stands in for it.
+
+    Returns:
+        Storage key, or None if nothing can be served
+    """
+    wanted = derivative_filename(key, size)
+    if storage.exists(wanted):
+        return wanted
+    if size == ORIGINAL:
+        archive = derivative_filename(key, 'archive')
+        return archive if storage.exists(archive) else None
+    local_path = storage.fetch(key)
+    if local_path is None:
+        return None
+    try:
+        return wanted if size in store_derivatives(storage, key, local_path) else None
+    finally:
+        storage.evict(local_path)
+
+
+def discard_original(storage, key: str) -> bool:
+    """Delete an upload once its archive copy exists, unless KEEP_ORIGINAL_UPLOADS is set"""
+    if KEEP_ORIGINAL_UPLOADS or not storage.exists(derivative_filename(key, 'archive')):
+        return False
+    storage.delete(key)
+    return True
+
+
+def remove_upload(storage, key: str):
+    """Delete an upload and all of its derivatives"""
+    for size in SIZES:
+        storage.delete(derivative_filename(key, size))
@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Stages run in this order; any subset can be enabled
+ALL_STAGES = ('exif', 'crop', 'downscale', 'grayscale', 'threshold', 'deskew')
+
+# Stages to run, and the resolution to scale receipts to (from the paper width)
+OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', ','.join(ALL_STAGES))  # comma-separated stages, or 'none'
+OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', '300'))
+RECEIPT_WIDTH_INCHES = float(os.environ.get('RECEIPT_WIDTH_INCHES', '3.15'))  # 80 mm thermal paper
+
+
+def parse_stages(value: Optional[str]) -> Tuple[str, ...]:
+    """Parse a comma-separated stage list such as 'exif,grayscale' ('none' disables preprocessing)"""
+    if not value or value.strip().lower() == 'none':
+        return ()
+    requested = {stage.strip().lower() for stage in value.split(',') if stage.strip()}
+    unknown = requested - set(ALL_STAGES)
+    if unknown:
+        logger.warning(f"Ignoring unknown preprocessing stages: {sorted(unknown)}")
+    return tuple(stage for stage in ALL_STAGES if stage in requested)
+
+
+class ImagePreprocessor:
+    """Cleans up receipt photos before Tesseract (rotation, crop, resize, binarize, deskew)"""
+
+    def __init__(self, stages: Optional[Iterable[str]] = None, target_dpi: int = OCR_TARGET_DPI,
+                 receipt_width_inches: float = RECEIPT_WIDTH_INCHES, threshold_block: int = 31,
+                 threshold_offset: int = 10, max_skew: float = 5.0, skew_step: float = 0.5):
+        """
+        Initialize the preprocessor
+
+        Args:
+            stages: Stages to run (defaults to OCR_PREPROCESS); see ALL_STAGES
+            target_dpi: Resolution the receipt is downscaled to
+            receipt_width_inches: Physical receipt width used to derive the target pixel width
+            threshold_block: Neighbourhood size in pixels for adaptive thresholding
+            threshold_offset: How much darker than its neighbourhood a pixel must be to count as ink
+            max_skew: Largest rotation in degrees searched by deskew
+            skew_step: Angle resolution in degrees for deskew
+        """
+        if stages is None:
+            stages = parse_stages(OCR_PREPROCESS)
+        else:
+            stages = tuple(stage for stage in ALL_STAGES if stage in set(stages))
+        self.stages = stages
+        self.target_dpi = target_dpi
+        self.receipt_width_inches = receipt_width_inches
+        self.threshold_block = threshold_block
+        self.threshold_offset = threshold_offset
+        self.max_skew = max_skew
+        self.skew_step = skew_step
+
+    def signature(self) -> str:
+        """Describe the settings that affect the output image (used in cache keys)"""
+        if not self.stages:
+            return 'none'
+        return (f"{'+'.join(self.stages)}|dpi={self.target_dpi}|w={self.receipt_width_inches}"
+                f"|block={self.threshold_block}|offset={self.threshold_offset}|skew={self.max_skew}/{self.skew_step}")
+
+    def process(self, image: Image.Image) -> Tuple[Image.Image, Dict[str, float]]:
+        """
+        Run the enabled stages on an image
+
+        Returns:
+            Tuple of (processed image, per-stage timings in milliseconds)
+        """
+        timings = {}
+        for stage in self.stages:
+            start = time.perf_counter()
+            try:
+                image = getattr(self, f"_{stage}")(image)
+            except Exception as e:
+                logger.warning(f"Preprocessing stage '{stage}' failed, skipping: {e}")
+            timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+        return image, timings
+
+    def _exif(self, image: Image.Image) -> Image.Image:
+        """Apply the camera's EXIF orientation so text is upright"""
+        return ImageOps.exif_transpose(image)
+
+    def _crop(self, image: Image.Image) -> Image.Image:
+        """Crop to the bright paper region, dropping the table/background around the receipt"""
+        gray = image.convert('L')
+        scale = min(1.0, 400.0 / max(gray.size))
+        small = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))))
+        pixels = np.asarray(small, dtype=np.uint8)
+        mask = pixels > _otsu_threshold(pixels)
+
+        rows = np.where(mask.mean(axis=1) > 0.2)[0]
+        cols = np.where(mask.mean(axis=0) > 0.2)[0]
+        if rows.size == 0 or cols.size == 0:
+            return image
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+
+        # Only crop when a clear receipt region was found
+        area = (bottom - top) * (right - left) / float(mask.size)
+        if area < 0.2 or area > 0.95:
+            return image
+
+        pad_x = int((right - left) * 0.02)
+        pad_y = int((bottom - top) * 0.02)
+        box = (
+            max(0, int((left - pad_x) / scale)),
+            max(0, int((top - pad_y) / scale)),
+            min(image.width, int((right + pad_x) / scale)),
+            min(image.height, int((bottom + pad_y) / scale)),
+        )
+        return image.crop(box)
+
+    def _downscale(self, image: Image.Image) -> Image.Image:
+        """Shrink to the target DPI for the receipt width; never upscale"""
+        target_width = int(self.target_dpi * self.receipt_width_inches)
+        if image.width <= target_width:
+            return image
+        ratio = target_width / float(image.width)
+        return image.resize((target_width, max(1, int(image.height * ratio))), Image.LANCZOS)
+
+    def _grayscale(self, image: Image.Image) -> Image.Image:
+        return image.convert('L')
+
+    def _threshold(self, image: Image.Image) -> Image.Image:
+        """Adaptive mean threshold, robust to shadows and uneven lighting"""
+        gray = image.convert('L')
+        local_mean = np.asarray(gray.filter(ImageFilter.BoxBlur(self.threshold_block // 2)), dtype=np.int16)
+        pixels = np.asarray(gray, dtype=np.int16)
+        binary = np.where(pixels < local_mean - self.threshold_offset, 0, 255).astype(np.uint8)
+        return Image.fromarray(binary, mode='L')
+
+    def _deskew(self, image: Image.Image) -> Image.Image:
+        """Rotate so text lines are horizontal, using a projection-profile search"""
+        gray = image.convert('L')
+        scale = min(1.0, 800.0 / max(gray.size))
+        small = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))))
+        # Ink = white on black so rotation padding does not count as text
+        inverted = ImageOps.invert(small)
+
+        best_angle, best_score = 0.0, -1.0
+        for angle in np.arange(-self.max_skew, self.max_skew + self.skew_step / 2, self.skew_step):
+            rotated = np.asarray(inverted.rotate(float(angle), resample=Image.NEAREST), dtype=np.float32)
+            profile = rotated.sum(axis=1)
+            score = float(np.sum(np.diff(profile) ** 2))
+            if score > best_score:
+                best_angle, best_score = float(angle), score
+
+        if abs(best_angle) < self.skew_step:
+            return image
+        fill = 255 if len(image.getbands()) == 1 else (255,) * len(image.getbands())
+        return image.rotate(best_angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+def _otsu_threshold(pixels: np.ndarray) -> int:
+    """Otsu's global threshold for an 8-bit grayscale array"""
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    total = pixels.size
+    weight_bg = np.cumsum(histogram)
+    weight_fg = total - weight_bg
+    cumulative_mean = np.cumsum(histogram * np.arange(256))
+    mean_bg = cumulative_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cumulative_mean[-1] - cumulative_mean) / np.maximum(weight_fg, 1)
+    between_class = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between_class))
@@ -1,16 +1,20 @@
 from app import app, db
 from models import User, Receipt, ReceiptItem, Category
+import argparse
+import migrate
 
-def init_database():
+def init_database(reset=False):
     with app.app_context():
-        print("Dropping all database tables...")
-        db.drop_all()
-        print("Tables dropped.")
+        if reset:
+            print("Dropping all database tables...")
+            db.drop_all()
+            migrate.schema_migrations.drop(bind=db.engine, checkfirst=True)
+            print("Tables dropped.")
         
-        # Create all tables
-        print("Creating all database tables...")
-        db.create_all()
-        print("Tables created.")
+        # Create tables and indexes through the versioned migrations
+        print("Applying database migrations...")
+        migrate.upgrade()
+        print("Database schema is up to date.")
         
         # Insert default categories
         print("Adding default categories...")
@@ -38,4 +42,6 @@ def init_database():
         print("Database has been initialized successfully!")
 
 if __name__ == "__main__":
-    init_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Initialize the database')
+    parser.add_argument('--reset', action='store_true', help='Drop all tables first (deletes all data)')
+    init_database(reset=parser.parse_args().reset) 
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Deterministic line-level receipt pre-parser
+
+Classifies each OCR line as an item, subtotal, tax, total, header or noise line with
+compiled patterns (the item formats of SimpleReceiptOCR.regex_patterns in ocr.py,
+with a confidence per format). High-confidence lines are accepted as they are; only
+the remaining, ambiguous lines need the LLM.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+LINE_CONFIDENCE_THRESHOLD = float(os.environ.get('LINE_CONFIDENCE_THRESHOLD', '0.8'))  # accept lines at or above
+HEADER_LINES = int(os.environ.get('LINE_HEADER_LINES', '6'))  # lines before the first item that may be store header
+SUM_TOLERANCE = float(os.environ.get('LINE_SUM_TOLERANCE', '0.02'))  # relative item-sum vs total mismatch allowed
+
+ITEM = 'item'
+SUBTOTAL = 'subtotal'
+TAX = 'tax'
+TOTAL = 'total'
+DISCOUNT = 'discount'
+HEADER = 'header'
+NOISE = 'noise'
+UNKNOWN = 'unknown'
+
+_AMOUNT = r'\$?\s?(?P<price>\d{1,5}\.\d{2})'
+_FLAG = r'(?:\s+[A-Z]{1,2}|\s*[§*])?'
+
+# Item formats, most specific first: (pattern, confidence)
+ITEM_PATTERNS = [
+    # "E 673919 FF BS BREAST 23.99 E", "404609 ECO HALF PAN 6.49 A"
+    (re.compile(r'^(?:[A-Z]\s+)?\d{3,10}\s+(?P<name>[A-Za-z][A-Za-z0-9 &\'/%.-]*?)\s+' + _AMOUNT + _FLAG + r'$'), 0.95),
+    # "Su HRO FGHTR 06305094073 6.94 T"
+    (re.compile(r'^(?P<name>.+?)\s+\d{11,13}\s+' + _AMOUNT + _FLAG + r'$'), 0.95),
+    # "BANANAS 2.5 lb @ 0.99 2.48"
+    (re.compile(r'^(?P<name>.+?)\s+(?P<weight>\d+\.\d+)\s*(?:lb|kg)\s*@\s*\$?(?P<unit>\d+\.\d{2,3})(?:\s*/\s*(?:lb|kg))?\s+'
+                + _AMOUNT + _FLAG + r'$', re.IGNORECASE), 0.9),
+    # "MILK 2 @ $1.99 $3.98", "BREAD 2 @ $2.49 T$4.98"
+    (re.compile(r'^(?P<name>.+?)\s+(?P<qty>\d{1,3})\s*@\s*\$?(?P<unit>\d+\.\d{2})\s+[A-Za-z]?' + _AMOUNT + _FLAG + r'$'), 0.9),
+    # "MILK $1.99 x 2 = $3.98"
+    (re.compile(r'^(?P<name>.+?)\s+\$?(?P<unit>\d+\.\d{2})\s*x\s*(?P<qty>\d{1,3})\s*=?\s*' + _AMOUNT + r'$',
+                re.IGNORECASE), 0.9),
+    # "2 MILK 3.98"
+    (re.compile(r'^(?P<qty>\d{1,2})\s+(?P<name>[A-Za-z][A-Za-z &\'/-]+?)\s+' + _AMOUNT + _FLAG + r'$'), 0.85),
+    # "MILK $1.99", "BRAIDED BRIOCHE $6.99 F", "SEA SALT POT CHP $1.29 §"
+    (re.compile(r'^(?P<name>[A-Za-z][A-Za-z0-9 &\'/%.,-]*?)\s+' + _AMOUNT + _FLAG + r'$'), 0.85),
+    # Anything ending in a price (OCR noise in the name, ...)
+    (re.compile(r'^(?P<name>.+?)\s+' + _AMOUNT + r'\s*\S?$'), 0.5),
+]
+
+_SUBTOTAL = re.compile(r'\bSUB\s*-?\s*TOTAL\b', re.IGNORECASE)
+_TAX = re.compile(r'\b(?:TAX|HST|GST|PST|VAT)\b', re.IGNORECASE)
+_TOTAL = re.compile(r'\b(?:TOTAL|BALANCE\s+DUE|AMOUNT\s+DUE|GRAND\s+TOTAL)\b', re.IGNORECASE)
+_NOISE = re.compile(
+    r'\b(?:CASH|CHANGE|VISA|MASTERCARD|AMEX|DEBIT|CREDIT|TEND(?:ERED)?|AUTH\w*|APPROV\w*|ACCOUNT|REF\s*#|'
+    r'TERMINAL|THANK|SAVINGS|SAVED|DISCOUNT|COUPON|ITEMS?\s+SOLD|MEMBER\s*(?:#|ID|NO)|SURVEY|RECEIPT|CASHIER|'
+    r'ST#|OP#|TE#|TR#|TRN|TRM|TCR|WHSE|NETWORK|PRNTD|SIGNATURE|POLICY|WWW|HTTP\w*)',
+    re.IGNORECASE)
+_DATE_TIME_PHONE = re.compile(
+    r'\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b|\b\d{1,2}:\d{2}(?::\d{2})?\b|\(?\b\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}\b')
+_LAST_AMOUNT = re.compile(r'(-?)\$?\s?(\d{1,6}\.\d{2})(-?)(?!.*\d\.\d{2})')
+_LETTERS = re.compile(r'[A-Za-z]')
+
+
+@dataclass
+class ClassifiedLine:
+    """One OCR line with its class, confidence and the values read from it"""
+    index: int
+    text: str
+    kind: str
+    confidence: float
+    values: Dict[str, float] = field(default_factory=dict)
+    name: Optional[str] = None
+
+
+@dataclass
+class PreParseResult:
+    """Lines of a receipt split into accepted values and lines left for the LLM"""
+    lines: List[ClassifiedLine]
+    items: List[Dict] = field(default_factory=list)
+    subtotal: Optional[float] = None
+    tax: Optional[float] = None
+    total: Optional[float] = None
+    discount: float = 0.0
+    ambiguous: List[ClassifiedLine] = field(default_factory=list)
+
+    @property
+    def items_sum(self) -> float:
+        return round(sum(item['total_price'] for item in self.items), 2)
+
+    def is_consistent(self, tolerance: float = SUM_TOLERANCE) -> bool:
+        """
+        Whether the accepted items add up to the subtotal (or total less tax)
+
+        False when neither was found (e.g. OCR garbled the TOTAL line): the items can't be checked.
+        """
+        if self.subtotal is not None:
+            reference = self.subtotal
+        elif self.total is not None:
+            reference = self.total - (self.tax or 0.0)
+        else:
+            return False
+        return abs(self.items_sum + self.discount - reference) <= max(0.01, tolerance * reference)
+
+    @property
+    def complete(self) -> bool:
+        """Every line was classified confidently and the items add up to a subtotal or total: the LLM is not needed"""
+        return bool(self.items) and not self.ambiguous and self.is_consistent()
+
+    def llm_text(self) -> str:
+        """The lines the LLM still has to read, after the header lines (store name context), in receipt order"""
+        return '\n'.join(line.text for line in self.lines if line.kind == HEADER or line in self.ambiguous)
+
+    def stats(self) -> Dict[str, int]:
+        return {'lines': len(self.lines), 'items_accepted': len(self.items), 'lines_for_llm': len(self.ambiguous)}
+
+
+def _name_quality(name: str) -> float:
+    """Penalty factor for names that look like OCR noise (few letters)"""
+    letters = len(_LETTERS.findall(name))
+    if letters < 2:
+        return 0.0
+    if letters < 3 or letters / max(len(name.replace(' ', '')), 1) < 0.5:
+        return 0.6
+    return 1.0
+
+
+def _amount(line: str) -> Optional[float]:
+    """Last amount on the line (negative if marked with a minus sign)"""
+    match = _LAST_AMOUNT.search(line)
+    if not match:
+        return None
+    value = float(match.group(2))
+    return -value if match.group(1) or match.group(3) else value
+
+
+def classify_line(text: str, index: int = 0, in_header: bool = False) -> ClassifiedLine:
+    """
+    Classify one OCR line
+
+    Args:
+        text: The line (stripped)
+        index: Line number in the receipt
+        in_header: Whether the line comes before the first item (store name, address)
+
+    Returns:
+        ClassifiedLine with kind, confidence and values (price, quantity, unit price, amount)
+    """
+    if len(_LETTERS.findall(text)) + sum(ch.isdigit() for ch in text) < 2:
+        return ClassifiedLine(index, text, NOISE, 1.0)
+
+    for kind, pattern in ((SUBTOTAL, _SUBTOTAL), (TAX, _TAX), (TOTAL, _TOTAL)):
+        if pattern.search(text):
+            amount = _amount(text)
+            if amount is None:
+                return ClassifiedLine(index, text, NOISE, 0.9)
+            return ClassifiedLine(index, text, kind, 0.95, {'amount': amount})
+
+    amount = _amount(text)
+    if amount is not None and amount < 0:
+        # Coupons and markdowns ("COUPON 1.00-"); counted when checking the items against the subtotal
+        return ClassifiedLine(index, text, DISCOUNT, 0.9, {'amount': amount})
+
+    if _NOISE.search(text) or _DATE_TIME_PHONE.search(text):
+        return ClassifiedLine(index, text, NOISE, 0.9)
+
+    for pattern, confidence in ITEM_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        fields = match.groupdict()
+        name = ' '.join(fields['name'].split()).strip(' .-')
+        price = float(fields['price'])
+        quantity = float(fields.get('qty') or 1)
+        unit_price = float(fields['unit']) if fields.get('unit') else round(price / quantity, 2)
+        if fields.get('weight'):
+            quantity = 1.0
+        confidence *= _name_quality(name)
+        return ClassifiedLine(index, text, ITEM, confidence,
+                              {'price': price, 'quantity': quantity, 'unit_price': unit_price}, name)
+
+    if in_header and amount is None:
+        return ClassifiedLine(index, text, HEADER, 0.9)
+    return ClassifiedLine(index, text, UNKNOWN, 0.0)
+
+
+def pre_parse(text: str, threshold: float = LINE_CONFIDENCE_THRESHOLD) -> PreParseResult:
+    """
+    Classify every line of a receipt and accept the confident ones
+
+    Args:
+        text: Raw OCR text (one receipt line per text line)
+        threshold: Minimum confidence for a line to be accepted without the LLM
+
+    Returns:
+        PreParseResult with accepted items/amounts and the ambiguous lines
+    """
+    lines = []
+    seen_item = False
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if not stripped:
+            continue
+        line = classify_line(stripped, len(lines), in_header=not seen_item and len(lines) < HEADER_LINES)
+        seen_item = seen_item or line.kind == ITEM
+        lines.append(line)
+
+    result = PreParseResult(lines=lines)
+    for line in lines:
+        if line.kind in (HEADER, NOISE):
+            continue
+        if line.confidence < threshold:
+            result.ambiguous.append(line)
+        elif line.kind == ITEM:
+            result.items.append({
+                'name': line.name,
+                'quantity': line.values['quantity'],
+                'unit_price': line.values['unit_price'],
+                'total_price': line.values['price'],
+            })
+        # The first subtotal/tax/total wins; later ones are usually payment echoes
+        elif line.kind == SUBTOTAL and result.subtotal is None:
+            result.subtotal = line.values['amount']
+        elif line.kind == TAX and result.tax is None:
+            result.tax = line.values['amount']
+        elif line.kind == TOTAL and result.total is None:
+            result.total = line.values['amount']
+        elif line.kind == DISCOUNT:
+            result.discount = round(result.discount + line.values['amount'], 2)
+    return result
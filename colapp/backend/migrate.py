@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Applied versions are recorded in the schema_migrations table; running the
+script applies every pending migration in order, each in its own transaction.
+Migrations must be safe to run against a database created by an older
+init_db.py (create_all), so they use IF NOT EXISTS / existence checks.
+
+To add a migration, declare the change in models.py, write a function taking
+a connection and append it to MIGRATIONS with the next version number.
+
+Usage:
+    python migrate.py            # apply pending migrations
+    python migrate.py status     # list applied and pending migrations
+"""
+
+import argparse
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.schema import CreateIndex
+from models import db, Receipt, ReceiptItem
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _create_indexes(conn, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _add_column_if_missing(conn, table, name):
+    """Add a column declared in models.py to an existing table"""
+    if name in {column['name'] for column in inspect(conn).get_columns(table.name)}:
+        return
+    column_type = table.c[name].type.compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}')
+
+
+def create_tables(conn):
+    """Baseline: create any missing tables from models.py (existing tables are left alone)"""
+    db.metadata.create_all(bind=conn)
+
+
+def receipt_listing_indexes(conn):
+    """Indexes for listing a user's receipts newest first and looking up items by receipt"""
+    _create_indexes(conn, Receipt.__table__, {
+        'ix_receipts_user_id_created_at',
+        'ix_receipts_user_id_reviewed_created_at',
+    })
+    _create_indexes(conn, ReceiptItem.__table__, {'ix_receipt_items_receipt_id'})
+
+
+def receipt_image_sha256(conn):
+    """Content hash of the uploaded image, for dedup and result caching"""
+    _add_column_if_missing(conn, Receipt.__table__, 'image_sha256')
+    _create_indexes(conn, Receipt.__table__, {'ix_receipts_user_id_image_sha256'})
+
+
+def receipt_duplicate_detection(conn):
+    """Perceptual image hash and duplicate link for near-duplicate receipts"""
+    _add_column_if_missing(conn, Receipt.__table__, 'image_dhash')
+    _add_column_if_missing(conn, Receipt.__table__, 'duplicate_of_id')
+
+
+def receipt_parse_tier(conn):
+    """Which parser tier (heuristic, regex, llm) produced a receipt's data"""
+    _add_column_if_missing(conn, Receipt.__table__, 'parse_tier')
+
+
+def rollup_backfill(conn):
+    """Fill the dashboard rollups from existing receipts (/dashboard-stats reads only the rollups)"""
+    from sqlalchemy.orm import Session
+    import rollups
+    with Session(bind=conn) as session:
+        written = rollups.rebuild(session=session)
+    print(f"  Rebuilt rollups: {written} rows")
+
+
+MIGRATIONS = [
+    (1, 'Create tables', create_tables),
+    (2, 'Receipt listing and item lookup indexes', receipt_listing_indexes),
+    (3, 'Receipt image SHA-256', receipt_image_sha256),
+    (4, 'Receipt duplicate detection', receipt_duplicate_detection),
+    (5, 'Receipt parse tier', receipt_parse_tier),
+    (6, 'Backfill dashboard rollups', rollup_backfill),
+]
+
+
+def applied_versions(engine):
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade(engine=None):
+    """
+    Apply pending migrations
+
+    Args:
+        engine: SQLAlchemy engine (defaults to db.engine; needs an app context)
+
+    Returns:
+        List of versions applied
+    """
+    engine = engine or db.engine
+    done = applied_versions(engine)
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying migration {version}: {description}")
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('command', nargs='?', default='upgrade', choices=['upgrade', 'status'])
+    args = parser.parse_args()
+
+    from app import app  # Import here to avoid circular import
+    with app.app_context():
+        if args.command == 'status':
+            done = applied_versions(db.engine)
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version in done else 'pending':<8} {version:>3}  {description}")
+            return
+        applied = upgrade()
+        print(f"Applied {len(applied)} migration(s)" if applied else "Database schema is up to date")
+
+
+if __name__ == '__main__':
+    main()
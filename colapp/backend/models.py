@@ -45,11 +45,15 @@ class Receipt(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     reviewed = db.Column(db.Boolean, default=False)
+    image_sha256 = db.Column(db.String(64))  # SHA-256 of the uploaded image bytes
+    image_dhash = db.Column(db.String(16))  # Perceptual (difference) hash, for near-duplicate photos
+    duplicate_of_id = db.Column(db.Integer)  # Earlier receipt with the same store, date and total
+    parse_tier = db.Column(db.String(20))  # Parser that produced the data: heuristic, regex or llm
     
     # Relationship with items
     items = db.relationship('ReceiptItem', backref='receipt', lazy=True, cascade='all, delete-orphan')
 
-    def __init__(self, user_id, store_name, receipt_date, total_amount, image_path, ocr_processed=False, reviewed=False):
+    def __init__(self, user_id, store_name, receipt_date, total_amount, image_path, ocr_processed=False, reviewed=False, image_sha256=None, image_dhash=None):
         self.user_id = user_id
         self.store_name = store_name
         self.receipt_date = receipt_date
@@ -57,11 +61,21 @@ class Receipt(db.Model):
         self.image_path = image_path
         self.ocr_processed = ocr_processed
         self.reviewed = reviewed
+        self.image_sha256 = image_sha256
+        self.image_dhash = image_dhash
+
+# Hot paths: a user's receipts newest first (keyset pagination over created_at, id) and the unreviewed list.
+# Ship new indexes as a migration in migrate.py as well, so existing databases get them.
+db.Index('ix_receipts_user_id_created_at', Receipt.user_id, Receipt.created_at.desc(), Receipt.id.desc())
+db.Index('ix_receipts_user_id_reviewed_created_at', Receipt.user_id, Receipt.reviewed,
+         Receipt.created_at.desc(), Receipt.id.desc())
+# Exact re-uploads of the same image by a user
+db.Index('ix_receipts_user_id_image_sha256', Receipt.user_id, Receipt.image_sha256)
 
 class ReceiptItem(db.Model):
     __tablename__ = 'receipt_items'
     id = db.Column(db.Integer, primary_key=True)
-    receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False)
+    receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False, index=True)
     product_name = db.Column(db.String(200), nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     category = db.Column(db.String(100), default='Other')
@@ -85,3 +99,35 @@ class Category(db.Model):
     def __init__(self, name, description=None):
         self.name = name
         self.description = description
+
+class ReceiptRollup(db.Model):
+    """Receipt count and spend per user, month and store, kept up to date by rollups.py"""
+    __tablename__ = 'receipt_rollups'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    store_name = db.Column(db.String(200), primary_key=True)
+    receipt_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __init__(self, user_id, month, store_name, receipt_count=0, total_amount=0):
+        self.user_id = user_id
+        self.month = month
+        self.store_name = store_name
+        self.receipt_count = receipt_count
+        self.total_amount = total_amount
+
+class CategoryRollup(db.Model):
+    """Item count and spend per user, month and category, kept up to date by rollups.py"""
+    __tablename__ = 'category_rollups'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    category = db.Column(db.String(100), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_price = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __init__(self, user_id, month, category, item_count=0, total_price=0):
+        self.user_id = user_id
+        self.month = month
+        self.category = category
+        self.item_count = item_count
+        self.total_price = total_price
@@ -1,11 +1,61 @@
+import os
+import time
+import logging
 import pytesseract
 from PIL import Image
+from image_preprocessing import ImagePreprocessor
+from tesseract_pool import TESSEROCR_AVAILABLE, get_pool
+
+logger = logging.getLogger(__name__)
+
+# 'auto' uses the warm tesserocr engine pool when installed, else one tesseract subprocess per call
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')  # 'auto', 'tesserocr' or 'pytesseract'
 
 class OCRService:
-    def extract_text(self, image_path):
+    def __init__(self, tesseract_config=None, preprocessor=None, backend=None):
+        self.tesseract_config = tesseract_config if tesseract_config is not None else os.environ.get('TESSERACT_CONFIG', '')
+        self.preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        backend = backend or OCR_BACKEND
+        if backend in ('auto', 'tesserocr') and TESSEROCR_AVAILABLE:
+            self.backend = 'tesserocr'
+        else:
+            if backend == 'tesserocr':
+                logger.warning("tesserocr is not installed, falling back to pytesseract")
+            self.backend = 'pytesseract'
+
+    def config_signature(self):
+        """Describe the OCR settings that affect extracted text (used in cache keys)"""
+        return f"tesseract|{self.tesseract_config}|prep={self.preprocessor.signature()}"
+
+    def preprocess(self, image_path, output_path):
+        """
+        Run the preprocessing stages and save the cleaned image for a later extract_text(preprocess=False)
+
+        Returns:
+            Dictionary with 'success', 'path' and per-stage 'timings' in milliseconds
+        """
+        try:
+            image, timings = self.preprocessor.process(Image.open(image_path))
+            image.save(output_path)
+            return {'success': True, 'path': output_path, 'timings': timings}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def image_to_string(self, image):
+        """OCR an in-memory PIL image with the configured backend"""
+        if self.backend == 'tesserocr':
+            return get_pool(self.tesseract_config).image_to_string(image)
+        return pytesseract.image_to_string(image, config=self.tesseract_config)
+
+    def extract_text(self, image_path, preprocess=True):
         try:
             image = Image.open(image_path)
-            text = pytesseract.image_to_string(image)
-            return {'success': True, 'text': text}
+            timings = {}
+            if preprocess:
+                image, timings = self.preprocessor.process(image)
+            start = time.perf_counter()
+            text = self.image_to_string(image)
+            timings['tesseract'] = round((time.perf_counter() - start) * 1000, 1)
+            return {'success': True, 'text': text, 'timings': timings}
         except Exception as e:
-            return {'success': False, 'error': str(e)} 
\ No newline at end of file
+            return {'success': False, 'error': str(e)}
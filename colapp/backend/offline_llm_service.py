@@ -6,9 +6,11 @@ from typing import Dict, List, Optional, Any, Iterator
 from PIL import Image
 import io
 import ollama
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from ocr_service import OCRService
+from line_classifier import pre_parse
 
 
 
@@ -16,6 +18,20 @@ from ocr_service import OCRService
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump whenever the system prompt or request options change so cached results are not reused
+PROMPT_VERSION = "5"
+
+# Stream the completion and stop reading once the JSON object closes
+LLM_STREAM = os.environ.get('LLM_STREAM', 'true').lower() == 'true'  # stop generation once the JSON object closes
+LLM_STREAM_MAX_PREAMBLE = int(os.environ.get('LLM_STREAM_MAX_PREAMBLE', '200'))  # non-JSON characters tolerated before '{'
+# Constrain decoding to the ReceiptData JSON schema (needs Ollama server >= 0.5)
+LLM_STRUCTURED_OUTPUT = os.environ.get('LLM_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+LLM_NUM_PREDICT = int(os.environ.get('LLM_NUM_PREDICT', '1024'))  # output token cap; a schema-valid receipt needs far fewer
+# Read confidently classified lines without the LLM; only the rest is sent to it (see line_classifier.py)
+LLM_PREPARSE = os.environ.get('LLM_PREPARSE', 'true').lower() == 'true'
+# How long Ollama keeps the model (and its cached prompt prefix) loaded after a request; -1 = until it is restarted
+LLM_KEEP_ALIVE = os.environ.get('LLM_KEEP_ALIVE', '-1')
+
 # BLS categories are now handled by the LLM directly
 ALLOWED_CATEGORIES = [
     "Food and Beverages > Food at home > Cereals and bakery products",
@@ -118,6 +134,49 @@ ALLOWED_CATEGORIES = [
     "Other Goods and Services > Miscellaneous personal services > Miscellaneous personal services"
 ]
 
+# Short category codes the LLM answers with: (code, hint shown in the prompt, category in ALLOWED_CATEGORIES)
+CATEGORY_CODES = [
+    ("BAKERY", "bread, cereal, pasta, rice, flour", "Food and Beverages > Food at home > Cereals and bakery products"),
+    ("MEAT", "meat, poultry, fish, eggs", "Food and Beverages > Food at home > Meats, poultry, fish, and eggs"),
+    ("DAIRY", "milk, cheese, yogurt, butter", "Food and Beverages > Food at home > Dairy and related products"),
+    ("PRODUCE", "fruits, vegetables", "Food and Beverages > Food at home > Fruits and vegetables"),
+    ("DRINK", "water, soda, juice, coffee, tea", "Food and Beverages > Food at home > Nonalcoholic beverages and beverage materials"),
+    ("FOOD", "other groceries, snacks, sweets", "Food and Beverages > Food at home > Other food at home"),
+    ("MEAL", "restaurant meals", "Food and Beverages > Food away from home > Full service meals and snacks"),
+    ("FASTFOOD", "fast food, takeout, cafe", "Food and Beverages > Food away from home > Limited service meals and snacks"),
+    ("BEER", "beer", "Food and Beverages > Alcoholic beverages > Beer, ale, and other malt beverages at home"),
+    ("WINE", "wine", "Food and Beverages > Alcoholic beverages > Wine at home"),
+    ("SPIRITS", "liquor", "Food and Beverages > Alcoholic beverages > Distilled spirits at home"),
+    ("CLEANING", "detergent, cleaners", "Housing > Household furnishings and operations > Household cleaning products"),
+    ("PAPER", "paper towels, tissue, bags, foil", "Housing > Household furnishings and operations > Paper and plastic products"),
+    ("HOUSEHOLD", "other household supplies", "Housing > Household furnishings and operations > Housekeeping supplies"),
+    ("MENSWEAR", "men's clothing", "Apparel > Men's and boys' apparel > Men's apparel"),
+    ("WOMENSWEAR", "women's clothing", "Apparel > Women's and girls' apparel > Women's apparel"),
+    ("FUEL", "gasoline, diesel", "Transportation > Private transportation > Motor fuel"),
+    ("MEDICINE", "medicine, vitamins", "Medical Care > Medical care commodities > Medicinal drugs"),
+    ("PET", "pet food and supplies", "Recreation > Pets, pet products and services > Pets and pet products"),
+    ("PERSONAL", "soap, shampoo, toothpaste, razors", "Other Goods and Services > Personal care > Hair, dental, shaving, and miscellaneous personal care products"),
+    ("COSMETICS", "makeup, perfume", "Other Goods and Services > Personal care > Cosmetics, perfume, bath, nail preparations and implements"),
+    ("TOBACCO", "cigarettes, tobacco", "Other Goods and Services > Tobacco and smoking products > Cigarettes"),
+]
+CATEGORY_BY_CODE = {code: category for code, _, category in CATEGORY_CODES}
+DEFAULT_CATEGORY = CATEGORY_BY_CODE["FOOD"]
+
+# Static instructions, sent as the system message. Keep it byte-for-byte stable between requests:
+# Ollama reuses the evaluated prompt prefix (KV cache) only while it is unchanged.
+SYSTEM_PROMPT = """You extract purchased products from receipt text. Reply with JSON only.
+
+Rules:
+1. items: only real products. Skip totals, subtotal, tax, discounts, change and payment lines.
+2. Prices are numbers without $. Use 0.0 for a missing price and 1.0 for a missing quantity.
+3. store_name: the store name, usually on the first line.
+4. total: the total amount paid.
+5. category: one of these codes:
+""" + "\n".join(f"{code}: {hint}" for code, hint, _ in CATEGORY_CODES) + """
+
+Format:
+{"store_name": "...", "items": [{"name": "...", "quantity": 1.0, "unit_price": 0.0, "total_price": 0.0, "category": "CODE"}], "total": 0.0}"""
+
 class ReceiptItem(BaseModel):
     """Model for individual receipt items"""
     name: str = Field(description="Product name")
@@ -138,6 +197,133 @@ class ReceiptData(BaseModel):
     change: Optional[float] = Field(default=None, description="Change received")
     payment_method: Optional[str] = Field(default=None, description="Payment method used")
 
+# JSON schema passed to Ollama as `format`, so every completion is a valid ReceiptData
+RECEIPT_SCHEMA = ReceiptData.model_json_schema()
+RECEIPT_SCHEMA['$defs']['ReceiptItem']['properties']['category'] = {
+    'description': 'Category code', 'enum': [code for code, _, _ in CATEGORY_CODES]
+}
+
+_JSON_SCALAR = re.compile(r'-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?|true|false|null')
+_BARE_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.+-_$')
+
+
+class JsonObjectStream:
+    """
+    Incremental scanner for the first top-level JSON object in a stream of text chunks
+
+    Tracks strings, escapes, bracket nesting and what may come next (key, colon, value,
+    comma or closing bracket) as chunks arrive, so the caller can stop generating as soon as
+    the object closes, or as soon as the output can no longer be valid JSON (mismatched
+    brackets, trailing commas, missing commas or colons, bare words such as `price`).
+    """
+
+    # `expect` states in which a value, or an object key, may start
+    _VALUE_STATES = ('value', 'value_or_end')
+    _KEY_STATES = ('key', 'key_or_end')
+
+    def __init__(self, max_preamble: int = LLM_STREAM_MAX_PREAMBLE):
+        self.max_preamble = max_preamble
+        self.chars = []
+        self.stack = []
+        self.expect = None
+        self.in_string = False
+        self.escape = False
+        self.bare = ''
+        self.preamble = 0
+        self.complete = False
+        self.error = None
+
+    @property
+    def text(self) -> str:
+        """The object so far (the whole object once complete)"""
+        return ''.join(self.chars)
+
+    def _open(self, closer: str):
+        self.stack.append(closer)
+        self.expect = 'key_or_end' if closer == '}' else 'value_or_end'
+
+    def _end_value(self):
+        self.expect = 'comma_or_end'
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Scan the next chunk
+
+        Returns:
+            True once the top-level object is complete; sets `error` and returns False if it is malformed
+        """
+        if self.complete or self.error:
+            return self.complete
+        for ch in chunk:
+            if not self.stack:
+                if ch == '{':
+                    self._open('}')
+                    self.chars.append(ch)
+                elif not ch.isspace():
+                    self.preamble += 1
+                    if self.preamble > self.max_preamble:
+                        self.error = f"no JSON object in the first {self.max_preamble} characters"
+                        return False
+                continue
+            self.chars.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch in _BARE_CHARS:
+                if not self.bare and self.expect not in self._VALUE_STATES:
+                    self.error = f"unexpected {ch!r}"
+                    return False
+                self.bare += ch
+                continue
+            if self.bare:
+                if not _JSON_SCALAR.fullmatch(self.bare):
+                    self.error = f"invalid value {self.bare!r}"
+                    return False
+                self.bare = ''
+                self._end_value()
+            if ch.isspace():
+                continue
+            if ch == '"':
+                if self.expect in self._KEY_STATES:
+                    self.expect = 'colon'
+                elif self.expect in self._VALUE_STATES:
+                    self._end_value()
+                else:
+                    self.error = f"unexpected {ch!r}"
+                    return False
+                self.in_string = True
+            elif ch == '{' or ch == '[':
+                if self.expect not in self._VALUE_STATES:
+                    self.error = f"unexpected {ch!r}"
+                    return False
+                self._open('}' if ch == '{' else ']')
+            elif ch == '}' or ch == ']':
+                if ch != self.stack[-1]:
+                    self.error = f"mismatched {ch!r}"
+                    return False
+                if self.expect not in ('comma_or_end', 'key_or_end', 'value_or_end'):
+                    self.error = f"unexpected {ch!r}"
+                    return False
+                self.stack.pop()
+                if not self.stack:
+                    self.complete = True
+                    return True
+                self._end_value()
+            elif ch == ':' and self.expect == 'colon':
+                self.expect = 'value'
+            elif ch == ',' and self.expect == 'comma_or_end':
+                self.expect = 'key' if self.stack[-1] == '}' else 'value'
+            else:
+                self.error = f"unexpected {ch!r}"
+                return False
+        return False
+
+
 class OfflineLLMService:
     """Service for offline LLM-based receipt parsing using Ollama"""
     
@@ -162,8 +348,7 @@ class OfflineLLMService:
     def _ensure_model_available(self):
         """Ensure the specified model is available in Ollama"""
         try:
-            models = self.client.list()
-            available_models = [model['name'] for model in models['models']]
+            available_models = self._model_names(self.client.list())
             
             if self.model_name not in available_models:
                 logger.warning(f"Model {self.model_name} not found. Available models: {available_models}")
@@ -178,51 +363,21 @@ class OfflineLLMService:
             logger.error(f"Error checking Ollama models: {e}")
             raise
     
+    @staticmethod
+    def _model_names(models) -> List[str]:
+        """Model names from client.list() (ollama>=0.4 returns objects with `.model`, older clients dicts with 'name')"""
+        return [getattr(model, 'model', None) or model['name'] for model in models['models']]
+    
     def _get_system_prompt(self) -> str:
         """Get the system prompt for receipt parsing"""
-        return """You are a receipt parsing assistant. Extract products and information from receipts.
-
-IMPORTANT: You MUST respond with valid JSON. Do not include any other text.
-
-RULES:
-1. Find ONLY real product names from receipt (skip totals, taxes, discounts)
-2. Use 0.0 for missing prices, 1.0 for missing quantities
-3. Convert prices to numbers (remove $)
-4. Extract store name from first line
-5. Look for lines with prices at the end (like "PRODUCT 12.99")
-6. Skip lines that are clearly not products (TOTAL, TAX, CHANGE, etc.)
-7. Use these BLS categories:
-   - Food and Beverages > Food at home > Cereals and bakery products
-   - Food and Beverages > Food at home > Meats poultry fish and eggs
-   - Food and Beverages > Food at home > Dairy and related products
-   - Food and Beverages > Food at home > Fruits and vegetables
-   - Food and Beverages > Food at home > Nonalcoholic beverages and beverage materials
-   - Food and Beverages > Food at home > Other food at home
-   - Food and Beverages > Food away from home > Full service meals and snacks
-   - Food and Beverages > Food away from home > Limited service meals and snacks
-   - Housing > Household furnishings and operations > Housekeeping supplies
-   - Apparel > Mens and boys apparel
-   - Apparel > Womens and girls apparel
-   - Apparel > Footwear
-   - Transportation > Private transportation > Motor fuel
-   - Medical Care > Medical care commodities > Medicinal drugs
-   - Recreation > Pets pet products and services
-   - Other Goods and Services > Personal care > Personal care services
-
-RESPOND WITH THIS JSON FORMAT:
-{
-  "store_name": "store name",
-  "items": [
-    {
-      "name": "product name",
-      "quantity": 1.0,
-      "unit_price": price,
-      "total_price": price,
-      "category": "BLS category path"
-    }
-  ],
-  "total": total_amount
-}"""
+        return SYSTEM_PROMPT
+    
+    def _build_messages(self, cleaned_text: str) -> List[Dict[str, str]]:
+        """Chat messages for one receipt: the shared system prompt first, then only the receipt text"""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"Receipt:\n{cleaned_text}"}
+        ]
     
     def parse_receipt_text(self, text: str) -> Dict[str, Any]:
         """
@@ -235,98 +390,73 @@ RESPOND WITH THIS JSON FORMAT:
             Dictionary with parsed receipt data
         """
         try:
-            # Clean and prepare the text
-            cleaned_text = self._preprocess_text(text)
+            pre = pre_parse(text) if LLM_PREPARSE else None
+            if pre is not None and pre.complete:
+                # Every line was read confidently and the items add up: no LLM call
+                print(f"Pre-parser accepted all lines, skipping the LLM: {pre.stats()}")
+                return self._pre_parse_result(pre, text)
+            if pre is not None and not pre.items:
+                pre = None  # Unfamiliar layout: let the LLM read the whole receipt
+            
+            # Clean and prepare the text (only the lines the pre-parser could not read)
+            cleaned_text = self._preprocess_text(pre.llm_text() if pre is not None else text)
             print("LLM parsed raw OCR text:", cleaned_text)
             
-            # Create the prompt
-            prompt = f"""Parse this receipt and extract all products:
-
-{cleaned_text}
-
-You must respond with valid JSON containing the store name, all products found, and total amount."""
-
+            messages = self._build_messages(cleaned_text)
+            options = {
+                "temperature": 0.0,  # Zero temperature for consistent output
+                "top_p": 0.9,
+                "num_predict": LLM_NUM_PREDICT,  # Upper bound; streaming stops at the end of the JSON object
+                "num_ctx": 4096,     # Much larger context window
+                "repeat_penalty": 1.0, # No repetition penalty
+                "stop": ["```", "```json", "```\n"]  # Stop at code blocks
+            }
+            
             # Get response from Ollama with more conservative settings
             try:
                 print("Sending request to LLM...")
-                response = self.client.chat(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "user", "content": f"{self.system_prompt}\n\n{prompt}"}
-                    ],
-                    options={
-                        "temperature": 0.0,  # Zero temperature for consistent output
-                        "top_p": 0.9,
-                        "num_predict": 2048,  # Much more tokens for complete response
-                        "num_ctx": 4096,     # Much larger context window
-                        "repeat_penalty": 1.0, # No repetition penalty
-                        "stop": ["```", "```json", "```\n"]  # Stop at code blocks
-                    }
-                )
+                if LLM_STREAM:
+                    streamed = self._stream_json_completion(messages, options)
+                    if streamed['error']:
+                        # The output can no longer become valid JSON: stop paying for it and parse with regexes
+                        print(f"LLM stream aborted after {streamed['chunks']} chunks: {streamed['error']}")
+                        if pre is not None:
+                            result = self._pre_parse_result(pre, text, confidence=0.7)
+                        else:
+                            result = self._fallback_parse_receipt(text)
+                        result['llm_error'] = streamed['error']
+                        return result
+                    content = streamed['content']
+                else:
+                    response = self.client.chat(model=self.model_name, messages=messages, options=options,
+                                                **self._format_kwargs())
+                    content = self._response_content(response)
                 print("LLM response received successfully")
             except Exception as e:
                 print(f"LLM call failed: {e}")
                 # Return fallback data
                 return {
                     'success': True,
-                    'data': self._get_fallback_data(),
+                    'data': self._pre_parse_data(pre, text) if pre is not None else self._get_fallback_data(),
                     'method': 'offline_llm',
                     'model': self.model_name,
-                    'confidence': 0.5
+                    'confidence': 0.5,
+                    'degraded': True
                 }
             
             # Extract JSON from response
             print("Processing LLM response...")
-            if isinstance(response, Iterator):
-                first_message = next(response)
-            else:
-                first_message = response
-            
-            print("Response type:", type(response))
-            print("First message:", first_message)
-            
-            content = first_message['message']['content']
             print("LLM raw response:", content)  # Debug the raw response
             
-            # Try to extract JSON
-            json_str = self._extract_json_from_response(content)
-            
-            # If no JSON found, try to create a basic structure
-            if not json_str or json_str.strip() == '':
-                print("No JSON found in response, creating basic structure")
-                # Extract store name using the dedicated method
-                store_name = self._extract_store_name(cleaned_text)
-                
-                # Create basic JSON structure
-                json_str = f'''{{
-                    "store_name": "{store_name}",
-                    "items": [],
-                    "total": 0.0
-                }}'''
-            
-            # Parse and validate JSON
-            try:
-                parsed_data = json.loads(json_str)
-                print("LLM raw parsed_data:", parsed_data)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                # Try to fix truncated JSON
+            parsed_data = None
+            if LLM_STRUCTURED_OUTPUT:
+                # Schema-constrained output parses as-is; the repair passes are only for unconstrained output
                 try:
-                    # If JSON is truncated, try to complete it
-                    if json_str.strip().endswith(','):
-                        json_str = json_str.rstrip(',') + ']}'
-                    elif not json_str.strip().endswith('}'):
-                        json_str = json_str.rstrip() + '}'
-                    
-                    parsed_data = json.loads(json_str)
-                    print("Fixed truncated JSON:", parsed_data)
-                except:
-                    # Create fallback JSON
-                    parsed_data = {
-                        "store_name": "Unknown Store",
-                        "items": [],
-                        "total": 0.0
-                    }
+                    parsed_data = ReceiptData.model_validate_json(content).model_dump()
+                except ValidationError as e:
+                    print(f"LLM output does not match the receipt schema: {e}")
+            if parsed_data is None:
+                parsed_data = self._repair_json_response(content, cleaned_text)
             
             # Validate against schema
             validated_data = self._validate_and_clean_data(parsed_data)
@@ -385,11 +515,13 @@ You must respond with valid JSON containing the store name, all products found,
                     quantity = 1.0
                 
                 # Use LLM's category classification (trust the LLM's judgment)
-                category = item.get('category', 'Food and Beverages > Food at home > Other food at home')
+                category = item.get('category') or DEFAULT_CATEGORY
+                # Map the LLM's short code back to the full category path
+                category = CATEGORY_BY_CODE.get(str(category).strip().upper(), category)
                 
                 # Validate that the category follows the expected format
-                if not category or ' > ' not in category:
-                    category = 'Food and Beverages > Food at home > Other food at home'
+                if not isinstance(category, str) or ' > ' not in category:
+                    category = DEFAULT_CATEGORY
                 
                 cleaned_items.append({
                     'name': item.get('name', ''),
@@ -401,13 +533,17 @@ You must respond with valid JSON containing the store name, all products found,
             
             validated_data['items'] = cleaned_items
             
-            return {
+            result = {
                 'success': True,
                 'data': validated_data,
                 'method': 'offline_llm',
                 'model': self.model_name,
                 'confidence': 0.85  # LLM confidence estimate
             }
+            if pre is not None:
+                result['data'] = self._merge_pre_parse(pre, text, validated_data)
+                result['line_stats'] = pre.stats()
+            return result
             
         except Exception as e:
             logger.error(f"Error parsing receipt with LLM: {e}")
@@ -419,16 +555,74 @@ You must respond with valid JSON containing the store name, all products found,
                 'data': self._get_fallback_data()
             }
     
-    def parse_receipt_image(self, image_path: str) -> Dict[str, Any]:
+    def _pre_parse_data(self, pre, text: str) -> Dict[str, Any]:
+        """Receipt data from the lines the pre-parser accepted"""
+        data = self._get_fallback_data()
+        data.update(
+            store_name=self._extract_store_name(text),
+            items=[dict(item, category=self._determine_category(item['name'])) for item in pre.items],
+            subtotal=pre.subtotal,
+            tax=pre.tax,
+            total=pre.total if pre.total is not None else pre.items_sum
+        )
+        return data
+    
+    def _pre_parse_result(self, pre, text: str, confidence: float = 0.9) -> Dict[str, Any]:
+        """Parse result built by the pre-parser alone"""
+        return {
+            'success': True,
+            'data': self._pre_parse_data(pre, text),
+            'method': 'line_classifier',
+            'confidence': confidence,
+            'line_stats': pre.stats()
+        }
+    
+    def _merge_pre_parse(self, pre, text: str, llm_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine accepted lines with what the LLM read from the remaining ones"""
+        data = self._pre_parse_data(pre, text)
+        data['items'] = data['items'] + llm_data.get('items', [])
+        if llm_data.get('store_name') and llm_data['store_name'] != 'Unknown Store':
+            data['store_name'] = llm_data['store_name']
+        for field in ('subtotal', 'tax'):
+            if data[field] is None:
+                data[field] = llm_data.get(field)
+        if pre.total is None and llm_data.get('total'):
+            data['total'] = llm_data['total']
+        for field in ('date', 'time', 'change', 'payment_method'):
+            data[field] = llm_data.get(field)
+        return data
+    
+    def parse_receipt_texts(self, texts: Dict[Any, str], max_workers: Optional[int] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        Parse a batch of receipt texts concurrently
+        
+        Ollama serves the requests in parallel (see OLLAMA_NUM_PARALLEL), so a batch
+        finishes in roughly the time of its slowest receipt.
+        
+        Args:
+            texts: Mapping of caller-defined keys (e.g. receipt IDs) to raw OCR text
+            max_workers: Maximum number of requests in flight (defaults to the batch size)
+            
+        Returns:
+            Mapping of the same keys to parsed receipt data
+        """
+        if not texts:
+            return {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(texts)) as executor:
+            futures = {key: executor.submit(self.parse_receipt_text, text) for key, text in texts.items()}
+            return {key: future.result() for key, future in futures.items()}
+    
+    def parse_receipt_image(self, image_path: str, ocr_service: Optional[OCRService] = None) -> Dict[str, Any]:
         """
         Parse receipt image using OCR + LLM
         Args:
             image_path: Path to receipt image
+            ocr_service: OCR service to use (a new one is created if omitted)
         Returns:
-            Dictionary with parsed receipt data
+            Dictionary with parsed receipt data and the OCR text it was parsed from
         """
         try:
-            ocr_service = OCRService()
+            ocr_service = ocr_service or OCRService()
             ocr_result = ocr_service.extract_text(image_path)
             print("OCR result:", ocr_result)  # Debug print
             if not ocr_result['success']:
@@ -437,7 +631,9 @@ You must respond with valid JSON containing the store name, all products found,
                     'error': 'OCR failed to extract text',
                     'method': 'offline_llm'
                 }
-            return self.parse_receipt_text(ocr_result['text'])
+            result = self.parse_receipt_text(ocr_result['text'])
+            result['ocr_text'] = ocr_result['text']
+            return result
         except Exception as e:
             logger.error(f"Error parsing receipt image: {e}")
             return {
@@ -446,6 +642,109 @@ You must respond with valid JSON containing the store name, all products found,
                 'method': 'offline_llm'
             }
     
+    def _format_kwargs(self) -> Dict[str, Any]:
+        """Extra chat() arguments: keep the model loaded, and constrain the output to the receipt schema"""
+        kwargs = {'keep_alive': self._keep_alive()}
+        if LLM_STRUCTURED_OUTPUT:
+            kwargs['format'] = RECEIPT_SCHEMA
+        return kwargs
+    
+    @staticmethod
+    def _keep_alive():
+        """LLM_KEEP_ALIVE as Ollama expects it: seconds as a number, or a duration string such as '30m'"""
+        return int(LLM_KEEP_ALIVE) if LLM_KEEP_ALIVE.lstrip('-').isdigit() else LLM_KEEP_ALIVE
+    
+    def _repair_json_response(self, content: str, cleaned_text: str) -> Dict[str, Any]:
+        """
+        Extract and repair JSON from free-form LLM output (no schema constraint, or output that failed it)
+        
+        Args:
+            content: Raw LLM output
+            cleaned_text: Preprocessed receipt text (used for the store name if no JSON is found)
+            
+        Returns:
+            Parsed JSON dictionary (a minimal receipt if nothing could be recovered)
+        """
+        # Try to extract JSON
+        json_str = self._extract_json_from_response(content)
+        
+        # If no JSON found, try to create a basic structure
+        if not json_str or json_str.strip() == '':
+            print("No JSON found in response, creating basic structure")
+            # Extract store name using the dedicated method
+            store_name = self._extract_store_name(cleaned_text)
+            
+            # Create basic JSON structure
+            json_str = f'''{{
+                "store_name": "{store_name}",
+                "items": [],
+                "total": 0.0
+            }}'''
+        
+        # Parse and validate JSON
+        try:
+            parsed_data = json.loads(json_str)
+            print("LLM raw parsed_data:", parsed_data)
+        except json.JSONDecodeError as e:
+            print(f"JSON decode error: {e}")
+            # Try to fix truncated JSON
+            try:
+                # If JSON is truncated, try to complete it
+                if json_str.strip().endswith(','):
+                    json_str = json_str.rstrip(',') + ']}'
+                elif not json_str.strip().endswith('}'):
+                    json_str = json_str.rstrip() + '}'
+                
+                parsed_data = json.loads(json_str)
+                print("Fixed truncated JSON:", parsed_data)
+            except:
+                # Create fallback JSON
+                parsed_data = {
+                    "store_name": "Unknown Store",
+                    "items": [],
+                    "total": 0.0
+                }
+        
+        return parsed_data
+    
+    def _response_content(self, response) -> str:
+        """Message content of a (non-streaming) chat response"""
+        if isinstance(response, Iterator):
+            response = next(response)
+        return response['message']['content']
+    
+    def _stream_json_completion(self, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stream a chat completion and stop it as soon as the top-level JSON object closes
+        
+        Args:
+            messages: Chat messages
+            options: Ollama request options
+            
+        Returns:
+            Dictionary with the JSON text ('content', the raw output if the object never closed),
+            'complete', 'error' (why the stream was aborted, or None) and 'chunks' received
+        """
+        scanner = JsonObjectStream()
+        raw = []
+        stream = self.client.chat(model=self.model_name, messages=messages, options=options, stream=True,
+                                  **self._format_kwargs())
+        try:
+            for chunk in stream:
+                piece = chunk['message']['content'] or ''
+                raw.append(piece)
+                if scanner.feed(piece) or scanner.error:
+                    break
+        finally:
+            # Closing the stream drops the HTTP connection, which makes Ollama stop generating
+            stream.close()
+        return {
+            'content': scanner.text if scanner.complete else ''.join(raw),
+            'complete': scanner.complete,
+            'error': scanner.error,
+            'chunks': len(raw)
+        }
+    
     def _preprocess_text(self, text: str) -> str:
         """Preprocess OCR text for better LLM parsing"""
         # Remove excessive whitespace and normalize
@@ -742,14 +1041,17 @@ You must respond with valid JSON containing the store name, all products found,
         """Get information about the current model"""
         try:
             models = self.client.list()
+            available_models = self._model_names(models)
             current_model = next(
-                (model for model in models['models'] if model['name'] == self.model_name),
+                (model for model, name in zip(models['models'], available_models) if name == self.model_name),
                 None
             )
+            if hasattr(current_model, 'model_dump'):
+                current_model = current_model.model_dump(mode='json')
             
             return {
                 'model_name': self.model_name,
-                'available_models': [model['name'] for model in models['models']],
+                'available_models': available_models,
                 'current_model_info': current_model
             }
         except Exception as e:
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+from datetime import datetime
+from typing import Optional
+
+# A waiting status request holds a gthread worker thread, so both waits are short: SSE clients
+# reconnect after STATUS_RETRY_MS and carry on from the current status
+STATUS_MAX_WAIT = int(os.environ.get('STATUS_MAX_WAIT', '10'))  # longest long-poll, seconds
+STATUS_STREAM_TIMEOUT = int(os.environ.get('STATUS_STREAM_TIMEOUT', '10'))  # longest SSE stream, seconds
+STATUS_RETRY_MS = int(os.environ.get('STATUS_RETRY_MS', '1000'))  # SSE reconnect delay sent to clients
+STATUS_HEARTBEAT = int(os.environ.get('STATUS_HEARTBEAT', '5'))  # SSE keep-alive comment interval, seconds
+
+# Stages a receipt goes through, in order; 'saved' and 'failed' are final
+QUEUED = 'queued'
+PREPROCESS = 'preprocess'
+OCR = 'ocr'
+LLM = 'llm'
+SAVED = 'saved'
+FAILED = 'failed'
+FINAL_STAGES = (SAVED, FAILED)
+
+CHANNEL = 'receipt_pipeline:events:{receipt_id}'
+
+
+def set_status(receipt_id: int, stage: str, **details):
+    """Record a pipeline stage transition and publish it to the receipt's event channel"""
+    from queues import redis_conn
+    from tasks import PIPELINE_STATE_TTL, _state_key
+    status = dict(details, receipt_id=receipt_id, stage=stage, updated_at=datetime.utcnow().isoformat() + 'Z')
+    payload = json.dumps(status)
+    key = _state_key(receipt_id)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, 'status', payload)
+    pipe.expire(key, PIPELINE_STATE_TTL)
+    pipe.publish(CHANNEL.format(receipt_id=receipt_id), payload)
+    pipe.execute()
+
+
+def set_stage_job(receipt_id: int, job_id: str):
+    """Remember the RQ job running the receipt's current stage"""
+    from queues import redis_conn
+    from tasks import _state_key
+    redis_conn.hset(_state_key(receipt_id), 'rq_job', job_id)
+
+
+def get_status(receipt_id: int) -> Optional[dict]:
+    """
+    Current pipeline status of a receipt
+
+    A stage job that failed for good in RQ (retries exhausted) turns the status into 'failed'.
+
+    Returns:
+        Status dictionary, or None if there is no pipeline state (never queued, or expired)
+    """
+    from queues import redis_conn
+    from tasks import _state_key
+    raw_status, job_id = redis_conn.hmget(_state_key(receipt_id), 'status', 'rq_job')
+    if raw_status is None:
+        return None
+    status = json.loads(raw_status)
+    if status['stage'] not in FINAL_STAGES and job_id is not None:
+        from rq.job import Job
+        from rq.exceptions import NoSuchJobError
+        try:
+            job = Job.fetch(job_id.decode(), connection=redis_conn)
+            job_status = job.get_status()
+        except NoSuchJobError:
+            job_status = None
+        status['job_status'] = job_status
+        if job_status == 'failed':
+            error = (job.exc_info or '').strip().splitlines()
+            status.update(stage=FAILED, failed_stage=status['stage'], error=error[-1] if error else 'Job failed')
+    return status
+
+
+def _decode(message) -> Optional[dict]:
+    if message is None or message.get('type') != 'message':
+        return None
+    return json.loads(message['data'])
+
+
+def wait_for_change(receipt_id: int, since: Optional[str], timeout: float) -> Optional[dict]:
+    """
+    Long-poll: return the status once its stage differs from `since`, or when timeout expires
+
+    Returns:
+        Latest status (None if the receipt has no pipeline state)
+    """
+    from queues import redis_conn
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    # Subscribe before reading, so a transition between the two is not missed
+    pubsub.subscribe(CHANNEL.format(receipt_id=receipt_id))
+    try:
+        status = get_status(receipt_id)
+        deadline = time.monotonic() + timeout
+        while (status is not None and status['stage'] == since and status['stage'] not in FINAL_STAGES):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Nothing published; re-read in case RQ marked the stage job failed
+                status = get_status(receipt_id) or status
+                break
+            published = _decode(pubsub.get_message(timeout=min(remaining, 1.0)))
+            if published is not None:
+                status = published
+        return status
+    finally:
+        pubsub.close()
+
+
+def _event(status: dict) -> str:
+    status = dict(status, done=status.get('stage') in FINAL_STAGES)
+    return f"event: status\ndata: {json.dumps(status)}\n\n"
+
+
+def stream_events(receipt_id: int, fallback: Optional[dict] = None, timeout: float = STATUS_STREAM_TIMEOUT):
+    """
+    Server-Sent Events for a receipt: the current status, then each transition until a final stage
+
+    The stream ends after `timeout` seconds even if the receipt is still processing; the
+    `retry:` hint makes EventSource reconnect, and clients close it once an event has done=true.
+
+    Args:
+        receipt_id: Receipt to follow
+        fallback: Status to send if the receipt has no pipeline state (e.g. from the database)
+        timeout: Longest time to hold the connection, in seconds
+
+    Yields:
+        SSE-formatted chunks (retry hint, status events and keep-alive comments)
+    """
+    from queues import redis_conn
+    yield f"retry: {STATUS_RETRY_MS}\n\n"
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL.format(receipt_id=receipt_id))
+    try:
+        status = get_status(receipt_id)
+        if status is None:
+            yield _event(fallback or {'receipt_id': receipt_id, 'stage': None})
+            return
+        yield _event(status)
+        deadline = time.monotonic() + timeout
+        last_sent = time.monotonic()
+        while status['stage'] not in FINAL_STAGES and time.monotonic() < deadline:
+            published = _decode(pubsub.get_message(timeout=1.0))
+            if published is not None:
+                status = published
+                last_sent = time.monotonic()
+                yield _event(status)
+            elif time.monotonic() - last_sent >= STATUS_HEARTBEAT:
+                # Also picks up a failure RQ recorded without a published transition
+                status = get_status(receipt_id) or status
+                if status['stage'] == FAILED:
+                    yield _event(status)
+                    break
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+    finally:
+        pubsub.close()
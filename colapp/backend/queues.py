@@ -0,0 +1,23 @@
+import os
+from redis import Redis
+from rq import Queue
+
+# Redis connection (use Docker Compose service name)
+redis_host = os.environ.get('REDIS_HOST', 'redis')
+redis_port = int(os.environ.get('REDIS_PORT', 6379))
+redis_conn = Redis(host=redis_host, port=redis_port)
+
+# Default queue (kept so jobs enqueued by older releases still drain)
+q = Queue(connection=redis_conn)
+
+# Receipt pipeline stages, each on its own queue so workers can be scaled per bottleneck:
+#   preprocess -> ocr -> llm -> persist
+PREPROCESS_QUEUE = 'preprocess'
+OCR_QUEUE = 'ocr'
+LLM_QUEUE = 'llm'
+PERSIST_QUEUE = 'persist'
+
+preprocess_queue = Queue(PREPROCESS_QUEUE, connection=redis_conn)
+ocr_queue = Queue(OCR_QUEUE, connection=redis_conn)
+llm_queue = Queue(LLM_QUEUE, connection=redis_conn)
+persist_queue = Queue(PERSIST_QUEUE, connection=redis_conn)
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Where parse results are cached, and how many are kept for how long
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'auto')  # 'auto', 'redis', 'disk' or 'off'
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join('uploads', '.result_cache'))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '5000'))
+RESULT_CACHE_MAX_AGE = int(os.environ.get('RESULT_CACHE_MAX_AGE', str(30 * 24 * 3600)))  # 30 days
+
+REDIS_KEY_PREFIX = 'receipt_cache:'
+REDIS_INDEX_KEY = 'receipt_cache:index'
+REDIS_STATS_KEY = 'receipt_cache:stats'
+
+
+def hash_file(file_path: str, chunk_size: int = 65536) -> str:
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_digest: str, model_name: str, prompt_version: str, ocr_config: str) -> str:
+    """
+    Build a cache key for a parsed receipt
+
+    Args:
+        image_digest: SHA-256 of the image bytes
+        model_name: LLM model used for parsing
+        prompt_version: Version of the parsing prompt
+        ocr_config: Signature of the OCR configuration
+
+    Returns:
+        Hex digest identifying this (image, model, prompt, OCR) combination
+    """
+    material = '\n'.join([image_digest, model_name or '', prompt_version or '', ocr_config or ''])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class _DiskBackend:
+    """
+    Stores cache entries as JSON files in a local directory
+
+    A file's modification time is when the entry was stored (expiry, like SETEX in Redis);
+    its access time is set on every hit and orders size-based eviction (like the Redis index).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str, max_age: int) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            stored_at = os.stat(path).st_mtime
+            if max_age and time.time() - stored_at > max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Record the use for least-recently-used eviction without changing the stored time
+            os.utime(path, (time.time(), stored_at))
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, entry: Dict[str, Any], max_entries: int, max_age: int):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self._evict(max_entries, max_age)
+
+    def _evict(self, max_entries: int, max_age: int):
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if max_age and now - stat.st_mtime > max_age:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_atime, path))
+            if max_entries and len(entries) > max_entries:
+                entries.sort()
+                for _, path in entries[:len(entries) - max_entries]:
+                    self._remove(path)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self._stats['evictions'] += 1
+        except OSError:
+            pass
+
+    def incr(self, counter: str):
+        self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['entries'] = sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+        return stats
+
+
+class _RedisBackend:
+    """Stores cache entries in Redis, shared by the API and all workers"""
+
+    def __init__(self, connection):
+        self.redis = connection
+
+    def get(self, key: str, max_age: int) -> Optional[Dict[str, Any]]:
+        raw = self.redis.get(REDIS_KEY_PREFIX + key)
+        if raw is None:
+            return None
+        # Track recency in a sorted set so size-based eviction drops the least recently used entries
+        self.redis.zadd(REDIS_INDEX_KEY, {key: time.time()})
+        return json.loads(raw)
+
+    def set(self, key: str, entry: Dict[str, Any], max_entries: int, max_age: int):
+        pipe = self.redis.pipeline()
+        if max_age:
+            pipe.setex(REDIS_KEY_PREFIX + key, max_age, json.dumps(entry))
+        else:
+            pipe.set(REDIS_KEY_PREFIX + key, json.dumps(entry))
+        pipe.zadd(REDIS_INDEX_KEY, {key: time.time()})
+        if max_age:
+            # Entries older than max_age have already expired; drop them from the index
+            pipe.zremrangebyscore(REDIS_INDEX_KEY, 0, time.time() - max_age)
+        pipe.execute()
+        self._evict(max_entries)
+
+    def _evict(self, max_entries: int):
+        if not max_entries:
+            return
+        overflow = self.redis.zcard(REDIS_INDEX_KEY) - max_entries
+        if overflow <= 0:
+            return
+        stale = self.redis.zrange(REDIS_INDEX_KEY, 0, overflow - 1)
+        if stale:
+            pipe = self.redis.pipeline()
+            for key in stale:
+                key = key.decode('utf-8') if isinstance(key, bytes) else key
+                pipe.delete(REDIS_KEY_PREFIX + key)
+            pipe.zrem(REDIS_INDEX_KEY, *stale)
+            pipe.hincrby(REDIS_STATS_KEY, 'evictions', len(stale))
+            pipe.execute()
+
+    def incr(self, counter: str):
+        self.redis.hincrby(REDIS_STATS_KEY, counter, 1)
+
+    def stats(self) -> Dict[str, int]:
+        raw = self.redis.hgetall(REDIS_STATS_KEY)
+        stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        for name, value in raw.items():
+            name = name.decode('utf-8') if isinstance(name, bytes) else name
+            stats[name] = int(value)
+        stats['entries'] = self.redis.zcard(REDIS_INDEX_KEY)
+        return stats
+
+
+class ReceiptResultCache:
+    """Content-addressed cache of OCR text and parsed receipt data"""
+
+    def __init__(self, backend: str = RESULT_CACHE_BACKEND, directory: str = RESULT_CACHE_DIR,
+                 max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_age: int = RESULT_CACHE_MAX_AGE,
+                 redis_connection=None):
+        """
+        Initialize the result cache
+
+        Args:
+            backend: 'redis', 'disk', 'auto' (Redis if reachable, else disk) or 'off'
+            directory: Directory used by the disk backend
+            max_entries: Maximum number of cached receipts (0 = unbounded)
+            max_age: Maximum entry age in seconds (0 = no expiry)
+            redis_connection: Optional existing Redis connection
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.backend_name = 'off'
+        self._backend = None
+
+        if backend == 'off':
+            return
+
+        if backend in ('redis', 'auto'):
+            try:
+                if redis_connection is None:
+                    from redis import Redis
+                    redis_connection = Redis(
+                        host=os.environ.get('REDIS_HOST', 'redis'),
+                        port=int(os.environ.get('REDIS_PORT', 6379)),
+                        socket_connect_timeout=2
+                    )
+                redis_connection.ping()
+                self._backend = _RedisBackend(redis_connection)
+                self.backend_name = 'redis'
+                return
+            except Exception as e:
+                if backend == 'redis':
+                    logger.warning(f"Redis result cache unavailable: {e}")
+                    return
+                logger.info(f"Redis not reachable for result cache, using disk cache: {e}")
+
+        try:
+            self._backend = _DiskBackend(directory)
+            self.backend_name = 'disk'
+        except OSError as e:
+            logger.warning(f"Disk result cache unavailable: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self._backend is not None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached entry
+
+        Returns:
+            Dictionary with 'ocr_text' and 'result', or None on a miss
+        """
+        if not self.enabled:
+            return None
+        try:
+            entry = self._backend.get(key, self.max_age)
+            self._backend.incr('hits' if entry is not None else 'misses')
+            return entry
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            return None
+
+    def set(self, key: str, ocr_text: str, result: Dict[str, Any]):
+        """Store the OCR text and parsed result for a cache key"""
+        if not self.enabled:
+            return
+        try:
+            entry = {'ocr_text': ocr_text, 'result': result, 'stored_at': time.time()}
+            self._backend.set(key, entry, self.max_entries, self.max_age)
+            self._backend.incr('stores')
+        except Exception as e:
+            logger.warning(f"Result cache store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the cache"""
+        if not self.enabled:
+            return {'backend': 'off'}
+        try:
+            stats = self._backend.stats()
+        except Exception as e:
+            return {'backend': self.backend_name, 'error': str(e)}
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = round(stats.get('hits', 0) / lookups, 3) if lookups else 0.0
+        stats['backend'] = self.backend_name
+        return stats
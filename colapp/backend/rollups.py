@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Per-user spending rollups behind /dashboard-stats.
+
+ReceiptRollup holds receipt count and spend per (user, month, store) and
+CategoryRollup holds item count and spend per (user, month, category). Every
+code path that creates, edits or deletes a receipt takes a snapshot() of the
+receipt before and after the change and calls apply_change() in the same
+transaction, so dashboard reads only scan the rollup buckets.
+
+Usage:
+    python rollups.py rebuild [--user-id 42]   # backfill / repair from receipts
+    python rollups.py verify [--user-id 42]    # compare rollups with a full scan
+"""
+
+import sys
+import argparse
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, extract
+from models import db, User, Receipt, ReceiptItem, ReceiptRollup, CategoryRollup
+
+STORE = 'store'
+CATEGORY = 'category'
+
+
+def _month(receipt_date):
+    if hasattr(receipt_date, 'strftime'):
+        return receipt_date.strftime('%Y-%m')
+    return str(receipt_date)[:7] if receipt_date else 'unknown'
+
+
+def _money(value):
+    try:
+        return Decimal(str(value)) if value is not None else Decimal('0')
+    except InvalidOperation:
+        return Decimal('0')
+
+
+def snapshot(receipt, items=None):
+    """
+    Describe what a receipt contributes to the rollups
+
+    Args:
+        receipt: Receipt (pending or persistent)
+        items: The receipt's items; defaults to receipt.items. Pass the new items explicitly
+            after a bulk delete/re-add, since receipt.items is stale then
+
+    Returns:
+        Dictionary of bucket key -> (count, amount)
+    """
+    month = _month(receipt.receipt_date)
+    contribution = {(STORE, month, receipt.store_name): (1, _money(receipt.total_amount))}
+    for item in (receipt.items if items is None else items):
+        key = (CATEGORY, month, item.category or 'Other')
+        count, amount = contribution.get(key, (0, Decimal('0')))
+        contribution[key] = (count + 1, amount + _money(item.price))
+    return contribution
+
+
+def apply_change(user_id, before, after):
+    """
+    Add the difference between two snapshots to the user's rollups (caller commits)
+
+    Args:
+        user_id: Owner of the receipt
+        before: snapshot() before the change ({} for a new receipt)
+        after: snapshot() after the change ({} for a deleted receipt)
+    """
+    for key in set(before) | set(after):
+        old_count, old_amount = before.get(key, (0, Decimal('0')))
+        new_count, new_amount = after.get(key, (0, Decimal('0')))
+        delta_count, delta_amount = new_count - old_count, new_amount - old_amount
+        if not delta_count and not delta_amount:
+            continue
+
+        kind, month, name = key
+        if kind == STORE:
+            _upsert(ReceiptRollup, {'user_id': user_id, 'month': month, 'store_name': name},
+                    'receipt_count', 'total_amount', delta_count, delta_amount)
+        else:
+            _upsert(CategoryRollup, {'user_id': user_id, 'month': month, 'category': name},
+                    'item_count', 'total_price', delta_count, delta_amount)
+
+
+def _upsert(model, bucket, count_column, amount_column, delta_count, delta_amount):
+    """
+    Add deltas to one rollup bucket with INSERT ... ON CONFLICT DO UPDATE
+
+    Concurrent receipts in a bucket that does not exist yet (e.g. the first upload of a month,
+    or 'Processing...' after it emptied) are serialized by the primary key instead of racing
+    to insert it. A bucket whose count drops to zero is deleted.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    table = model.__table__
+    statement = insert(table).values(**bucket, **{count_column: delta_count, amount_column: delta_amount})
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=list(bucket),
+        set_={
+            count_column: table.c[count_column] + statement.excluded[count_column],
+            amount_column: table.c[amount_column] + statement.excluded[amount_column],
+        }
+    ))
+    if delta_count < 0:
+        db.session.execute(table.delete().where(
+            *(table.c[column] == value for column, value in bucket.items()), table.c[count_column] <= 0
+        ))
+
+
+def dashboard_stats(user_id):
+    """Dashboard totals and breakdowns read from the rollups (cost grows with buckets, not receipts)"""
+    receipt_count, total_spent = db.session.query(
+        func.sum(ReceiptRollup.receipt_count), func.sum(ReceiptRollup.total_amount)
+    ).filter(ReceiptRollup.user_id == user_id).one()
+
+    category_rows = db.session.query(
+        CategoryRollup.category, func.sum(CategoryRollup.total_price)
+    ).filter(CategoryRollup.user_id == user_id).group_by(CategoryRollup.category).all()
+
+    monthly_rows = db.session.query(
+        ReceiptRollup.month, func.sum(ReceiptRollup.total_amount)
+    ).filter(ReceiptRollup.user_id == user_id).group_by(ReceiptRollup.month).all()
+
+    store_rows = db.session.query(
+        ReceiptRollup.store_name, func.sum(ReceiptRollup.total_amount)
+    ).filter(ReceiptRollup.user_id == user_id).group_by(ReceiptRollup.store_name).all()
+
+    return {
+        "total_receipts": int(receipt_count or 0),
+        "total_spent": float(total_spent or 0),
+        "category_breakdown": {category: float(total) for category, total in category_rows},
+        "monthly_spending": {month: float(total) for month, total in monthly_rows},
+        "store_breakdown": {store: float(total) for store, total in store_rows}
+    }
+
+
+def rebuild(user_id=None, session=None):
+    """
+    Recompute rollups from the receipt and item tables
+
+    Args:
+        user_id: Only rebuild this user's rollups (default: everyone)
+        session: Session to write with; it is only flushed, not committed (default: db.session, committed)
+
+    Returns:
+        Number of rollup rows written
+    """
+    own_session = session is None
+    session = session or db.session
+    year = extract('year', Receipt.receipt_date)
+    month = extract('month', Receipt.receipt_date)
+
+    receipt_query = session.query(
+        Receipt.user_id, year, month, Receipt.store_name, func.count(Receipt.id), func.sum(Receipt.total_amount)
+    )
+    category_query = session.query(
+        Receipt.user_id, year, month, func.coalesce(ReceiptItem.category, 'Other'),
+        func.count(ReceiptItem.id), func.sum(ReceiptItem.price)
+    ).join(Receipt, ReceiptItem.receipt_id == Receipt.id)
+    receipt_rollups = session.query(ReceiptRollup)
+    category_rollups = session.query(CategoryRollup)
+    if user_id is not None:
+        receipt_query = receipt_query.filter(Receipt.user_id == user_id)
+        category_query = category_query.filter(Receipt.user_id == user_id)
+        receipt_rollups = receipt_rollups.filter_by(user_id=user_id)
+        category_rollups = category_rollups.filter_by(user_id=user_id)
+
+    receipt_rollups.delete(synchronize_session=False)
+    category_rollups.delete(synchronize_session=False)
+
+    written = 0
+    for owner, y, m, store, count, total in receipt_query.group_by(Receipt.user_id, year, month, Receipt.store_name):
+        session.add(ReceiptRollup(owner, f"{int(y):04d}-{int(m):02d}", store, count, total or 0))
+        written += 1
+    for owner, y, m, category, count, total in category_query.group_by(
+            Receipt.user_id, year, month, func.coalesce(ReceiptItem.category, 'Other')):
+        session.add(CategoryRollup(owner, f"{int(y):04d}-{int(m):02d}", category, count, total or 0))
+        written += 1
+    if own_session:
+        session.commit()
+    else:
+        session.flush()
+    return written
+
+
+def verify(user_id=None):
+    """
+    Compare rollup-based dashboard stats with a full scan
+
+    Returns:
+        List of user IDs whose rollups are out of date
+    """
+    from app import compute_dashboard_stats
+    user_ids = [user_id] if user_id is not None else [uid for (uid,) in db.session.query(User.id)]
+    stale = []
+    for uid in user_ids:
+        expected = compute_dashboard_stats(uid)
+        actual = dashboard_stats(uid)
+        # Rollups file items without a category under 'Other'
+        if None in expected['category_breakdown']:
+            other = expected['category_breakdown'].pop(None)
+            expected['category_breakdown']['Other'] = expected['category_breakdown'].get('Other', 0) + other
+        if not _stats_match(expected, actual):
+            stale.append(uid)
+    return stale
+
+
+def _stats_match(a, b):
+    if a['total_receipts'] != b['total_receipts'] or abs(a['total_spent'] - b['total_spent']) > 0.005:
+        return False
+    for key in ('category_breakdown', 'monthly_spending', 'store_breakdown'):
+        if set(a[key]) != set(b[key]) or any(abs(a[key][k] - b[key][k]) > 0.005 for k in a[key]):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the dashboard spending rollups')
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--user-id', type=int, help='Only this user (default: all users)')
+    args = parser.parse_args()
+
+    from app import app  # Import here to avoid circular import
+    import migrate
+    with app.app_context():
+        migrate.upgrade()  # Creates the rollup tables on databases that predate them
+        if args.command == 'rebuild':
+            written = rebuild(args.user_id)
+            print(f"Rebuilt rollups: {written} rows")
+        else:
+            stale = verify(args.user_id)
+            if stale:
+                print(f"Rollups out of date for users: {stale} (run: python rollups.py rebuild)")
+                sys.exit(1)
+            print("Rollups match receipts")
+
+
+if __name__ == '__main__':
+    main()
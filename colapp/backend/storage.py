@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import logging
+import mimetypes
+import threading
+from importlib.util import find_spec
+from typing import Optional
+from flask import send_from_directory, send_file, request, Response
+
+# Optional S3 support: only needed with STORAGE_BACKEND=s3 (boto3 is slow to import, so S3Storage imports it)
+BOTO3_AVAILABLE = find_spec('boto3') is not None
+
+logger = logging.getLogger(__name__)
+
+# Where receipt images live: a directory shared by the API and workers, or an S3 bucket
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')  # local | s3
+UPLOAD_FOLDER = os.path.normpath(os.environ.get('UPLOAD_FOLDER', 'uploads'))
+S3_BUCKET = os.environ.get('S3_BUCKET', 'colapp-receipts')
+S3_PREFIX = os.environ.get('S3_PREFIX', 'uploads/')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://minio:9000; unset for AWS
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+S3_CREATE_BUCKET = os.environ.get('S3_CREATE_BUCKET', 'true').lower() == 'true'
+STORAGE_CACHE_DIR = os.path.normpath(os.environ.get('STORAGE_CACHE_DIR', '/tmp/colapp-storage'))
+
+
+class LocalStorage:
+    """Receipt images in a directory shared by the API and the workers"""
+
+    def __init__(self, root: str = UPLOAD_FOLDER):
+        # Absolute, so send_from_directory (relative to app.root_path) and save/fetch (relative to the
+        # working directory) agree on where the files are
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def staging_path(self, key: str) -> str:
+        """Local path to write a new file to before save()"""
+        return self._path(key)
+
+    def save(self, key: str, local_path: str):
+        """Store local_path under key (the local file is consumed)"""
+        if os.path.abspath(local_path) != os.path.abspath(self._path(key)):
+            shutil.move(local_path, self._path(key))
+
+    def fetch(self, key: str) -> Optional[str]:
+        """Local path of the object, or None if it does not exist; pass it to evict() when done"""
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def evict(self, local_path: str):
+        """Drop the local copy returned by fetch() (nothing to do: the file is the object)"""
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def send(self, key: str, max_age: int) -> Response:
+        """Flask response serving the object with an ETag, honouring conditional requests"""
+        return send_from_directory(self.root, key, max_age=max_age)
+
+
+class S3Storage:
+    """Receipt images in an S3-compatible bucket (AWS S3, MinIO, ...), fetched by key on any node"""
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 cache_dir: str = STORAGE_CACHE_DIR):
+        if not BOTO3_AVAILABLE:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        if S3_CREATE_BUCKET:
+            self._ensure_bucket()
+
+    def _ensure_bucket(self):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=self.bucket)
+            logger.info(f"Created bucket {self.bucket}")
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def staging_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def save(self, key: str, local_path: str):
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        try:
+            self.client.upload_file(local_path, self.bucket, self._object_key(key),
+                                    ExtraArgs={'ContentType': content_type})
+        finally:
+            os.remove(local_path)
+
+    def fetch(self, key: str) -> Optional[str]:
+        """Download the object to a copy of this caller's own (concurrent fetches of a key do not share it)"""
+        from botocore.exceptions import ClientError
+        fd, path = tempfile.mkstemp(dir=self.cache_dir, suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._object_key(key), path)
+        except ClientError as e:
+            self.evict(path)
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None
+            raise
+        except Exception:
+            self.evict(path)
+            raise
+        return path
+
+    def evict(self, local_path: str):
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def send(self, key: str, max_age: int) -> Response:
+        """Stream the object through the API, so access stays behind the app's authentication"""
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return Response(status=404)
+        etag = head['ETag'].strip('"')
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.cache_control.max_age = max_age
+            return response
+        body = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+        return send_file(body, mimetype=head.get('ContentType'), etag=etag, max_age=max_age,
+                         last_modified=head.get('LastModified'), download_name=key)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Process-wide storage backend selected by STORAGE_BACKEND"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == 's3':
+                    _storage = S3Storage()
+                else:
+                    _storage = LocalStorage()
+    return _storage
@@ -1,56 +1,423 @@
 from models import Receipt, ReceiptItem
-from enhanced_receipt_parser import EnhancedReceiptParser
+import rollups
+from duplicates import find_duplicate_receipt
+from image_derivatives import store_derivatives, discard_original
+from storage import get_storage
+import pipeline_status
+from rq import Retry
+from datetime import datetime, timedelta
 import os
+import json
+import time
+import threading
+
+# Intermediate stage results live in Redis so a retry restarts at the failed stage
+PIPELINE_STATE_TTL = int(os.environ.get('PIPELINE_STATE_TTL', str(24 * 3600)))
+PIPELINE_MAX_RETRIES = int(os.environ.get('PIPELINE_MAX_RETRIES', '3'))
+RQ_JOB_TIMEOUT = int(os.environ.get('RQ_JOB_TIMEOUT', '300'))
+
+# LLM batching: an LLM job also parses up to LLM_BATCH_SIZE - 1 other receipts whose OCR has
+# finished, waiting at most LLM_BATCH_WAIT_MS for the batch to fill. A size of 1 disables batching.
+LLM_BATCH_SIZE = int(os.environ.get('LLM_BATCH_SIZE', '1'))
+LLM_BATCH_WAIT_MS = int(os.environ.get('LLM_BATCH_WAIT_MS', '500'))
+LLM_RETRY_DELAY = int(os.environ.get('LLM_RETRY_DELAY', '30'))
+LLM_PENDING_KEY = 'receipt_pipeline:llm_pending'
+
+# Workers reuse one parser (Ollama client, OCR engine, result cache) across jobs. A parser built while
+# Ollama was unreachable has no LLM; it is rebuilt at most every PARSER_RETRY_INTERVAL seconds.
+PARSER_RETRY_INTERVAL = int(os.environ.get('PARSER_RETRY_INTERVAL', '60'))
+
+_parser = None
+_parser_created_at = 0.0
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """Return the process-wide EnhancedReceiptParser, creating it on first use"""
+    global _parser, _parser_created_at
+    with _parser_lock:
+        retry_llm = (_parser is not None and _parser.llm_service is None
+                     and time.monotonic() - _parser_created_at >= PARSER_RETRY_INTERVAL)
+        if _parser is None or retry_llm:
+            from enhanced_receipt_parser import EnhancedReceiptParser  # Slow import (ollama, pydantic, OCR), not needed to enqueue
+            _parser = EnhancedReceiptParser()
+            _parser_created_at = time.monotonic()
+    return _parser
+
+
+def get_ocr_service():
+    """Return the shared parser's OCRService (one is created if the parser could not build it)"""
+    parser = get_parser()
+    if parser.ocr_service is None:
+        from ocr_service import OCRService
+        parser.ocr_service = OCRService()
+    return parser.ocr_service
+
+
+def _state_key(receipt_id):
+    return f"receipt_pipeline:{receipt_id}"
+
+
+def save_stage_output(receipt_id, stage, data):
+    """Store the output of a pipeline stage for the next stage to pick up"""
+    from queues import redis_conn
+    key = _state_key(receipt_id)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, stage, json.dumps(data))
+    pipe.expire(key, PIPELINE_STATE_TTL)
+    pipe.execute()
+
+
+def load_stage_output(receipt_id, stage):
+    """Return the stored output of a pipeline stage, or None if it has not completed"""
+    from queues import redis_conn
+    raw = redis_conn.hget(_state_key(receipt_id), stage)
+    return json.loads(raw) if raw is not None else None
+
+
+def _enqueue_stage(queue, func, receipt_id):
+    job = queue.enqueue(
+        func, receipt_id,
+        retry=Retry(max=PIPELINE_MAX_RETRIES, interval=[10, 30, 60]),
+        job_timeout=RQ_JOB_TIMEOUT
+    )
+    # Lets the status endpoint report a stage whose retries are exhausted as failed
+    pipeline_status.set_stage_job(receipt_id, job.id)
+
+
+def start_pipeline(receipt_id, image_key, parsing_method='auto', image_sha256=None):
+    """Reset any previous pipeline state for the receipt and enqueue the first stage"""
+    from queues import redis_conn, preprocess_queue
+    redis_conn.delete(_state_key(receipt_id))
+    save_stage_output(receipt_id, 'job', {
+        'image_key': image_key,
+        'parsing_method': parsing_method,
+        'image_sha256': image_sha256
+    })
+    pipeline_status.set_status(receipt_id, pipeline_status.QUEUED)
+    _enqueue_stage(preprocess_queue, preprocess_stage, receipt_id)
+
 
 def process_receipt(receipt_id, filepath, parsing_method):
+    """Entry point kept for jobs enqueued on the default queue by older releases"""
+    start_pipeline(receipt_id, os.path.basename(filepath), parsing_method)
+
+
+def _image_key(state):
+    """Storage key of a stage's image (state saved by older releases holds a local path instead)"""
+    return state.get('image_key') or os.path.basename(os.path.normpath(state['filepath']))
+
+
+def _preprocessed_key(image_key):
+    stem, _ = os.path.splitext(image_key)
+    return f"{stem}.prep.png"
+
+
+def preprocess_stage(receipt_id):
+    """Short-circuit to persist on a result cache hit, otherwise clean up the image for OCR"""
+    from queues import ocr_queue, persist_queue
+    job = load_stage_output(receipt_id, 'job')
+    if job is None:
+        print(f"No pipeline state for receipt {receipt_id}, skipping")
+        return
+    pipeline_status.set_status(receipt_id, pipeline_status.PREPROCESS)
+    storage = get_storage()
+    image_key = _image_key(job)
+    filepath = storage.fetch(image_key)
+    if filepath is None:
+        save_stage_output(receipt_id, 'parse', {
+            'success': False,
+            'error': f'File not found: {image_key}',
+            'method': 'none'
+        })
+        _enqueue_stage(persist_queue, persist_stage, receipt_id)
+        return
+
+    try:
+        # Archive copy, preview and thumbnail for the app, so it never has to download the original
+        started = time.perf_counter()
+        derivatives = store_derivatives(storage, image_key, filepath)
+        if derivatives:
+            print(f"Created {', '.join(derivatives)} for receipt {receipt_id} in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+        parser = get_parser()
+        # The upload hash was computed while the file was written; no need to re-read it
+        cache_key = parser.cache_key_for(filepath, job.get('image_sha256'), job.get('parsing_method', 'auto'))
+        cached = parser.get_cached_result(cache_key)
+        if cached is not None:
+            save_stage_output(receipt_id, 'parse', cached)
+            _enqueue_stage(persist_queue, persist_stage, receipt_id)
+            return
+
+        output = {'image_key': image_key, 'cache_key': cache_key, 'preprocessed': False, 'timings': {}}
+        ocr_service = get_ocr_service()
+        prep_key = _preprocessed_key(image_key)
+        prep_result = ocr_service.preprocess(filepath, storage.staging_path(prep_key))
+    finally:
+        storage.evict(filepath)
+    if prep_result.get('success'):
+        # Stored like the upload, so the OCR stage can run on another node
+        storage.save(prep_key, prep_result['path'])
+        output.update(image_key=prep_key, preprocessed=True, timings=prep_result['timings'])
+        print(f"Preprocessed receipt {receipt_id} in {sum(prep_result['timings'].values()):.0f}ms: {prep_result['timings']}")
+    else:
+        # OCR the original image rather than failing the receipt
+        print(f"Preprocessing failed for receipt {receipt_id}, using original image: {prep_result.get('error')}")
+    save_stage_output(receipt_id, 'preprocess', output)
+    _enqueue_stage(ocr_queue, ocr_stage, receipt_id)
+
+
+def ocr_stage(receipt_id):
+    """Run Tesseract on the preprocessed image, then the cheap parser tiers; only receipts they can't parse go to the LLM"""
+    from queues import redis_conn, llm_queue, persist_queue
+    ocr_output = load_stage_output(receipt_id, 'ocr')
+    if ocr_output is None:
+        preprocessed = load_stage_output(receipt_id, 'preprocess')
+        if preprocessed is None:
+            print(f"Preprocess output missing for receipt {receipt_id}, skipping")
+            return
+        pipeline_status.set_status(receipt_id, pipeline_status.OCR)
+        storage = get_storage()
+        image_key = _image_key(preprocessed)
+        filepath = storage.fetch(image_key)
+        if filepath is None:
+            ocr_result = {'success': False, 'error': f'File not found: {image_key}'}
+        else:
+            try:
+                ocr_result = get_ocr_service().extract_text(filepath, preprocess=not preprocessed.get('preprocessed'))
+            finally:
+                storage.evict(filepath)
+        print("OCR result:", ocr_result)
+        if not ocr_result.get('success'):
+            save_stage_output(receipt_id, 'parse', {
+                'success': False,
+                'error': 'OCR failed to extract text',
+                'method': 'offline_llm'
+            })
+            _enqueue_stage(persist_queue, persist_stage, receipt_id)
+            return
+        ocr_output = {'text': ocr_result['text'], 'timings': ocr_result.get('timings', {})}
+        save_stage_output(receipt_id, 'ocr', ocr_output)
+    if load_stage_output(receipt_id, 'parse') is not None:
+        _enqueue_persist_once(receipt_id)
+        return
+
+    # Heuristic and regex tiers take microseconds: run them here on the CPU workers so receipts they
+    # parse confidently never wait behind Ollama calls on the LLM workers
+    job = load_stage_output(receipt_id, 'job') or {}
+    parser = get_parser()
+    parsed_data, _ = parser.route_cheap_tiers(ocr_output['text'], job.get('parsing_method', 'auto'))
+    if parsed_data is not None:
+        print(f"Parsed receipt {receipt_id} with the {parsed_data['parse_tier']} tier "
+              f"(confidence {parsed_data['confidence']}), skipping the LLM")
+        preprocessed = load_stage_output(receipt_id, 'preprocess') or {}
+        parser.store_cached_result(preprocessed.get('cache_key'), parsed_data, ocr_output['text'])
+        save_stage_output(receipt_id, 'parse', parsed_data)
+        _enqueue_persist_once(receipt_id)
+        return
+
+    # Mark the receipt as waiting for the LLM so a batch can pick it up (once, also on a retry)
+    pipe = redis_conn.pipeline()
+    pipe.lrem(LLM_PENDING_KEY, 0, receipt_id)
+    pipe.rpush(LLM_PENDING_KEY, receipt_id)
+    pipe.execute()
+    pipeline_status.set_status(receipt_id, pipeline_status.LLM)
+    _enqueue_stage(llm_queue, llm_parse_stage, receipt_id)
+
+
+def _batch_key(job_id):
+    return f"receipt_pipeline:llm_batch:{job_id}"
+
+
+def _claim_llm_batch(receipt_id):
+    """
+    Claim this receipt plus other receipts waiting for the LLM
+
+    A receipt ID in the pending list is not owned by any job; whoever removes it owns it.
+    The claimed IDs are recorded under the RQ job ID, so when RQ retries the job after an
+    exception or timeout the retry takes over the same receipts instead of finding them gone.
+
+    Returns:
+        List of receipt IDs this job must parse (empty if another batch already claimed ours)
+    """
+    from queues import redis_conn
+    from rq import get_current_job
+    job = get_current_job()
+    batch_key = _batch_key(job.id) if job is not None else None
+    if batch_key is not None:
+        claimed = redis_conn.get(batch_key)
+        if claimed is not None:
+            return [batch_id for batch_id in json.loads(claimed) if load_stage_output(batch_id, 'parse') is None]
+    if not redis_conn.lrem(LLM_PENDING_KEY, 0, receipt_id):
+        return []
+    batch = [receipt_id]
+    if batch_key is not None:
+        redis_conn.set(batch_key, json.dumps(batch), ex=PIPELINE_STATE_TTL)
+    deadline = time.monotonic() + LLM_BATCH_WAIT_MS / 1000.0
+    while len(batch) < LLM_BATCH_SIZE:
+        raw = redis_conn.lpop(LLM_PENDING_KEY)
+        if raw is not None:
+            other_id = int(raw)
+            if other_id not in batch:
+                batch.append(other_id)
+                if batch_key is not None:
+                    redis_conn.set(batch_key, json.dumps(batch), ex=PIPELINE_STATE_TTL)
+            continue
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.05)
+    return batch
+
+
+def _enqueue_persist_once(receipt_id):
+    """Enqueue the persist stage unless a job (a batch, or the receipt's own LLM job) already did"""
+    from queues import redis_conn, persist_queue
+    if redis_conn.hsetnx(_state_key(receipt_id), 'persist_enqueued', 1):
+        _enqueue_stage(persist_queue, persist_stage, receipt_id)
+
+
+def llm_parse_stage(receipt_id):
+    """Parse the OCR text with the LLM, batched with other waiting receipts; OCR is not re-run on retry"""
+    from queues import redis_conn, llm_queue
+    from rq import get_current_job
+    if load_stage_output(receipt_id, 'parse') is not None:
+        # Parsed by another job's batch, or by an earlier attempt of this one
+        _enqueue_persist_once(receipt_id)
+        return
+
+    batch = _claim_llm_batch(receipt_id)
+    texts = {}
+    for batch_id in batch:
+        ocr_output = load_stage_output(batch_id, 'ocr')
+        if ocr_output is None:
+            print(f"OCR output missing for receipt {batch_id}, skipping")
+            continue
+        texts[batch_id] = ocr_output['text']
+    if not texts:
+        return
+
+    print(f"Parsing {len(texts)} receipt(s): {list(texts)}")
+    methods = {batch_id: (load_stage_output(batch_id, 'job') or {}).get('parsing_method', 'auto') for batch_id in texts}
+    parser = get_parser()
+    results = parser.parse_ocr_texts(texts, methods)
+
+    for batch_id, parsed_data in results.items():
+        # Retry later while the LLM is unreachable instead of saving an empty receipt
+        if parsed_data.get('degraded'):
+            attempts = redis_conn.hincrby(_state_key(batch_id), 'llm_attempts', 1)
+            if attempts <= PIPELINE_MAX_RETRIES:
+                print(f"LLM unavailable for receipt {batch_id}, retry {attempts} in {LLM_RETRY_DELAY}s")
+                pipeline_status.set_status(batch_id, pipeline_status.LLM, retry=attempts)
+                redis_conn.rpush(LLM_PENDING_KEY, batch_id)
+                llm_queue.enqueue_in(timedelta(seconds=LLM_RETRY_DELAY), llm_parse_stage, batch_id,
+                                     job_timeout=RQ_JOB_TIMEOUT)
+                continue
+
+        preprocessed = load_stage_output(batch_id, 'preprocess') or {}
+        parser.store_cached_result(preprocessed.get('cache_key'), parsed_data, texts[batch_id])
+        save_stage_output(batch_id, 'parse', parsed_data)
+        _enqueue_persist_once(batch_id)
+
+    job = get_current_job()
+    if job is not None:
+        redis_conn.delete(_batch_key(job.id))
+
+
+def persist_stage(receipt_id):
+    """Write the parsed receipt and its items to the database"""
+    parsed_data = load_stage_output(receipt_id, 'parse')
+    if parsed_data is None:
+        print(f"Parse output missing for receipt {receipt_id}, skipping")
+        return
     from app import app, db  # Import here to avoid circular import
-    filepath = os.path.normpath(filepath)
     with app.app_context():
         receipt = Receipt.query.get(receipt_id)
         if not receipt:
+            pipeline_status.set_status(receipt_id, pipeline_status.FAILED, error='Receipt was deleted')
             return
-        parser = EnhancedReceiptParser()
-        parsed_data = parser.parse_receipt(filepath, method=parsing_method)
-        print("RAW/PARSED DATA DEBUG:")
-        print("Raw output:", getattr(parser, 'last_raw_output', None))
-        print("Parsed data:", parsed_data)
-        items = parsed_data.get('data', {}).get('items', [])
-        receipt_data = parsed_data.get('data', {})
-        print("Items to save:", items)
-        # Update receipt fields from parsed data
-        store_name = receipt_data.get('store_name', 'Unknown Store')
-        print(f"Original store name length: {len(store_name)}")
-        print(f"Original store name: {store_name}")
-        
-        # Truncate store name to fit database field (200 characters)
-        if store_name and len(store_name) > 200:
-            store_name = store_name[:197] + "..."
-            print(f"Truncated store name length: {len(store_name)}")
-            print(f"Truncated store name: {store_name}")
-        
-        receipt.store_name = store_name
-        receipt.total_amount = receipt_data.get('total', 0.0)
-        receipt.ocr_processed = True
-        db.session.commit()
-        # Remove old items if any
-        ReceiptItem.query.filter_by(receipt_id=receipt.id).delete()
-        for item_data in items:
-            # Truncate product name and category to fit database fields
-            product_name = item_data.get('name', '')
-            if product_name and len(product_name) > 200:
-                product_name = product_name[:197] + "..."
-            
-            category = item_data.get('category', 'Other')
-            if category and len(category) > 100:
-                category = category[:97] + "..."
-            
-            item = ReceiptItem(
-                receipt_id=receipt.id,
-                product_name=product_name,
-                price=item_data.get('total_price', 0.0),
-                category=category,
-                quantity=item_data.get('quantity', 1)
-            )
-            print("Saving item:", item.product_name, item.price, item.category, item.quantity)
-            db.session.add(item)
-        db.session.commit() 
\ No newline at end of file
+        save_parsed_receipt(db, receipt, parsed_data)
+    # Saved even when parsing failed (the user can fill the receipt in); 'parsed' tells the two apart
+    pipeline_status.set_status(receipt_id, pipeline_status.SAVED, parsed=bool(parsed_data.get('success')),
+                               error=parsed_data.get('error'))
+
+    # The cleaned-up image is only needed for OCR
+    storage = get_storage()
+    preprocessed = load_stage_output(receipt_id, 'preprocess')
+    if preprocessed and preprocessed.get('preprocessed'):
+        storage.delete(_image_key(preprocessed))
+    # With KEEP_ORIGINAL_UPLOADS=false only the archive copy is kept once the receipt is parsed
+    job = load_stage_output(receipt_id, 'job')
+    if job and discard_original(storage, _image_key(job)):
+        print(f"Discarded original upload of receipt {receipt_id}")
+
+
+def _parsed_receipt_date(value):
+    """The receipt date from parser output (YYYY-MM-DD or MM/DD/YYYY), or None if missing or invalid"""
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y'):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def save_parsed_receipt(db, receipt, parsed_data):
+    """Update a receipt and replace its items from parser output"""
+    before = rollups.snapshot(receipt)
+    print("RAW/PARSED DATA DEBUG:")
+    print("Parsed data:", parsed_data)
+    items = parsed_data.get('data', {}).get('items', [])
+    receipt_data = parsed_data.get('data', {})
+    print("Items to save:", items)
+    # Update receipt fields from parsed data
+    store_name = receipt_data.get('store_name', 'Unknown Store')
+    print(f"Original store name length: {len(store_name)}")
+    print(f"Original store name: {store_name}")
+
+    # Truncate store name to fit database field (200 characters)
+    if store_name and len(store_name) > 200:
+        store_name = store_name[:197] + "..."
+        print(f"Truncated store name length: {len(store_name)}")
+        print(f"Truncated store name: {store_name}")
+
+    receipt.store_name = store_name
+    receipt.total_amount = receipt_data.get('total', 0.0)
+    # Until parsed, receipt_date is the upload date; keep it only when the receipt has no readable date
+    receipt_date = _parsed_receipt_date(receipt_data.get('date'))
+    if receipt_date is not None:
+        receipt.receipt_date = receipt_date
+    receipt.ocr_processed = True
+    receipt.parse_tier = parsed_data.get('parse_tier')
+    # Remove old items if any (committed together with the receipt fields and rollups below)
+    ReceiptItem.query.filter_by(receipt_id=receipt.id).delete()
+    new_items = []
+    for item_data in items:
+        # Truncate product name and category to fit database fields
+        product_name = item_data.get('name', '')
+        if product_name and len(product_name) > 200:
+            product_name = product_name[:197] + "..."
+
+        category = item_data.get('category', 'Other')
+        if category and len(category) > 100:
+            category = category[:97] + "..."
+
+        item = ReceiptItem(
+            receipt_id=receipt.id,
+            product_name=product_name,
+            price=item_data.get('total_price', 0.0),
+            category=category,
+            quantity=item_data.get('quantity', 1)
+        )
+        print("Saving item:", item.product_name, item.price, item.category, item.quantity)
+        db.session.add(item)
+        new_items.append(item)
+    rollups.apply_change(receipt.user_id, before, rollups.snapshot(receipt, new_items))
+    # A different photo of a receipt we already have: flag it for the user rather than dropping it.
+    # This replaces the upload's dHash flag; without a parsed date the comparison would be against
+    # the upload date, so that flag is left as it is.
+    if receipt_date is not None:
+        original = find_duplicate_receipt(receipt)
+        receipt.duplicate_of_id = original.id if original is not None else None
+        if original is not None:
+            print(f"Receipt {receipt.id} duplicates receipt {original.id} (same store, date and total)")
+    db.session.commit()
@@ -0,0 +1,152 @@
+import os
+import queue
+import shlex
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    tesserocr = None
+    TESSEROCR_AVAILABLE = False
+
+TESSERACT_POOL_SIZE = int(os.environ.get('TESSERACT_POOL_SIZE', '0'))  # 0 = one engine per CPU
+
+
+def parse_tesseract_config(config: str) -> Tuple[str, Optional[int], Optional[int], Dict[str, str]]:
+    """
+    Translate a pytesseract-style config string into tesserocr settings
+
+    Args:
+        config: e.g. "-l eng --psm 6 --oem 1 --dpi 300 -c preserve_interword_spaces=1"
+
+    Returns:
+        Tuple of (language, page segmentation mode, engine mode, Tesseract variables)
+    """
+    lang, psm, oem, variables = 'eng', None, None, {}
+    tokens = shlex.split(config or '')
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == '-l' and value:
+            lang = value
+        elif token == '--psm' and value:
+            psm = int(value)
+        elif token == '--oem' and value:
+            oem = int(value)
+        elif token == '--dpi' and value:
+            variables['user_defined_dpi'] = value
+        elif token == '-c' and value and '=' in value:
+            name, _, setting = value.partition('=')
+            variables[name] = setting
+        else:
+            logger.warning(f"Ignoring unsupported Tesseract option for the engine pool: {token}")
+            i += 1
+            continue
+        i += 2
+    return lang, psm, oem, variables
+
+
+class TesseractPool:
+    """A pool of warm Tesseract engines that OCR in-memory images (no subprocess, no temp files)"""
+
+    def __init__(self, config: str = '', size: int = TESSERACT_POOL_SIZE):
+        """
+        Initialize the pool; engines are created on first use
+
+        Args:
+            config: pytesseract-style config string applied to every engine
+            size: Maximum number of engines (0 = os.cpu_count())
+        """
+        if not TESSEROCR_AVAILABLE:
+            raise RuntimeError("tesserocr is not installed")
+        self.config = config
+        self.size = size or os.cpu_count() or 1
+        self.lang, self.psm, self.oem, self.variables = parse_tesseract_config(config)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _new_engine(self):
+        kwargs = {'lang': self.lang}
+        if self.psm is not None:
+            kwargs['psm'] = self.psm
+        if self.oem is not None:
+            kwargs['oem'] = self.oem
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in self.variables.items():
+            engine.SetVariable(name, value)
+        return engine
+
+    def _reset_after_fork(self):
+        # Engines are not shared with forked children; start a fresh pool in the child
+        if os.getpid() != self._pid:
+            self._idle = queue.LifoQueue()
+            self._created = 0
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def _acquire(self):
+        self._reset_after_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_engine()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, engine):
+        engine.Clear()
+        self._idle.put(engine)
+
+    def image_to_string(self, image: Image.Image) -> str:
+        """OCR a PIL image with the next free engine, blocking while all engines are busy"""
+        engine = self._acquire()
+        try:
+            engine.SetImage(image)
+            return engine.GetUTF8Text()
+        finally:
+            self._release(engine)
+
+    def close(self):
+        """End all idle engines"""
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            engine.End()
+            with self._lock:
+                self._created -= 1
+
+
+_pools: Dict[str, TesseractPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config: str = '') -> TesseractPool:
+    """Return the process-wide pool for a config, so every OCRService shares the same engines"""
+    with _pools_lock:
+        pool = _pools.get(config)
+        if pool is None:
+            pool = _pools[config] = TesseractPool(config)
+        return pool
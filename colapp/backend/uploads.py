@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _configured_max_file_size() -> int:
+    """file_processing.max_file_size from offline_config.json (10 MB if missing)"""
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_config.json')
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return int(json.load(f)['file_processing']['max_file_size'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 10 * 1024 * 1024
+
+
+# Largest accepted upload, and the chunk size it is streamed to storage in
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(_configured_max_file_size())))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(64 * 1024)))
+
+# Leading bytes of the file types we accept
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'%PDF', 'pdf'),
+]
+
+
+class UploadRejected(Exception):
+    """The uploaded file was refused; status_code is the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StoredUpload:
+    """A file written to the upload folder"""
+
+    def __init__(self, path: str, size: int, sha256: str, kind: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.kind = kind
+
+
+def format_size(size: int) -> str:
+    """Human-readable byte count, e.g. '10 MB'"""
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f"{size:g} {unit}"
+        size = round(size / 1024.0, 1)
+
+
+def sniff_file_type(header: bytes) -> Optional[str]:
+    """Identify an upload from its first bytes ('jpeg', 'png', ...), or None if unsupported"""
+    for signature, kind in _SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    return None
+
+
+def save_upload(file, path: str, max_size: int = MAX_UPLOAD_SIZE) -> StoredUpload:
+    """
+    Copy an uploaded file to disk in chunks, hashing and type-checking it on the way
+
+    The body is never held in memory in full. Oversized or non-image files are rejected as
+    soon as that is known, and no partial file is left behind.
+
+    Args:
+        file: werkzeug FileStorage from request.files
+        path: Destination path
+        max_size: Largest accepted file in bytes
+
+    Returns:
+        StoredUpload with the path, size, SHA-256 hex digest and sniffed type
+
+    Raises:
+        UploadRejected: File is empty, too large (413) or not a supported type (415)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    kind = None
+    partial_path = f"{path}.part"
+    try:
+        with open(partial_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if kind is None:
+                    kind = sniff_file_type(chunk[:16])
+                    if kind is None:
+                        raise UploadRejected('Unsupported file type', 415)
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(f'File too large (limit {format_size(max_size)})', 413)
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise UploadRejected('Empty file', 400)
+        os.replace(partial_path, path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    return StoredUpload(path, size, digest.hexdigest(), kind)
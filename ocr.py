@@ -12,9 +12,28 @@ import re
 import argparse
 from typing import Dict, List, Optional
 from dataclasses import dataclass, asdict
+import time
 import pytesseract
 from PIL import Image
 
+# The backend's preprocessing pipeline, shared when run from the repository checkout
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'colapp', 'backend')
+
+
+def _load_preprocessor():
+    """Return the backend's ImagePreprocessor, or None if it cannot be imported"""
+    try:
+        from image_preprocessing import ImagePreprocessor
+    except ImportError:
+        # Appended, not prepended: the backend's modules must not shadow the caller's
+        if BACKEND_DIR not in sys.path:
+            sys.path.append(BACKEND_DIR)
+        try:
+            from image_preprocessing import ImagePreprocessor
+        except ImportError:
+            return None
+    return ImagePreprocessor()
+
 # Configure Tesseract path for Windows
 if os.name == 'nt':
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
@@ -36,10 +55,81 @@ class ReceiptData:
     items: List[Product]
     raw_text: str
 
+# Lines containing any of these (upper-cased) are not products
+SKIP_KEYWORDS = ['TOTAL', 'TAX', 'SUBTOTAL', 'BALANCE', 'THANK', 'RECEIPT', 'DATE', 'TIME', 'CHANGE', 'CHECK', 'MEMBER',
+                 'PRNTD', 'NUMBER', 'SOLD', 'WHSE', 'TRM', 'TRN', 'OP', 'NET SALES', 'TAK', 'CASH TEND', 'EFT DEBIT',
+                 'ACCOUNT', 'REF', 'NETWORK', 'TERMINAL', 'ITEMS SOLD', 'TCR']
+
+# Product line handlers: turn a pattern's groups into (name, quantity, unit price, total price)
+
+def _price_item(groups, line, count):
+    """Name + price (patterns 1, 2, 5, 6, 12, 14)"""
+    price = float(groups[1])
+    return groups[0].strip(), 1, price, price
+
+def _barcode_only_item(groups, line, count):
+    """Name + barcode, no price (pattern 3); "E ... E" lines read the barcode as the price"""
+    if line.startswith('E ') and line.endswith(' E'):
+        return _price_item(groups, line, count)
+    return None
+
+def _no_price_item(groups, line, count):
+    """Name + short code, no price (pattern 4): skipped"""
+    return None
+
+def _whole_price_item(groups, line, count):
+    """Name + price that may lack cents (pattern 7); only prices with a decimal point are kept"""
+    return _price_item(groups, line, count) if '.' in groups[1] else None
+
+def _quantity_each_item(groups, line, count):
+    """Quantity @ unit price ea total, no name (pattern 8)"""
+    return f"Item {count + 1}", int(groups[0]), float(groups[1]), float(groups[2])
+
+def _barcode_item(groups, line, count):
+    """Name + barcode + price (pattern 9)"""
+    price = float(groups[2])
+    return groups[0].strip(), 1, price, price
+
+def _quantity_name_item(groups, line, count):
+    """Quantity + name + price, possibly with commas (patterns 10, 11)"""
+    quantity = int(groups[0])
+    try:
+        total_price = float(groups[2].replace(',', '').replace(' ', ''))
+    except ValueError:
+        return None
+    return groups[1].strip(), quantity, total_price / quantity if quantity > 0 else total_price, total_price
+
+def _weight_item(groups, line, count):
+    """Name + weight @ unit price + total, weight is not the quantity (pattern 13)"""
+    return groups[0].strip(), 1, float(groups[2]), float(groups[3])
+
+def _quantity_at_item(groups, line, count):
+    """Name + quantity @ (or for) unit price + total (patterns 15-17, 19); 'lb' in the line means a weight"""
+    if 'lb' in line:
+        return _weight_item(groups, line, count)
+    return groups[0].strip(), int(groups[1]), float(groups[2]), float(groups[3])
+
+def _times_item(groups, line, count):
+    """Name + unit price x quantity = total (pattern 18); 'lb' in the line means a weight"""
+    if 'lb' in line:
+        return _weight_item(groups, line, count)
+    return groups[0].strip(), int(groups[2]), float(groups[1]), float(groups[3])
+
+def _bracket_item(groups, line, count):
+    """Line starting with "]" (OCR error), quantity 1 (pattern 20); barcodes and short codes are skipped"""
+    if groups[1].isdigit() and not 6 < len(groups[1]) < 12:
+        return None
+    total_price = float(groups[1].replace(',', '').replace(' ', ''))
+    return groups[0].strip(), 1, total_price, total_price
+
 class SimpleReceiptOCR:
     """Simple OCR receipt processing - matches Flask app approach"""
     
-    def __init__(self):
+    def __init__(self, preprocess: bool = True):
+        # Clean up the photo before OCR (rotation, crop, downscale, binarize, deskew)
+        self.preprocessor = _load_preprocessor() if preprocess else None
+        self.last_timings: Dict[str, float] = {}
+
         # Known store names (same as in Flask app)
         self.known_stores = ['WALMART', 'TARGET', 'KROGER', 'SAFEWAY', 'COSTCO', 'ALDI', 'CVS', 'WALGREENS']
         
@@ -113,14 +203,38 @@ class SimpleReceiptOCR:
             re.compile(r'^\s*\]\s+([A-Za-z\s&()]+)\s+([\d,\s]+)$')
         ]
 
+        # Handler per pattern above: (groups, line, products so far) -> (name, quantity, unit price, total)
+        # or None to try the next pattern
+        self.product_handlers = [
+            _price_item, _price_item, _barcode_only_item, _no_price_item, _price_item,      # 1-5
+            _price_item, _whole_price_item, _quantity_each_item, _barcode_item,             # 6-9
+            _quantity_name_item, _quantity_name_item, _price_item, _weight_item,            # 10-13
+            _price_item, _quantity_at_item, _quantity_at_item, _quantity_at_item,           # 14-17
+            _times_item, _quantity_at_item, _bracket_item                                   # 18-20
+        ]
+
+        # All patterns as one alternation, led by the numbers-only lines to skip (e.g. "38 4.29").
+        # product_matchers[i] starts at pattern i; the named group that matched identifies the pattern.
+        self.product_matchers = [
+            re.compile('|'.join(([r'(?P<numbers_only>^\s*\d+\s+\d+\.\d{2}\s*$)'] if start == 0 else []) +
+                                [f'(?P<p{i}>{pattern.pattern})' for i, pattern in enumerate(self.regex_patterns)
+                                 if i >= start]))
+            for start in range(len(self.regex_patterns))
+        ]
+        self.skip_keywords = re.compile('|'.join(re.escape(keyword) for keyword in SKIP_KEYWORDS))
+
     def extract_text(self, image_path: str) -> str:
         """Extract text from image using OCR - simple approach like Flask app"""
         try:
-            # Load image directly without preprocessing
             image = Image.open(image_path)
+            self.last_timings = {}
+            if self.preprocessor is not None:
+                image, self.last_timings = self.preprocessor.process(image)
             
             # Extract text using Tesseract (same as Flask app)
+            start = time.perf_counter()
             text = pytesseract.image_to_string(image)
+            self.last_timings['tesseract'] = round((time.perf_counter() - start) * 1000, 1)
             
             return text.strip()
         except Exception as e:
@@ -181,178 +295,35 @@ class SimpleReceiptOCR:
                 continue
             
             # Skip lines that are likely not products
-            if any(skip in line.upper() for skip in ['TOTAL', 'TAX', 'SUBTOTAL', 'BALANCE', 'THANK', 'RECEIPT', 'DATE', 'TIME', 'CHANGE', 'CHECK', 'MEMBER', 'PRNTD', 'NUMBER', 'SOLD', 'WHSE', 'TRM', 'TRN', 'OP', 'NET SALES', 'TAK', 'CASH TEND', 'EFT DEBIT', 'ACCOUNT', 'REF', 'NETWORK', 'TERMINAL', 'ITEMS SOLD', 'TCR']):
+            if self.skip_keywords.search(line.upper()):
                 continue
             
-            # Skip lines that are just numbers (like "38 4.29")
-            if re.match(r'^\s*\d+\s+\d+\.\d{2}\s*$', line):
-                continue
-            
-            # Try each regex pattern
-            for pattern in self.regex_patterns:
-                match = pattern.match(line)
-                if match:
-                    groups = match.groups()
-
-                    
-                    # Pattern 1: Store product format (e.g., "E 673919 FF BS BREAST 23.99 E")
-                    if len(groups) == 2 and line.startswith('E ') and line.endswith(' E'):
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 2: Product with barcode and price (e.g., "404609 ECO HALF PAN 6.49 A")
-                    elif len(groups) == 2 and line[0].isdigit() and line.endswith(' A'):
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 3: Product name with barcode (e.g., "RUFFLES 002840020942 F")
-                    elif len(groups) == 2 and len(groups[1]) >= 12 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        # For barcode items without price, skip
-                        continue
-                        
-                    # Pattern 4: Product name with short code (e.g., "BAGELS 001", "GV SLIDERS")
-                    elif len(groups) == 2 and len(groups[1]) <= 6 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        # For items without price, skip
-                        continue
-                        
-                    # Pattern 5: Product name with price and suffix (e.g., "SEA SALT POT CHP $1.29 §")
-                    elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 6: Product name with price and letter suffix (e.g., "BRAIDED BRIOCHE $6.99 F")
-                    elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 7: Product name with price and colon (e.g., "CHEF PLATE MEAL $10 :")
-                    elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 8: Quantity @ Unit Price ea Total (e.g., "2 @ $10.00 ea $20.00 F")
-                    elif len(groups) == 3 and groups[0].isdigit() and '@' in line and 'ea' in line:
-                        quantity = int(groups[0])
-                        unit_price = float(groups[1])
-                        total_price = float(groups[2])
-                        product_name = f"Item {len(products) + 1}"  # Generic name
-                        
-                    # Pattern 9: Product with barcode and price (e.g., "Su HRO FGHTR 06305094073 6.94 T")
-                    elif len(groups) == 3 and len(groups[1]) >= 11 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[2])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 10/11/11b/11c: Quantity + Product Name + Price (e.g., "2 MILK 3.98", "1 Woman 0", "2 Ham Cheese 74, 000")
-                    elif len(groups) == 3 and groups[0].isdigit():
-                        quantity = int(groups[0])
-                        product_name = groups[1].strip()
-                        try:
-                            total_price = float(groups[2].replace(',', '').replace(' ', ''))
-                        except ValueError:
-                            continue
-                        unit_price = total_price / quantity if quantity > 0 else total_price
-                        
-                    # Pattern 12: Product Name + Price
-                    elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 13: Product Name + Weight + @ + Unit Price + Total
-                    elif len(groups) == 4 and 'lb' in line:
-                        product_name = groups[0].strip()
-                        weight = float(groups[1])
-                        unit_price = float(groups[2])
-                        total_price = float(groups[3])
-                        quantity = 1  # Treat weight as quantity for pricing
-                        
-                    # Pattern 14: Product Name + Price (fallback)
-                    elif len(groups) == 2 and '.' in groups[1] and groups[1].replace('.', '').isdigit():
-                        product_name = groups[0].strip()
-                        price = float(groups[1])
-                        quantity = 1
-                        unit_price = price
-                        total_price = price
-                        
-                    # Pattern 15: Product Name + Quantity @ Unit Price + Total
-                    elif len(groups) == 4 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        quantity = int(groups[1])
-                        unit_price = float(groups[2])
-                        total_price = float(groups[3])
-                        
-                    # Pattern 16: Product Name + Quantity @ Unit Price + Char + Total
-                    elif len(groups) == 4 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        quantity = int(groups[1])
-                        unit_price = float(groups[2])
-                        total_price = float(groups[3])
-                        
-                    # Pattern 17: Product Name + Quantity @ Unit Price + ... + Total (flexible)
-                    elif len(groups) == 4 and groups[1].isdigit():
-                        product_name = groups[0].strip()
-                        quantity = int(groups[1])
-                        unit_price = float(groups[2])
-                        total_price = float(groups[3])
-                        
-                    # Pattern 18: Product Name + Unit Price x Quantity = Total
-                    elif len(groups) == 4 and 'x' in line and '=' in line:
-                        product_name = groups[0].strip()
-                        unit_price = float(groups[1])
-                        quantity = int(groups[2])
-                        total_price = float(groups[3])
-                        
-                    # Pattern 19: Product Name + Quantity for Unit Price Total
-                    elif len(groups) == 4 and 'for' in line:
-                        product_name = groups[0].strip()
-                        quantity = int(groups[1])
-                        unit_price = float(groups[2])
-                        total_price = float(groups[3])
-                        
-                    # Pattern 20: Handle lines starting with "]" (OCR error) - treat as quantity 1
-                    elif len(groups) == 2 and line.strip().startswith(']'):
-                        quantity = 1
-                        product_name = groups[0].strip()
-                        # Remove commas and spaces from price
-                        price_str = groups[1].replace(',', '').replace(' ', '')
-                        total_price = float(price_str)
-                        unit_price = total_price
-                        
-                    else:
-                        continue
-                    
-                    # Validate product name
-                    if product_name.lower() not in ['total', 'tax', 'subtotal', 'amount'] and len(product_name.strip()) > 0:
-                        products.append(Product(
-                            name=product_name,
-                            quantity=quantity,
-                            unit_price=round(unit_price, 2),
-                            total_price=round(total_price, 2),
-                            category='Other'
-                        ))
+            # One pass finds the first pattern that matches (or a numbers-only line to skip);
+            # if its handler rejects the match, carry on from the next pattern
+            start = 0
+            while start < len(self.product_matchers):
+                match = self.product_matchers[start].match(line)
+                if not match or match.lastgroup == 'numbers_only':
                     break
+                index = int(match.lastgroup[1:])
+                group_index = match.re.groupindex[match.lastgroup]
+                groups = match.groups()[group_index:group_index + self.regex_patterns[index].groups]
+                fields = self.product_handlers[index](groups, line, len(products))
+                if fields is None:
+                    start = index + 1
+                    continue
+                
+                # Validate product name
+                product_name, quantity, unit_price, total_price = fields
+                if product_name.lower() not in ['total', 'tax', 'subtotal', 'amount'] and len(product_name.strip()) > 0:
+                    products.append(Product(
+                        name=product_name,
+                        quantity=quantity,
+                        unit_price=round(unit_price, 2),
+                        total_price=round(total_price, 2),
+                        category='Other'
+                    ))
+                break
 
         return products
 
@@ -399,6 +370,8 @@ def main():
     parser.add_argument('--output', '-o', help='Output JSON file path')
     parser.add_argument('--include-raw-text', action='store_true', help='Include raw OCR text in output')
     parser.add_argument('--pretty', action='store_true', help='Pretty print JSON output')
+    parser.add_argument('--no-preprocess', action='store_true', help='Run Tesseract on the raw image')
+    parser.add_argument('--timings', action='store_true', help='Print per-stage timings')
     
     args = parser.parse_args()
     
@@ -409,11 +382,13 @@ def main():
     
     try:
         # Initialize OCR processor
-        ocr = SimpleReceiptOCR()
+        ocr = SimpleReceiptOCR(preprocess=not args.no_preprocess)
         
         # Process receipt
         print(f"Processing receipt: {args.image_path}")
         receipt_data = ocr.process_receipt(args.image_path)
+        if args.timings:
+            print("Timings (ms): " + ", ".join(f"{stage}={ms}" for stage, ms in ocr.last_timings.items()))
         
         # Convert to JSON
         json_output = ocr.to_json(receipt_data, include_raw_text=args.include_raw_text)